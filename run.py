@@ -4,7 +4,10 @@ import runpy
 import subprocess
 import sys
 
-if sys.prefix == sys.base_prefix:
-    sys.exit(subprocess.call(["uv", "run", __file__, *sys.argv[1:]]))
+# Guarded so spawned worker processes, which re-import this file as
+# __mp_main__, don't start a second pipeline run.
+if __name__ == "__main__":
+    if sys.prefix == sys.base_prefix:
+        sys.exit(subprocess.call(["uv", "run", __file__, *sys.argv[1:]]))
 
-runpy.run_module("hdx.scraper.cod_ab_global.portolan", run_name="__main__")
+    runpy.run_module("hdx.scraper.cod_ab_global.portolan", run_name="__main__")
@@ -38,6 +38,10 @@ date_valid_on_overrides = {
     "UKR": "2025-09-01",
 }
 
+# Grid size in degrees that original geometries are snapped to, per ISO3;
+# takes precedence over PORTOLAN_PRECISION_GRID (0 keeps full precision).
+precision_grid_overrides = {}
+
 where_filter = {
     "LBN": "adm1_pcode <> 'Conflict'",
     "PAK": "adm1_pcode not in ('PK1', 'PK3')",
@@ -13,59 +13,108 @@ import functools
 import logging
 import os
 from pathlib import Path
+from subprocess import CalledProcessError
 from tempfile import mkdtemp
 from typing import Any
 
 os.environ.setdefault("OGR_GEOJSON_MAX_OBJ_SIZE", "0")
 
 import geoparquet_io.core.arcgis as _gpio_arcgis
+import geoparquet_io.core.http_retry as _gpio_http_retry
+
+from .client import get_client, log_http_stats
+from .config import ARCGIS_EXTRACT_TIMEOUT
+from .limiter import payload_timeout
 
 _orig_request = _gpio_arcgis.make_request_with_retry
 
 
 @functools.wraps(_orig_request)
-def _patched_request(*args: Any, timeout: float = 300.0, **kwargs: Any) -> Any:  # noqa: ANN401
+def _patched_request(*args: Any, timeout: float | None = None, **kwargs: Any) -> Any:  # noqa: ANN401
+    # Size each page's timeout from its batch size rather than one global value
+    if timeout is None:
+        timeout = payload_timeout(kwargs.get("batch_size"))
     return _orig_request(*args, timeout=timeout, **kwargs)
 
 
 _gpio_arcgis.make_request_with_retry = _patched_request
 
+
+def _shared_client(timeout: float = ARCGIS_EXTRACT_TIMEOUT, **_: Any) -> Any:  # noqa: ANN401
+    return get_client(timeout)
+
+
+def _keep_client() -> None:
+    # gpio resets its client on protocol errors, which would tear down
+    # connections other threads are using; httpx already evicts broken ones.
+    return
+
+
+# Route geoparquet_io's feature paging through the shared pooled client
+_gpio_http_retry.get_shared_http_client = _shared_client
+_gpio_http_retry.reset_http_client = _keep_client
+
+from . import catalog_index  # noqa: E402
+from .compaction import CompactionError, Compactor  # noqa: E402
 from .config import (  # noqa: E402
     HDX_EXPORT_OUTPUT_DIR,
     HDX_EXPORT_PUSH,
     PORTOLAN_WORK_DIR,
-    PORTOLAN_WORKERS,
     SOURCECOOP_REMOTE,
 )
 from .extended import run as extended_run  # noqa: E402
+from .frozen import freeze_expired  # noqa: E402
 from .global_ import run as global_run  # noqa: E402
 from .hdx_export import run as hdx_export_run  # noqa: E402
 from .matched import run as matched_run  # noqa: E402
-from .original import _ensure_root_catalog, _portolan, _push_catalog_files  # noqa: E402
+from .original import _ensure_root_catalog  # noqa: E402
 from .original import run as original_run  # noqa: E402
+from .portolan_api import log_portolan_stats, portolan  # noqa: E402
+from .push_manifest import push  # noqa: E402
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s %(levelname)s %(message)s",
     datefmt="%Y-%m-%d %H:%M:%S",
 )
+logger = logging.getLogger(__name__)
 
 work_dir = (
-    Path(PORTOLAN_WORK_DIR)
+    Path(PORTOLAN_WORK_DIR).resolve()
     if PORTOLAN_WORK_DIR
     else Path(mkdtemp(prefix="portolan-cod-ab-"))
 )
 _ensure_root_catalog(work_dir)
+catalog_index.attach(work_dir)
 original_run(work_dir)
+# Recompress fast-tier parquets to zstd-22 while the later stages run
+compactor = Compactor(work_dir)
+compactor.start()
 extended_run(work_dir)
 matched_run(work_dir)
 global_run(work_dir)
-
-# Single consolidated push after all stages complete — users never see partial state
-workers = str(PORTOLAN_WORKERS)
-_portolan(["push", SOURCECOOP_REMOTE, "--workers", workers, "--verbose"], cwd=work_dir)
-_push_catalog_files(work_dir, SOURCECOOP_REMOTE)
-_portolan(["check", "--verbose"], cwd=work_dir)
+freeze_expired(work_dir)
+log_http_stats()
+
+# Push should only see archival-tier files, but leftovers are valid parquet
+# and must not hold back the run. Recompression changed file bytes after
+# portolan add, so refresh the metadata portolan recorded.
+try:
+    compacted = compactor.finish()
+except CompactionError:
+    logger.exception("Compaction incomplete — pushing fast-tier files as they are")
+    compacted = compactor.compacted
+if compacted:
+    try:
+        portolan(["check", "--metadata", "--fix"], cwd=work_dir)
+    except CalledProcessError:
+        logger.warning("portolan check --metadata --fix returned errors (continuing)")
+
+# Single consolidated push after all stages complete — users never see partial
+# state; only files changed since the last push are uploaded.
+push(work_dir, SOURCECOOP_REMOTE)
+portolan(["check", "--verbose"], cwd=work_dir)
+log_portolan_stats()
 
 # HDX export: always builds fresh GDBs/pcodes/metadata from the catalog
 # (cheap to skip via hdx_export's own fingerprint check when nothing changed);
@@ -0,0 +1,278 @@
+"""Process-wide ArcGIS token manager, attached to every pooled HTTP client.
+
+`generateToken` is called at most once per token lifetime: the token and its
+expiry are kept in memory and in a small on-disk cache (ARCGIS_TOKEN_CACHE,
+by default `.arcgis_token.json` beside the work dir — outside the catalog
+tree, like `.bnda`), so runs that start close together skip the auth round
+trip. A daemon timer renews the token ARCGIS_TOKEN_REFRESH_MARGIN seconds
+before it lapses, so long runs never send an expired one.
+
+`TokenAuth` is the httpx auth hook `client.py` installs on every client. It
+stamps the current token onto each request to the ArcGIS host — overriding
+whatever token the caller passed, so the `token` arguments threaded through
+the pipeline can never go stale — and on an invalid-token answer (498/499)
+renews the token and sends the request once more. ArcGIS also reports an
+invalid token as a small JSON error body with status 200, so the hook reads
+the body of small JSON or text responses before returning them; any other
+response (PBF pages, replica archives) is handed back unread, and streams.
+A 498/499 is always read, which closes it, so it gives its limiter slot
+back before `generateToken` needs one.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import AsyncGenerator, Generator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import httpx
+
+from .config import (
+    ARCGIS_EXPIRATION,
+    ARCGIS_PASSWORD,
+    ARCGIS_SERVER,
+    ARCGIS_TOKEN_CACHE,
+    ARCGIS_TOKEN_REFRESH_MARGIN,
+    ARCGIS_TOKEN_URL,
+    ARCGIS_USERNAME,
+    PORTOLAN_WORK_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+_INVALID_TOKEN_CODES = frozenset({498, 499})
+# ArcGIS error bodies are tiny; larger responses are never parsed for errors.
+_ERROR_SNIFF_BYTES = 2048
+_RETRY_DELAY = 60.0
+
+
+@dataclass(frozen=True)
+class _Token:
+    value: str
+    expires: float  # epoch seconds
+    username: str
+    server: str
+
+
+def _cache_path() -> Path | None:
+    if ARCGIS_TOKEN_CACHE:
+        return Path(ARCGIS_TOKEN_CACHE)
+    if PORTOLAN_WORK_DIR:
+        return Path(PORTOLAN_WORK_DIR).parent / ".arcgis_token.json"
+    return None
+
+
+class _TokenManager:
+    """Thread-safe holder of the current ArcGIS token."""
+
+    def __init__(self, cache_path: Path | None) -> None:
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._token: _Token | None = None
+        self._timer: threading.Timer | None = None
+
+    def get(self) -> str:
+        """Return a token valid for at least the refresh margin."""
+        with self._lock:
+            if self._token is None or not self._fresh(self._token):
+                self._token = self._load() or self._generate()
+                self._schedule()
+            return self._token.value
+
+    def renew(self, stale: str) -> str:
+        """Replace `stale` after the server rejected it; return the current token.
+
+        Concurrent callers rejected with the same token share one renewal.
+        """
+        with self._lock:
+            if self._token is None or self._token.value == stale:
+                self._token = self._generate()
+                self._schedule()
+            return self._token.value
+
+    @staticmethod
+    def _fresh(token: _Token) -> bool:
+        return token.expires - ARCGIS_TOKEN_REFRESH_MARGIN > time.time()
+
+    def _load(self) -> _Token | None:
+        if self._cache_path is None or not self._cache_path.exists():
+            return None
+        try:
+            token = _Token(**json.loads(self._cache_path.read_text()))
+        except (json.JSONDecodeError, OSError, TypeError):
+            return None
+        if token.username != ARCGIS_USERNAME or token.server != ARCGIS_SERVER:
+            return None
+        return token if self._fresh(token) else None
+
+    def _generate(self) -> _Token:
+        from .client import get_client  # noqa: PLC0415
+
+        r = get_client().post(
+            ARCGIS_TOKEN_URL,
+            data={
+                "username": ARCGIS_USERNAME,
+                "password": ARCGIS_PASSWORD,
+                "referer": f"{ARCGIS_SERVER}/portal",
+                "expiration": str(ARCGIS_EXPIRATION),
+                "f": "json",
+            },
+            auth=None,
+        )
+        r.raise_for_status()
+        data = r.json()
+        if "token" not in data:
+            msg = f"generateToken failed: {data.get('error', data)}"
+            raise RuntimeError(msg)
+        expires = data.get("expires")
+        token = _Token(
+            value=data["token"],
+            expires=(
+                expires / 1000 if expires else time.time() + 60 * ARCGIS_EXPIRATION
+            ),
+            username=ARCGIS_USERNAME,
+            server=ARCGIS_SERVER,
+        )
+        self._store(token)
+        logger.info("Generated ArcGIS token valid for %.0f min", _minutes_left(token))
+        return token
+
+    def _store(self, token: _Token) -> None:
+        if self._cache_path is None:
+            return
+        try:
+            fd = os.open(self._cache_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(asdict(token), f)
+        except OSError:
+            logger.warning("Could not write token cache %s", self._cache_path)
+
+    def _schedule(self, delay: float | None = None) -> None:
+        """(Re)arm the background refresh; caller holds the lock."""
+        if self._timer is not None:
+            self._timer.cancel()
+        if delay is None and self._token is not None:
+            delay = self._token.expires - ARCGIS_TOKEN_REFRESH_MARGIN - time.time()
+        self._timer = threading.Timer(max(delay or 0.0, 1.0), self._refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh(self) -> None:
+        # Generate outside the lock so `get` callers are not held for the call
+        try:
+            token = self._generate()
+        except (httpx.HTTPError, RuntimeError):
+            logger.warning("Background token refresh failed — retrying")
+            with self._lock:
+                self._schedule(_RETRY_DELAY)
+            return
+        with self._lock:
+            if self._token is None or token.expires > self._token.expires:
+                self._token = token
+            self._schedule()
+
+
+def _minutes_left(token: _Token) -> float:
+    return (token.expires - time.time()) / 60
+
+
+_manager = _TokenManager(_cache_path())
+
+
+def get_token() -> str:
+    """Return the shared ArcGIS token, generating or loading it if needed."""
+    return _manager.get()
+
+
+def _is_arcgis(request: httpx.Request) -> bool:
+    return request.url.host == httpx.URL(ARCGIS_SERVER).host
+
+
+def _should_read(request: httpx.Request, response: httpx.Response) -> bool:
+    """Return True if the hook reads response before handing it on.
+
+    Small JSON or text bodies may carry an error. An ArcGIS 498/499 is read
+    whatever its size: httpx reads it anyway once the retry is sent, and
+    reading it first closes it, giving its limiter slot back before the
+    renewal needs one for `generateToken`.
+    """
+    if _is_arcgis(request) and response.status_code in _INVALID_TOKEN_CODES:
+        return True
+    return _may_carry_error(response)
+
+
+def _may_carry_error(response: httpx.Response) -> bool:
+    """Return True if response could be an ArcGIS JSON error worth reading."""
+    content_type = response.headers.get("content-type", "")
+    if "json" not in content_type and not content_type.startswith("text/"):
+        return False
+    length = response.headers.get("content-length")
+    return length is None or int(length) <= _ERROR_SNIFF_BYTES
+
+
+def _is_invalid_token(response: httpx.Response) -> bool:
+    """Return True for a 498/499 status or error body; reads only small ones."""
+    if response.status_code in _INVALID_TOKEN_CODES:
+        return True
+    if not _may_carry_error(response):
+        return False
+    content = response.content
+    if len(content) > _ERROR_SNIFF_BYTES or b'"error"' not in content:
+        return False
+    try:
+        error = json.loads(content).get("error")
+    except (json.JSONDecodeError, AttributeError):
+        return False
+    return isinstance(error, dict) and error.get("code") in _INVALID_TOKEN_CODES
+
+
+class TokenAuth(httpx.Auth):
+    """Stamp the shared token on ArcGIS requests; renew and retry once if rejected."""
+
+    def sync_auth_flow(
+        self, request: httpx.Request
+    ) -> Generator[httpx.Request, httpx.Response]:
+        """Drive `auth_flow`, reading only response bodies it may inspect."""
+        flow = self.auth_flow(request)
+        request = next(flow)
+        while True:
+            response = yield request
+            if _should_read(request, response):
+                response.read()
+            try:
+                request = flow.send(response)
+            except StopIteration:
+                break
+
+    async def async_auth_flow(
+        self, request: httpx.Request
+    ) -> AsyncGenerator[httpx.Request, httpx.Response]:
+        """Async counterpart of `sync_auth_flow`."""
+        flow = self.auth_flow(request)
+        request = next(flow)
+        while True:
+            response = yield request
+            if _should_read(request, response):
+                await response.aread()
+            try:
+                request = flow.send(response)
+            except StopIteration:
+                break
+
+    def auth_flow(
+        self, request: httpx.Request
+    ) -> Generator[httpx.Request, httpx.Response]:
+        """Yield the stamped request, then at most one retry after a 498/499."""
+        if not _is_arcgis(request):
+            yield request
+            return
+        token = _manager.get()
+        request.url = request.url.copy_set_param("token", token)
+        response = yield request
+        if _is_invalid_token(response):
+            logger.info("ArcGIS rejected the token — renewing and retrying once")
+            request.url = request.url.copy_set_param("token", _manager.renew(token))
+            yield request
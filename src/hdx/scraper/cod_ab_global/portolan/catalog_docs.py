@@ -0,0 +1,95 @@
+"""In-process unit of work for the catalog's catalog.json and collection.json.
+
+Every stage reads and enriches the same STAC documents — service
+catalog.json markers, layer collection.json props and variant assets — many
+times per run. `load` parses each document once and hands out the same
+mutable dict to every caller; edits are made in place and reach disk only
+on `flush`, and only for documents whose content actually changed, so an
+unchanged file keeps its mtime and is not re-uploaded by push.
+
+Change detection compares compact `json.dumps` snapshots (the C encoder,
+far cheaper than the indented pure-Python one used for the files
+themselves). Cached documents are revalidated against their file's mtime
+and size on every `load`, so files portolan rewrites are picked up again.
+
+portolan and push read these files from disk: `flush` runs before every
+portolan command (see `portolan_api.portolan`), before push and at the end
+of each stage. Every document parsed or written is also reported to
+`catalog_index`.
+"""
+
+import json
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+from . import catalog_index
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Document:
+    data: dict
+    signature: tuple[int, int]
+    snapshot: str
+
+
+_documents: dict[Path, _Document] = {}
+
+
+def _signature(path: Path) -> tuple[int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _snapshot(data: dict) -> str:
+    return json.dumps(data, separators=(",", ":"))
+
+
+def load(path: Path) -> dict | None:
+    """Return the shared, mutable content of a JSON document, or None if absent.
+
+    Raises json.JSONDecodeError for a document that is not valid JSON.
+    """
+    signature = _signature(path)
+    if signature is None:
+        return None
+    doc = _documents.get(path)
+    if doc is not None and doc.signature != signature:
+        if _snapshot(doc.data) == doc.snapshot:
+            doc = None  # rewritten on disk since it was loaded
+        else:
+            logger.warning("%s changed on disk with edits pending here", path)
+    if doc is None:
+        data = json.loads(path.read_text())
+        doc = _Document(data, signature, _snapshot(data))
+        _documents[path] = doc
+        catalog_index.note_document(path, data)
+    return doc.data
+
+
+def flush() -> int:
+    """Write every changed document back to disk; return how many were written.
+
+    Documents whose file or directory was removed meanwhile are dropped.
+    """
+    written = 0
+    for path, doc in list(_documents.items()):
+        if not path.exists():
+            del _documents[path]
+            continue
+        snapshot = _snapshot(doc.data)
+        if snapshot == doc.snapshot:
+            continue
+        path.write_text(json.dumps(doc.data, indent=2))
+        doc.snapshot = snapshot
+        doc.signature = _signature(path) or doc.signature
+        catalog_index.note_document(path, doc.data)
+        written += 1
+    if written:
+        logger.debug("Flushed %d catalog documents", written)
+    return written
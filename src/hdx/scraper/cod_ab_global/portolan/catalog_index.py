@@ -0,0 +1,341 @@
+"""Persistent SQLite index of the catalog tree.
+
+Stages used to rediscover the catalog by walking {iso3}/{version}/{layer}/
+and stat-ing or parsing files per service, several times per run. The
+index holds, per service, its cod_ab:* catalog.json fields; per layer, its
+collection.json `updated` and cod_ab:* props; and per parquet (original,
+extended, matched), its row count, schema and bbox from the footer.
+Enumeration and fingerprinting query it instead of the filesystem.
+
+`attach` reconciles the index with the tree once per run: a stat-only walk
+that reparses only documents and footers whose mtime or size changed, and
+drops rows for anything removed. After that, stages keep it current as they
+write — `refresh` after a parquet is written, linked or removed, and
+`catalog_docs` reports every document it parses or writes. Documents
+portolan rewrites behind its back are caught by `service_props`, which
+checks catalog.json's signature on every read.
+
+The index lives in `.index/` beside the work dir, outside the catalog tree
+like `.bnda`, so push never sees it; deleting it only costs one full
+reconcile. The global wld/ tree is not indexed.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA_VERSION = 1
+_SCHEMA = """
+CREATE TABLE services (
+    iso3 TEXT, version TEXT, sig TEXT, props TEXT,
+    PRIMARY KEY (iso3, version)
+);
+CREATE TABLE layers (
+    iso3 TEXT, version TEXT, layer TEXT, sig TEXT, updated TEXT, props TEXT,
+    PRIMARY KEY (iso3, version, layer)
+);
+CREATE TABLE files (
+    iso3 TEXT, version TEXT, layer TEXT, name TEXT, sig TEXT,
+    num_rows INTEGER, bbox TEXT, schema TEXT,
+    PRIMARY KEY (iso3, version, layer, name)
+);
+"""
+_GLOBAL_DIR = "wld"
+# Path depths below the work dir: {iso3}/{version}/{layer}/{file}
+_SERVICE_DEPTH = 2
+_LAYER_DEPTH = 3
+_FILE_DEPTH = 4
+
+_lock = threading.RLock()
+_work_dir: Path | None = None
+_con: sqlite3.Connection | None = None
+
+
+def _index_path(work_dir: Path) -> Path:
+    index_dir = work_dir.parent / ".index"
+    index_dir.mkdir(exist_ok=True)
+    return index_dir / "catalog.sqlite"
+
+
+def _connect(work_dir: Path) -> sqlite3.Connection:
+    con = sqlite3.connect(
+        _index_path(work_dir), isolation_level=None, check_same_thread=False
+    )
+    con.execute("PRAGMA journal_mode = WAL")
+    if con.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+        for table in ("services", "layers", "files"):
+            con.execute(f"DROP TABLE IF EXISTS {table}")
+        con.executescript(_SCHEMA)
+        con.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+    return con
+
+
+def _signature(path: Path) -> str | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return f"{st.st_mtime_ns}:{st.st_size}"
+
+
+def _props(data: dict) -> str:
+    return json.dumps({k: v for k, v in data.items() if k.startswith("cod_ab:")})
+
+
+def _read_json(path: Path) -> dict:
+    try:
+        return json.loads(path.read_text())
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+
+def _footer(path: Path) -> tuple[int | None, str | None, str | None]:
+    """Return (num_rows, bbox JSON, schema JSON) from a parquet footer."""
+    try:
+        meta = pq.read_metadata(path)
+    except (OSError, ValueError):
+        logger.debug("Unreadable parquet footer %s", path)
+        return None, None, None
+    schema = meta.schema.to_arrow_schema()
+    bbox = None
+    geo = (schema.metadata or {}).get(b"geo")
+    if geo:
+        with_geo = json.loads(geo)
+        column = with_geo.get("columns", {}).get(with_geo.get("primary_column"), {})
+        bbox = column.get("bbox")
+    columns = [[field.name, str(field.type)] for field in schema]
+    return meta.num_rows, json.dumps(bbox), json.dumps(columns)
+
+
+def _key(path: Path) -> tuple[str, ...] | None:
+    """Return the index key of a catalog path, or None if it is not indexed."""
+    if _con is None or _work_dir is None:
+        return None
+    try:
+        parts = path.relative_to(_work_dir).parts
+    except ValueError:
+        return None
+    if not parts or parts[0] == _GLOBAL_DIR or any(p.startswith(".") for p in parts):
+        return None
+    return parts
+
+
+def _put_service(
+    con: sqlite3.Connection, key: tuple[str, ...], sig: str | None, data: dict | None
+) -> None:
+    con.execute(
+        "INSERT OR REPLACE INTO services VALUES (?, ?, ?, ?)",
+        (*key, sig, _props(data) if data is not None else None),
+    )
+
+
+def _put_layer(
+    con: sqlite3.Connection, key: tuple[str, ...], sig: str | None, data: dict
+) -> None:
+    con.execute("INSERT OR IGNORE INTO services VALUES (?, ?, NULL, NULL)", key[:2])
+    con.execute(
+        "INSERT OR REPLACE INTO layers VALUES (?, ?, ?, ?, ?, ?)",
+        (*key, sig, data.get("updated"), _props(data)),
+    )
+
+
+def _put_file(
+    con: sqlite3.Connection, key: tuple[str, ...], path: Path, sig: str
+) -> None:
+    con.execute("INSERT OR IGNORE INTO services VALUES (?, ?, NULL, NULL)", key[:2])
+    con.execute(
+        "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (*key, sig, *_footer(path)),
+    )
+
+
+def _forget(con: sqlite3.Connection, parts: tuple[str, ...]) -> None:
+    """Drop every row at or below a service, layer or file key."""
+    if len(parts) == _SERVICE_DEPTH:
+        for table in ("services", "layers", "files"):
+            con.execute(f"DELETE FROM {table} WHERE iso3 = ? AND version = ?", parts)
+    elif len(parts) == _LAYER_DEPTH:
+        for table in ("layers", "files"):
+            con.execute(
+                f"DELETE FROM {table} WHERE iso3 = ? AND version = ? AND layer = ?",
+                parts,
+            )
+    elif len(parts) == _FILE_DEPTH:
+        con.execute(
+            "DELETE FROM files"
+            " WHERE iso3 = ? AND version = ? AND layer = ? AND name = ?",
+            parts,
+        )
+
+
+def _scan_layer(
+    con: sqlite3.Connection,
+    layer_dir: Path,
+    key: tuple[str, ...],
+    stored_layers: dict[tuple, str | None],
+    stored_files: dict[tuple, str | None],
+) -> tuple[list[tuple], int]:
+    """Reconcile one layer dir; return (file keys seen, entries reparsed)."""
+    reparsed = 0
+    collection = layer_dir / "collection.json"
+    sig = _signature(collection)
+    if key not in stored_layers or stored_layers[key] != sig:
+        _put_layer(con, key, sig, _read_json(collection) if sig else {})
+        reparsed += 1
+    seen = []
+    with os.scandir(layer_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.name.endswith(".parquet"):
+                continue
+            file_key = (*key, entry.name)
+            seen.append(file_key)
+            st = entry.stat()
+            file_sig = f"{st.st_mtime_ns}:{st.st_size}"
+            if stored_files.get(file_key) != file_sig:
+                _put_file(con, file_key, Path(entry.path), file_sig)
+                reparsed += 1
+    return seen, reparsed
+
+
+def _subdirs(path: Path) -> list[Path]:
+    with os.scandir(path) as entries:
+        return sorted(
+            Path(e.path) for e in entries if e.is_dir() and not e.name.startswith(".")
+        )
+
+
+def _stored_sigs(con: sqlite3.Connection, table: str, key: str) -> dict[tuple, str]:
+    rows = con.execute(f"SELECT {key}, sig FROM {table}")
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+
+def _reconcile(con: sqlite3.Connection, work_dir: Path) -> None:
+    stored_services = _stored_sigs(con, "services", "iso3, version")
+    stored_layers = _stored_sigs(con, "layers", "iso3, version, layer")
+    stored_files = _stored_sigs(con, "files", "iso3, version, layer, name")
+    seen_services, seen_layers, seen_files = set(), set(), set()
+    reparsed = 0
+    con.execute("BEGIN")
+    for country_dir in _subdirs(work_dir):
+        if country_dir.name == _GLOBAL_DIR:
+            continue
+        for version_dir in _subdirs(country_dir):
+            key = (country_dir.name, version_dir.name)
+            seen_services.add(key)
+            catalog = version_dir / "catalog.json"
+            sig = _signature(catalog)
+            if key not in stored_services or stored_services[key] != sig:
+                _put_service(con, key, sig, _read_json(catalog) if sig else None)
+                reparsed += 1
+            for layer_dir in _subdirs(version_dir):
+                layer_key = (*key, layer_dir.name)
+                seen_layers.add(layer_key)
+                files, n = _scan_layer(
+                    con, layer_dir, layer_key, stored_layers, stored_files
+                )
+                seen_files.update(files)
+                reparsed += n
+    for stale in (stored_files.keys() - seen_files) | (
+        stored_layers.keys() - seen_layers
+    ):
+        _forget(con, stale)
+    for stale in stored_services.keys() - seen_services:
+        _forget(con, stale)
+    con.execute("COMMIT")
+    logger.info(
+        "Catalog index: %d services, %d entries reparsed", len(seen_services), reparsed
+    )
+
+
+def attach(work_dir: Path) -> sqlite3.Connection:
+    """Open the index for work_dir and reconcile it with the tree on disk."""
+    global _work_dir, _con
+    with _lock:
+        if _con is not None:
+            _con.close()
+        con = _connect(work_dir)
+        _reconcile(con, work_dir)
+        _work_dir, _con = work_dir, con
+        return con
+
+
+def _attached(work_dir: Path) -> sqlite3.Connection:
+    if _con is None or _work_dir != work_dir:
+        return attach(work_dir)
+    return _con
+
+
+def refresh(path: Path) -> None:
+    """Re-index a parquet, layer or service path after it changed or was removed."""
+    with _lock:
+        parts = _key(path)
+        if parts is None or _con is None:
+            return
+        sig = _signature(path)
+        if sig is None:
+            _forget(_con, parts)
+        elif len(parts) == _FILE_DEPTH and path.suffix == ".parquet":
+            _put_file(_con, parts, path, sig)
+
+
+def note_document(path: Path, data: dict) -> None:
+    """Record the content of a catalog.json or collection.json just read or written."""
+    with _lock:
+        parts = _key(path)
+        if parts is None or _con is None:
+            return
+        if len(parts) == _LAYER_DEPTH and path.name == "catalog.json":
+            _put_service(_con, parts[:_SERVICE_DEPTH], _signature(path), data)
+        elif len(parts) == _FILE_DEPTH and path.name == "collection.json":
+            _put_layer(_con, parts[:_LAYER_DEPTH], _signature(path), data)
+
+
+def services(work_dir: Path) -> list[tuple[str, str]]:
+    """Return sorted [(iso3, version), ...] for every service dir in work_dir."""
+    with _lock:
+        rows = _attached(work_dir).execute(
+            "SELECT iso3, version FROM services ORDER BY iso3, version"
+        )
+        return [tuple(row) for row in rows]
+
+
+def service_props(version_dir: Path) -> dict:
+    """Return the cod_ab:* catalog.json fields of one service, or {}.
+
+    catalog.json is reparsed when its mtime or size no longer match the
+    index: portolan (`add`, `check --fix`) rewrites it without going through
+    `catalog_docs`, so the indexed copy can lag behind the file.
+    """
+    key = (version_dir.parent.name, version_dir.name)
+    catalog = version_dir / "catalog.json"
+    with _lock:
+        con = _attached(version_dir.parent.parent)
+        row = con.execute(
+            "SELECT sig, props FROM services WHERE iso3 = ? AND version = ?", key
+        ).fetchone()
+        sig = _signature(catalog)
+        if row is None and sig is None:
+            return {}
+        if row is None or row[0] != sig:
+            data = _read_json(catalog) if sig else None
+            _put_service(con, key, sig, data)
+            row = (sig, _props(data) if data is not None else None)
+    return json.loads(row[1]) if row[1] else {}
+
+
+def layers_with(version_dir: Path, name: str) -> list[str]:
+    """Return the sorted layer names of a service that have file `name`."""
+    with _lock:
+        rows = _attached(version_dir.parent.parent).execute(
+            "SELECT layer FROM files"
+            " WHERE iso3 = ? AND version = ? AND name = ? ORDER BY layer",
+            (version_dir.parent.name, version_dir.name, name),
+        )
+        return [row[0] for row in rows]
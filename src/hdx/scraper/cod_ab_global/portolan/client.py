@@ -0,0 +1,265 @@
+"""Process-wide pooled HTTP client for every ArcGIS call, with per-endpoint counters.
+
+One HTTP/2 transport (and so one connection pool) is shared by the whole
+process. `get_client(timeout)` hands out thin httpx.Client wrappers over that
+transport — one per distinct timeout — so long extraction requests and short
+JSON probes reuse the same warm, multiplexed connections to gis.unocha.org.
+httpx pools connections per transport; with a single upstream host the
+ARCGIS_MAX_CONNECTIONS limit is effectively the per-host limit.
+
+Async callers (the metadata probe) get their own event-loop-bound pool from
+`new_async_client`, sized by the same limits and feeding the same counters.
+
+The transport counts requests, errors, response bytes and wall-clock seconds
+per endpoint (service names and layer ids collapsed, see `_endpoint_key`) so
+`log_http_stats` can summarise where a run spent its network time.
+
+Every client carries `auth.TokenAuth`, so ArcGIS requests always go out with
+the current shared token whichever token the caller passed.
+
+The synchronous transport also takes an in-flight slot from `limiter.py`
+before each request and hands it back, with the observed latency and
+status, once the body has been read — the adaptive concurrency limit and
+the per-service circuit breakers both live there.
+"""
+
+import logging
+import re
+import threading
+import time
+from collections.abc import AsyncIterator, Callable, Iterator
+from dataclasses import dataclass
+from functools import partial
+
+import httpx
+
+from . import limiter
+from .auth import TokenAuth
+from .config import (
+    ARCGIS_KEEPALIVE_EXPIRY,
+    ARCGIS_MAX_CONNECTIONS,
+    ARCGIS_MAX_KEEPALIVE,
+    ARCGIS_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+_HOSTED_SERVICE_RE = re.compile(r"/Hosted/[^/]+/")
+_NUMERIC_SEGMENT_RE = re.compile(r"/\d+(?=/|$)")
+
+
+@dataclass
+class EndpointStats:
+    """Cumulative counters for one endpoint."""
+
+    requests: int = 0
+    errors: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+_stats: dict[str, EndpointStats] = {}
+_stats_lock = threading.Lock()
+
+_transport: "_MeteredTransport | None" = None
+_clients: dict[float, httpx.Client] = {}
+_client_lock = threading.Lock()
+
+
+def _endpoint_key(url: httpx.URL) -> str:
+    """Collapse a request URL to its endpoint shape.
+
+    .../Hosted/cod_ab_afg_v01/FeatureServer/3/query
+      → .../Hosted/*/FeatureServer/{id}/query
+    """
+    path = _HOSTED_SERVICE_RE.sub("/Hosted/*/", url.path)
+    return f"{url.host}{_NUMERIC_SEGMENT_RE.sub('/{id}', path)}"
+
+
+def _record(key: str, *, nbytes: int, seconds: float, error: bool) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(key, EndpointStats())
+        stats.requests += 1
+        stats.errors += int(error)
+        stats.bytes += nbytes
+        stats.seconds += seconds
+
+
+class _CountingStream(httpx.SyncByteStream):
+    """Response body wrapper that records bytes and elapsed time on close."""
+
+    def __init__(
+        self,
+        stream: httpx.SyncByteStream,
+        key: str,
+        start: float,
+        on_close: Callable[[float], None] | None = None,
+    ) -> None:
+        self._stream = stream
+        self._key = key
+        self._start = start
+        self._on_close = on_close
+        self._bytes = 0
+        self._closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._stream.close()
+        seconds = time.perf_counter() - self._start
+        _record(self._key, nbytes=self._bytes, seconds=seconds, error=False)
+        if self._on_close is not None:
+            self._on_close(seconds)
+
+
+class _MeteredTransport(httpx.HTTPTransport):
+    """HTTP/2 pooled transport that feeds the per-endpoint counters and limiter."""
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = _endpoint_key(request.url)
+        limiter.acquire(request)
+        start = time.perf_counter()
+        try:
+            response = super().handle_request(request)
+        except httpx.TransportError:
+            seconds = time.perf_counter() - start
+            _record(key, nbytes=0, seconds=seconds, error=True)
+            limiter.release(request, seconds, None)
+            raise
+        except BaseException:
+            limiter.release(request, time.perf_counter() - start, 0)
+            raise
+        response.stream = _CountingStream(
+            response.stream,
+            key,
+            start,
+            partial(limiter.release, request, status=response.status_code),
+        )
+        return response
+
+
+class _CountingAsyncStream(httpx.AsyncByteStream):
+    """Async counterpart of `_CountingStream`."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, key: str, start: float) -> None:
+        self._stream = stream
+        self._key = key
+        self._start = start
+        self._bytes = 0
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._bytes += len(chunk)
+            yield chunk
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        await self._stream.aclose()
+        _record(
+            self._key,
+            nbytes=self._bytes,
+            seconds=time.perf_counter() - self._start,
+            error=False,
+        )
+
+
+class _MeteredAsyncTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of `_MeteredTransport`."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = _endpoint_key(request.url)
+        start = time.perf_counter()
+        try:
+            response = await super().handle_async_request(request)
+        except httpx.TransportError:
+            _record(key, nbytes=0, seconds=time.perf_counter() - start, error=True)
+            raise
+        response.stream = _CountingAsyncStream(response.stream, key, start)
+        return response
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=ARCGIS_MAX_CONNECTIONS,
+        max_keepalive_connections=ARCGIS_MAX_KEEPALIVE,
+        keepalive_expiry=ARCGIS_KEEPALIVE_EXPIRY,
+    )
+
+
+def get_client(timeout: float = ARCGIS_TIMEOUT) -> httpx.Client:
+    """Return the shared client for `timeout`, creating the pool on first use.
+
+    Thread-safe. All returned clients share one transport, so connection
+    reuse and HTTP/2 multiplexing span every caller regardless of timeout.
+    """
+    global _transport  # noqa: PLW0603
+    with _client_lock:
+        if _transport is None:
+            _transport = _MeteredTransport(http2=True, limits=_limits())
+        client = _clients.get(timeout)
+        if client is None:
+            client = httpx.Client(
+                transport=_transport,
+                timeout=timeout,
+                follow_redirects=True,
+                auth=TokenAuth(),
+            )
+            _clients[timeout] = client
+        return client
+
+
+def new_async_client(timeout: float = ARCGIS_TIMEOUT) -> httpx.AsyncClient:
+    """Return a new metered HTTP/2 async client; use it as `async with`.
+
+    Async pools are bound to the running event loop, so unlike `get_client`
+    this is not a process-wide singleton — one per `asyncio.run` call.
+    """
+    return httpx.AsyncClient(
+        transport=_MeteredAsyncTransport(http2=True, limits=_limits()),
+        timeout=timeout,
+        follow_redirects=True,
+        auth=TokenAuth(),
+    )
+
+
+def close_client() -> None:
+    """Close the shared pool. The next `get_client` call starts a fresh one."""
+    global _transport  # noqa: PLW0603
+    with _client_lock:
+        if _transport is not None:
+            _transport.close()
+        _transport = None
+        _clients.clear()
+
+
+def http_stats() -> dict[str, EndpointStats]:
+    """Return a snapshot of the per-endpoint counters."""
+    with _stats_lock:
+        return {
+            key: EndpointStats(s.requests, s.errors, s.bytes, s.seconds)
+            for key, s in _stats.items()
+        }
+
+
+def log_http_stats() -> None:
+    """Log one line per endpoint, busiest first."""
+    stats = http_stats()
+    for key, s in sorted(stats.items(), key=lambda kv: -kv[1].seconds):
+        logger.info(
+            "HTTP %s: %d requests, %d errors, %.1f MB, %.1f s total, %.0f ms avg",
+            key,
+            s.requests,
+            s.errors,
+            s.bytes / 1e6,
+            s.seconds,
+            1000 * s.seconds / s.requests if s.requests else 0.0,
+        )
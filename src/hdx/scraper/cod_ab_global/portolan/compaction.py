@@ -0,0 +1,215 @@
+"""Two-tier Parquet compression: fast writes now, zstd-22 before push.
+
+zstd level 22 is several times slower than the low levels for a few percent
+smaller files, and every stage used to pay it on its critical path. With
+PORTOLAN_FAST_WRITES (the default) the stages write original, extended,
+matched and global parquets at PORTOLAN_FAST_COMPRESSION_LEVEL instead, so
+the next stage can start at once, and a `Compactor` recompresses them to
+the archival level in a low-priority background thread.
+
+Each file's tier is recorded by a hidden sidecar marker beside it
+(`.original.parquet.fast`); portolan ignores hidden files, so markers are
+never pushed. A marker is written before its file is renamed into place, so
+a crash can only leave an archival file marked fast — which is merely
+recompressed again — never a fast file unmarked. Hardlinked twins
+(`link_twin_files`) carry their source's tier, and are recompressed once per
+inode and relinked together.
+
+`Compactor.finish` runs before push: it recompresses whatever is still on
+the fast tier and raises `CompactionError` if anything is left. Fast-tier
+files are valid Parquet, so the run logs it and pushes them anyway; the
+next run recompresses them.
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+import pyarrow.parquet as pq
+from geoparquet_io.core.common import write_parquet_with_metadata
+from geoparquet_io.core.duckdb_utils import get_duckdb_connection
+
+from . import catalog_index
+from .config import (
+    PORTOLAN_FAST_COMPRESSION_LEVEL,
+    PORTOLAN_FAST_WRITES,
+    PORTOLAN_SORT_MEMORY,
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_LEVEL = 22
+_MARKER_SUFFIX = ".fast"
+# Seconds the background thread waits before rescanning when idle
+_IDLE_SECONDS = 10.0
+# Lowest scheduling priority for the compaction thread (and its DuckDB threads)
+_NICENESS = 19
+
+
+class CompactionError(RuntimeError):
+    """Fast-tier files are left that could not be recompressed."""
+
+
+def write_level() -> int:
+    """Return the zstd level stages should write Parquet outputs at."""
+    return PORTOLAN_FAST_COMPRESSION_LEVEL if PORTOLAN_FAST_WRITES else ARCHIVE_LEVEL
+
+
+def _marker(path: Path) -> Path:
+    return path.with_name(f".{path.name}{_MARKER_SUFFIX}")
+
+
+def _target(marker: Path) -> Path:
+    return marker.with_name(marker.name[1 : -len(_MARKER_SUFFIX)])
+
+
+def is_fast(path: Path) -> bool:
+    """Return True if path is recorded as written on the fast tier."""
+    return _marker(path).exists()
+
+
+def record_tier(path: Path) -> None:
+    """Record the tier of a file about to be written at `write_level()`.
+
+    Call before the file is renamed into place.
+    """
+    if PORTOLAN_FAST_WRITES:
+        _marker(path).touch()
+    else:
+        _marker(path).unlink(missing_ok=True)
+
+
+def link_tier(src: Path, dest: Path) -> None:
+    """Give dest, about to be hardlinked to src, the tier of src."""
+    if is_fast(src):
+        _marker(dest).touch()
+    else:
+        _marker(dest).unlink(missing_ok=True)
+
+
+def _fast_groups(root: Path) -> list[list[Path]]:
+    """Return fast-tier files under root, grouped by inode."""
+    groups: dict[tuple[int, int], list[Path]] = defaultdict(list)
+    for marker in sorted(root.rglob(f".*.parquet{_MARKER_SUFFIX}")):
+        path = _target(marker)
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue  # removed, or hidden by _hide_variant_files for now
+        groups[(st.st_dev, st.st_ino)].append(path)
+    return list(groups.values())
+
+
+def _signature(path: Path) -> tuple[int, int, int] | None:
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _recompress(src: Path, dest: Path) -> None:
+    """Rewrite src at the archival level, keeping row order and metadata."""
+    con = get_duckdb_connection(load_spatial=True, load_httpfs=False)
+    try:
+        con.execute(f"SET memory_limit = '{PORTOLAN_SORT_MEMORY}'")
+        write_parquet_with_metadata(
+            con,
+            f"SELECT * FROM read_parquet('{src}')",
+            str(dest),
+            original_metadata=pq.read_schema(src).metadata,
+            compression="ZSTD",
+            compression_level=ARCHIVE_LEVEL,
+            geoparquet_version="2.0",
+            memory_limit=PORTOLAN_SORT_MEMORY,
+        )
+    finally:
+        con.close()
+
+
+def _compact_group(paths: list[Path]) -> int:
+    """Recompress one inode and relink its paths; return how many were relinked.
+
+    Each path's signature is checked again right before it is replaced, so
+    a path a stage rewrote or relinked meanwhile — even after the recompress
+    finished — is skipped and left on the fast tier for the next scan.
+    """
+    first = paths[0]
+    tmp = first.with_name(f".{first.name}.compact")
+    done = 0
+    try:
+        before = {path: _signature(path) for path in paths}
+        _recompress(first, tmp)
+        for path in paths:
+            link = path.with_name(f".{path.name}.link")
+            link.unlink(missing_ok=True)
+            os.link(tmp, link)
+            try:
+                if before[path] is None or _signature(path) != before[path]:
+                    continue
+                link.replace(path)
+            finally:
+                link.unlink(missing_ok=True)
+            catalog_index.refresh(path)
+            _marker(path).unlink(missing_ok=True)
+            done += 1
+    except Exception:
+        logger.exception("Could not recompress %s", first)
+    finally:
+        tmp.unlink(missing_ok=True)
+    return done
+
+
+class Compactor:
+    """Background recompression of fast-tier parquets under a work dir."""
+
+    def __init__(self, work_dir: Path) -> None:
+        """Prepare to compact the parquets under work_dir; call `start`."""
+        self._work_dir = work_dir
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, name="compactor", daemon=True
+        )
+        self.compacted = 0
+
+    def start(self) -> None:
+        """Start compacting in the background; a no-op without fast writes."""
+        if PORTOLAN_FAST_WRITES:
+            self._thread.start()
+
+    def _loop(self) -> None:
+        # Per-thread on Linux; DuckDB threads created here inherit it
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), _NICENESS)
+        while not self._stop.is_set():
+            groups = _fast_groups(self._work_dir)
+            if not groups:
+                self._stop.wait(_IDLE_SECONDS)
+                continue
+            for paths in groups:
+                if self._stop.is_set():
+                    return
+                self.compacted += _compact_group(paths)
+
+    def finish(self) -> int:
+        """Compact everything left on the fast tier; return files compacted.
+
+        Raises CompactionError if any fast-tier file remains.
+        """
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        for marker in self._work_dir.rglob(f".*.parquet{_MARKER_SUFFIX}"):
+            if not _target(marker).exists():
+                marker.unlink()
+        for paths in _fast_groups(self._work_dir):
+            self.compacted += _compact_group(paths)
+        left = [p for paths in _fast_groups(self._work_dir) for p in paths]
+        if left:
+            msg = f"{len(left)} parquets still fast-tier, e.g. {left[0]}"
+            raise CompactionError(msg)
+        logger.info(
+            "Recompressed %d parquets to zstd-%d", self.compacted, ARCHIVE_LEVEL
+        )
+        return self.compacted
@@ -13,7 +13,59 @@ ARCGIS_TOKEN_URL = f"{ARCGIS_SERVER}/portal/sharing/rest/generateToken"
 ARCGIS_USERNAME = getenv("ARCGIS_USERNAME", "")
 ARCGIS_PASSWORD = getenv("ARCGIS_PASSWORD", "")
 ARCGIS_EXPIRATION = int(getenv("ARCGIS_EXPIRATION", "1440"))
+# Token cache file; defaults to .arcgis_token.json beside PORTOLAN_WORK_DIR.
+ARCGIS_TOKEN_CACHE = getenv("ARCGIS_TOKEN_CACHE", "")
+ARCGIS_TOKEN_REFRESH_MARGIN = int(getenv("ARCGIS_TOKEN_REFRESH_MARGIN", "600"))
 ARCGIS_TIMEOUT = int(getenv("ARCGIS_TIMEOUT", "60"))
+ARCGIS_MAX_CONNECTIONS = int(getenv("ARCGIS_MAX_CONNECTIONS", "32"))
+ARCGIS_MAX_KEEPALIVE = int(getenv("ARCGIS_MAX_KEEPALIVE", "32"))
+ARCGIS_KEEPALIVE_EXPIRY = float(getenv("ARCGIS_KEEPALIVE_EXPIRY", "30"))
+ARCGIS_PROBE_CONCURRENCY = int(getenv("ARCGIS_PROBE_CONCURRENCY", "32"))
+# Only probe layers of services whose COD_Global_Metadata dates differ from
+# their catalog.json, except for a full probe every ARCGIS_FULL_PROBE_HOURS.
+ARCGIS_PROBE_PREFILTER = (
+    getenv("ARCGIS_PROBE_PREFILTER", "true").strip().lower() == "true"
+)
+ARCGIS_FULL_PROBE_HOURS = float(getenv("ARCGIS_FULL_PROBE_HOURS", "24"))
+ARCGIS_EXTRACT_TIMEOUT = int(getenv("ARCGIS_EXTRACT_TIMEOUT", "300"))
+# Query timeouts grow with the features requested, up to ARCGIS_EXTRACT_TIMEOUT.
+ARCGIS_TIMEOUT_PER_1K_FEATURES = float(getenv("ARCGIS_TIMEOUT_PER_1K_FEATURES", "60"))
+# Adaptive (AIMD) in-flight request limit and per-service circuit breaker —
+# see limiter.py.
+ARCGIS_AIMD = getenv("ARCGIS_AIMD", "true").strip().lower() == "true"
+ARCGIS_AIMD_INITIAL = float(getenv("ARCGIS_AIMD_INITIAL", "8"))
+ARCGIS_AIMD_BACKOFF = float(getenv("ARCGIS_AIMD_BACKOFF", "0.5"))
+ARCGIS_AIMD_SLOW_FRACTION = float(getenv("ARCGIS_AIMD_SLOW_FRACTION", "0.5"))
+ARCGIS_BREAKER_FAILURES = int(getenv("ARCGIS_BREAKER_FAILURES", "5"))
+# conditional | ttl | off — see http_cache.py
+ARCGIS_HTTP_CACHE_MODE = getenv("ARCGIS_HTTP_CACHE_MODE", "conditional").lower()
+ARCGIS_HTTP_CACHE_TTL = int(getenv("ARCGIS_HTTP_CACHE_TTL", "86400"))
+# Layers with at least this many features are fetched as concurrent objectId
+# ranges; ARCGIS_PAGE_WORKERS=1 disables parallel paging entirely.
+ARCGIS_PAGED_MIN_FEATURES = int(getenv("ARCGIS_PAGED_MIN_FEATURES", "5000"))
+ARCGIS_PAGE_WORKERS = int(getenv("ARCGIS_PAGE_WORKERS", "4"))
+# Refresh changed layers by fetching only features edited since the stored
+# timestamp (falls back to a full extraction when that is not possible).
+ARCGIS_DELTA_EXTRACT = getenv("ARCGIS_DELTA_EXTRACT", "true").strip().lower() == "true"
+# Request f=pbf query pages from layers that support it (GeoJSON otherwise).
+ARCGIS_PBF = getenv("ARCGIS_PBF", "true").strip().lower() == "true"
+# Only re-extract a layer whose lastEditDate moved if its outStatistics
+# fingerprint (geometry and attribute digests) changed too.
+ARCGIS_FINGERPRINT = getenv("ARCGIS_FINGERPRINT", "true").strip().lower() == "true"
+# Bootstrap services with no local layers from one createReplica export job
+# each instead of per-layer paging (see replica.py).
+ARCGIS_BULK_EXPORT = getenv("ARCGIS_BULK_EXPORT", "false").strip().lower() == "true"
+ARCGIS_EXPORT_POLL_SECONDS = float(getenv("ARCGIS_EXPORT_POLL_SECONDS", "5"))
+ARCGIS_EXPORT_TIMEOUT = int(getenv("ARCGIS_EXPORT_TIMEOUT", "1800"))
+
+# Upload only files changed since the last push (see push_manifest.py)
+PORTOLAN_PUSH_MANIFEST = (
+    getenv("PORTOLAN_PUSH_MANIFEST", "true").strip().lower() == "true"
+)
+PORTOLAN_PUSH_CHUNK_CONCURRENCY = int(getenv("PORTOLAN_PUSH_CHUNK_CONCURRENCY", "4"))
+# S3-compatible endpoint to push to instead of AWS, e.g. a local MinIO
+AWS_ENDPOINT_URL = getenv("AWS_ENDPOINT_URL", "")
+AWS_ALLOW_HTTP = getenv("AWS_ALLOW_HTTP", "false").strip().lower() == "true"
 
 SOURCECOOP_REMOTE = getenv(
     "SOURCECOOP_REMOTE",
@@ -21,6 +73,26 @@ SOURCECOOP_REMOTE = getenv(
 )
 PORTOLAN_WORK_DIR = getenv("PORTOLAN_WORK_DIR", "")
 PORTOLAN_WORKERS = int(getenv("PORTOLAN_WORKERS", str(min(os.cpu_count() or 4, 8))))
+PORTOLAN_EXTRACT_WORKERS = int(getenv("PORTOLAN_EXTRACT_WORKERS", "16"))
+# Services added to the catalog at once, each portolan add in its own process
+# (1 = one after another on the main thread); each add still uses
+# PORTOLAN_WORKERS threads.
+PORTOLAN_ADD_PROCESSES = int(getenv("PORTOLAN_ADD_PROCESSES", "1"))
+PORTOLAN_ENCODE_WORKERS = int(
+    getenv("PORTOLAN_ENCODE_WORKERS", str(os.cpu_count() or 4))
+)
+# DuckDB memory budget per encode worker; larger layers sort out of core.
+PORTOLAN_SORT_MEMORY = getenv("PORTOLAN_SORT_MEMORY", "1GB")
+# Snap original geometries to a grid of this size in degrees (0 = off); see
+# precision_grid_overrides in the package config for per-country sizes.
+PORTOLAN_PRECISION_GRID = float(getenv("PORTOLAN_PRECISION_GRID", "0"))
+# Write parquets at a fast zstd level and recompress them to level 22 in the
+# background before push (see compaction.py).
+PORTOLAN_FAST_WRITES = getenv("PORTOLAN_FAST_WRITES", "true").strip().lower() == "true"
+PORTOLAN_FAST_COMPRESSION_LEVEL = int(getenv("PORTOLAN_FAST_COMPRESSION_LEVEL", "3"))
+# Run portolan commands inside this process instead of spawning the CLI for
+# each (see portolan_api.py); the CLI remains the fallback.
+PORTOLAN_IN_PROCESS = getenv("PORTOLAN_IN_PROCESS", "true").strip().lower() == "true"
 
 HDX_EXPORT_OUTPUT_DIR = getenv("HDX_EXPORT_OUTPUT_DIR", "")
 # Explicit opt-in, defaulting to off — even once this pipeline is wired up as
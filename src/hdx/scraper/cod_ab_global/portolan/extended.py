@@ -11,7 +11,6 @@ Non-polygon types (lines, points, capitals, regions) are excluded.
 import contextlib
 import json
 import logging
-import re
 import tempfile
 from pathlib import Path
 from shutil import copy
@@ -23,42 +22,27 @@ from hdx.location.country import Country
 from hdx.scraper.cod_ab_global.config import where_filter as _where_filter
 from hdx.scraper.cod_ab_global.edge_extender import edge_extender
 
+from . import catalog_docs, catalog_index
+from .compaction import ARCHIVE_LEVEL, record_tier, write_level
 from .config import PORTOLAN_WORKERS
+from .frozen import frozen_services, service_key
 from .original import (
     _generate_variant_pmtiles,
     inject_variant_assets,
+    link_twin_files,
+    read_aliases,
+    read_catalog,
 )
+from .utils import ADMIN_POLYGON_RE, get_admin_updated_map
 
 logger = logging.getLogger(__name__)
 
-# Matches adm0, adm1, ..., adm9. Excludes lines, points, capitals, regions.
-_ADMIN_POLYGON_RE = re.compile(r"^adm\d$")
-
-
-def _get_admin_updated_map(version_dir: Path) -> dict[str, str]:
-    """Return {layer_short: updated_iso} for adm* polygon layers in a version dir."""
-    result = {}
-    if not version_dir.exists():
-        return result
-    for layer_dir in sorted(version_dir.iterdir()):
-        if not layer_dir.is_dir() or layer_dir.name.startswith("."):
-            continue
-        if not _ADMIN_POLYGON_RE.match(layer_dir.name):
-            continue
-        collection_path = layer_dir / "collection.json"
-        if collection_path.exists():
-            updated = json.loads(collection_path.read_text()).get("updated")
-            if updated:
-                result[layer_dir.name] = updated
-    return result
+_EXTENDED_FILES = ("extended.parquet", "extended.pmtiles")
 
 
 def _load_stored_original_updated(version_dir: Path) -> dict[str, str]:
     """Return stored original updated map from the version catalog.json."""
-    catalog_path = version_dir / "catalog.json"
-    if not catalog_path.exists():
-        return {}
-    raw = json.loads(catalog_path.read_text()).get("cod_ab:original_updated")
+    raw = read_catalog(version_dir).get("cod_ab:original_updated")
     if not raw:
         return {}
     with contextlib.suppress(json.JSONDecodeError, TypeError):
@@ -71,21 +55,17 @@ def _get_admin_level_full(version_dir: Path) -> int | None:
 
     Falls back to the highest adm{N} dir with an existing original.parquet.
     """
-    catalog_path = version_dir / "catalog.json"
-    if catalog_path.exists():
-        with contextlib.suppress(TypeError, ValueError):
-            val = json.loads(catalog_path.read_text()).get("cod_ab:admin_level_full")
-            if val is not None:
-                level = int(val)
-                seed_dir = version_dir / f"adm{level}"
-                if (seed_dir / "original.parquet").exists():
-                    return level
+    with contextlib.suppress(TypeError, ValueError):
+        val = read_catalog(version_dir).get("cod_ab:admin_level_full")
+        if val is not None:
+            level = int(val)
+            seed_dir = version_dir / f"adm{level}"
+            if (seed_dir / "original.parquet").exists():
+                return level
     levels = [
-        int(d.name[3:])
-        for d in version_dir.iterdir()
-        if d.is_dir()
-        and _ADMIN_POLYGON_RE.match(d.name)
-        and (d / "original.parquet").exists()
+        int(name[3:])
+        for name in catalog_index.layers_with(version_dir, "original.parquet")
+        if ADMIN_POLYGON_RE.match(name)
     ]
     return max(levels) if levels else None
 
@@ -112,11 +92,27 @@ def _admin_group_cols(all_cols: list[str], level: int) -> list[str]:
     return cols
 
 
-def _write_gpq2(src: Path, dest: Path) -> None:
-    """Read a GeoParquet file, Hilbert-sort it, and write as GeoParquet 2.0."""
-    gpio.read(str(src)).sort_hilbert().write(
-        str(dest), compression_level=22, geoparquet_version="2.0"
-    )
+def _write_gpq2(src: Path, dest: Path, *, tiered: bool = True) -> None:
+    """Read a GeoParquet file, Hilbert-sort it, and write as GeoParquet 2.0.
+
+    The file is written to a hidden sibling, its tier recorded, and only then
+    renamed over dest, so neither readers nor the Compactor see it half
+    written. With tiered=False (files outside the catalog, which the
+    Compactor never visits) it is written at the archival level, unmarked.
+    """
+    tmp = dest.with_name(f".{dest.stem}.tmp.parquet")
+    try:
+        gpio.read(str(src)).sort_hilbert().write(
+            str(tmp),
+            compression_level=write_level() if tiered else ARCHIVE_LEVEL,
+            geoparquet_version="2.0",
+        )
+        if tiered:
+            record_tier(dest)
+        tmp.replace(dest)
+    finally:
+        tmp.unlink(missing_ok=True)
+    catalog_index.refresh(dest)
 
 
 def _dissolve_all_levels(
@@ -250,6 +246,7 @@ def _process_service(iso3: str, version: str, version_dir: Path) -> bool:
             if stale_dir.exists():
                 for stale in ("extended.parquet", "extended.pmtiles"):
                     (stale_dir / stale).unlink(missing_ok=True)
+                catalog_index.refresh(stale_dir / "extended.parquet")
 
         try:
             _dissolve_all_levels(post_path, iso3, admin_level_full, version_dir)
@@ -261,13 +258,25 @@ def _process_service(iso3: str, version: str, version_dir: Path) -> bool:
     return True
 
 
+def _link_from_twin(
+    version_dir: Path, twin_dir: Path, original_map: dict[str, str]
+) -> bool:
+    """Reuse the versioned twin's extended outputs for a mirrored latest service.
+
+    Only valid when the twin was extended from the same original layers;
+    returns False otherwise so the caller runs the edge extension itself.
+    """
+    if _load_stored_original_updated(twin_dir) != original_map:
+        return False
+    link_twin_files(twin_dir, version_dir, _EXTENDED_FILES)
+    return True
+
+
 def _enrich_extended_catalog(version_dir: Path, original_map: dict[str, str]) -> None:
     """Write cod_ab:original_updated marker into the version catalog.json."""
-    catalog_path = version_dir / "catalog.json"
-    if catalog_path.exists() and original_map:
-        data = json.loads(catalog_path.read_text())
+    data = catalog_docs.load(version_dir / "catalog.json")
+    if data is not None and original_map:
         data["cod_ab:original_updated"] = json.dumps(original_map)
-        catalog_path.write_text(json.dumps(data, indent=2))
 
 
 def _inject_all_extended_assets(version_dir: Path, workers: str) -> None:
@@ -278,7 +287,7 @@ def _inject_all_extended_assets(version_dir: Path, workers: str) -> None:
     extended assets behind.
     """
     for layer_dir in sorted(version_dir.iterdir()):
-        if not layer_dir.is_dir() or not _ADMIN_POLYGON_RE.match(layer_dir.name):
+        if not layer_dir.is_dir() or not ADMIN_POLYGON_RE.match(layer_dir.name):
             continue
         parquet = layer_dir / "extended.parquet"
         if not parquet.exists():
@@ -290,19 +299,11 @@ def _inject_all_extended_assets(version_dir: Path, workers: str) -> None:
 
 def _enumerate_services(work_dir: Path) -> list[tuple[str, str]]:
     """Return [(iso3, version), ...] for all service dirs in work_dir."""
-    services = []
-    for country_dir in sorted(work_dir.iterdir()):
-        if not country_dir.is_dir() or country_dir.name.startswith("."):
-            continue
-        if country_dir.name == "wld":
-            continue
-        for version_dir in sorted(country_dir.iterdir()):
-            if not version_dir.is_dir() or version_dir.name.startswith("."):
-                continue
-            v = version_dir.name
-            if (v.startswith("v") and v[1:].isdigit()) or v == "latest":
-                services.append((country_dir.name, v))
-    return services
+    return [
+        (iso3, v)
+        for iso3, v in catalog_index.services(work_dir)
+        if (v.startswith("v") and v[1:].isdigit()) or v == "latest"
+    ]
 
 
 def run(work_dir: Path) -> None:
@@ -315,17 +316,27 @@ def run(work_dir: Path) -> None:
 
     workers = str(PORTOLAN_WORKERS)
 
+    # Frozen services are settled: their markers and assets are already current
+    frozen = frozen_services(work_dir)
+    # Latest services that mirror a v{NN} twin go last, so the twin is done first
+    aliases = read_aliases(work_dir)
+    services.sort(key=lambda s: service_key(*s) in aliases)
     for iso3, version in services:
+        if service_key(iso3, version) in frozen:
+            continue
         version_dir = work_dir / iso3 / version
-        original_map = _get_admin_updated_map(version_dir)
+        original_map = get_admin_updated_map(version_dir)
         if not original_map:
             continue
 
         stored = _load_stored_original_updated(version_dir)
         if original_map != stored:
             logger.info("Processing extended for %s/%s", iso3, version)
-            # Synthesise the service name for _service_to_path roundtrip (not used here)
-            if _process_service(iso3, version, version_dir):
+            twin = aliases.get(service_key(iso3, version))
+            if (
+                twin
+                and _link_from_twin(version_dir, work_dir / iso3 / twin, original_map)
+            ) or _process_service(iso3, version, version_dir):
                 _enrich_extended_catalog(version_dir, original_map)
             else:
                 logger.warning(
@@ -338,3 +349,4 @@ def run(work_dir: Path) -> None:
 
         # portolan add regenerates collection.json — always re-inject extended assets
         _inject_all_extended_assets(version_dir, workers)
+    catalog_docs.flush()
@@ -0,0 +1,769 @@
+"""Layer extraction with parallel objectId-range paging for large layers.
+
+`gpio.extract_arcgis` pages a layer sequentially by resultOffset, so the
+densest adm3/adm4 layers take many minutes each and bound the original
+stage's makespan. For layers with at least ARCGIS_PAGED_MIN_FEATURES features
+this module instead asks for the layer's objectIds (returnIdsOnly), cuts them
+into contiguous objectId ranges of maxRecordCount features, fetches the ranges
+concurrently over the shared pooled client and writes the pages back in
+objectId order. Smaller layers still go through `gpio.extract_arcgis`.
+
+Extraction threads only download: every layer lands in an uncompressed Arrow
+IPC spill (paged layers page by page, never held whole in memory) and
+`encode_layer` — run in a process pool by the original stage — does the
+CPU-bound Hilbert sort and zstd write as an external sort under a fixed
+memory budget. It writes at the fast compression tier; compaction.py brings
+the file to zstd-22 before push. With a precision grid configured for the
+country, geometries are snapped to it there too (GEOS precision reduction,
+which keeps each polygon valid) so every later stage works on fewer, coarser
+coordinates — unless snapping would open gaps or overlaps between
+neighbouring polygons, in which case the layer keeps full precision.
+
+Paged extraction is journalled so an interrupted run resumes where it
+stopped. Each page is committed as its own IPC file in a hidden
+`.original.journal/` directory beside the output, and appended (fsynced) to
+`_journal.jsonl` there with its objectId range and row count. The journal's
+first line identifies the extraction — layer, filter, schema and a digest of
+the objectId ranges — so a restarted run reuses committed pages only when
+the layer has not changed in between. Once every page is in, the directory
+is renamed into place as the spill: a directory-of-pages dataset, which the
+encode stage reads like a single file.
+
+A layer whose stored copy is only a few edits behind can instead be
+refreshed with `extract_delta`: only features whose editor-tracking date is
+at or after the stored `updated` timestamp are fetched, together with the
+current objectId set, and `encode_layer` upserts them into the existing
+parquet — dropping deleted objectIds — before the usual sort and write.
+
+Pages are requested as `f=pbf` when the layer lists PBF among its
+supportedQueryFormats (see `pbf.py`) — several times smaller than GeoJSON and
+decoded straight into Arrow — and every layer that can use PBF goes through
+the paged path, however small. Layers without PBF, or whose PBF answers
+cannot be decoded, fall back to `f=geojson`, converted with geoparquet_io's
+own GeoJSON→Arrow helpers. Both are cast to a schema built from the layer's
+field list, so every path produces the same columns, types and GeoParquet
+metadata.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from datetime import UTC, datetime
+from itertools import islice
+from pathlib import Path
+from shutil import rmtree
+from typing import TextIO
+
+import duckdb
+import geoparquet_io as gpio
+import httpx
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from duckdb import DuckDBPyConnection
+from geoparquet_io.core.arcgis import (
+    ARCGIS_GEOM_TYPES,
+    ArcGISLayerInfo,
+    _align_table_to_schema,
+    _build_schema_from_layer_info,
+    _geojson_page_to_table,
+)
+from geoparquet_io.core.common import write_parquet_with_metadata
+from geoparquet_io.core.crs_utils import parse_crs_string_to_projjson
+from geoparquet_io.core.duckdb_utils import get_duckdb_connection, quote_identifier
+from geoparquet_io.core.streaming import find_geometry_column_from_table
+from tenacity import (
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from hdx.scraper.cod_ab_global.config import precision_grid_overrides
+
+from .client import get_client
+from .compaction import record_tier, write_level
+from .config import (
+    ARCGIS_EXTRACT_TIMEOUT,
+    ARCGIS_PAGE_WORKERS,
+    ARCGIS_PAGED_MIN_FEATURES,
+    ARCGIS_PBF,
+    PORTOLAN_PRECISION_GRID,
+    PORTOLAN_SORT_MEMORY,
+)
+from .limiter import payload_timeout
+from .pbf import FeaturePage, PbfDecodeError, decode_feature_page
+from .utils import fetch_json
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PAGE_SIZE = 1000
+# Columns in original.parquet that are not ArcGIS attribute fields
+_NON_ATTRIBUTE_COLUMNS = frozenset({"geometry", "bbox"})
+# "_"-prefixed, so pyarrow datasets over the page directory skip it
+_JOURNAL_FILE = "_journal.jsonl"
+
+
+class _PageTooLargeError(Exception):
+    """The server truncated or failed a page — retry it as two smaller ranges."""
+
+
+class _PbfUnsupportedError(Exception):
+    """A layer answered an f=pbf query with something other than PBF features."""
+
+
+@dataclass(frozen=True)
+class _RangeQuery:
+    """What to fetch for each objectId range of one layer, and how."""
+
+    layer_url: str
+    token: str
+    oid_field: str
+    schema: pa.Schema
+    where: str = "1=1"
+    pbf: bool = False
+
+
+def _query(
+    layer_url: str, token: str, params: dict, timeout: float = ARCGIS_EXTRACT_TIMEOUT
+) -> dict:
+    """Run one query request against a layer and return the parsed response."""
+    r = get_client(timeout).get(f"{layer_url}/query", params={**params, "token": token})
+    r.raise_for_status()
+    try:
+        data = r.json()
+    except json.JSONDecodeError as e:
+        # ArcGIS answers oversized queries with an HTML error page
+        raise _PageTooLargeError from e
+    if "error" in data:
+        msg = f"{layer_url}: {data['error'].get('message', data['error'])}"
+        raise RuntimeError(msg)
+    return data
+
+
+def _query_pbf(
+    layer_url: str, token: str, params: dict, timeout: float = ARCGIS_EXTRACT_TIMEOUT
+) -> FeaturePage:
+    """Run one f=pbf query request and decode the feature page."""
+    r = get_client(timeout).get(
+        f"{layer_url}/query", params={**params, "token": token, "f": "pbf"}
+    )
+    r.raise_for_status()
+    if r.content[:1] == b"<":
+        raise _PageTooLargeError
+    if r.content[:1] == b"{":
+        # JSON error instead of PBF: the format is not available for this layer
+        raise _PbfUnsupportedError(r.text[:200])
+    return decode_feature_page(r.content)
+
+
+def supports_pbf(layer_meta: dict) -> bool:
+    """Return True if ARCGIS_PBF is on and the layer lists PBF as a query format."""
+    formats = layer_meta.get("supportedQueryFormats") or ""
+    return ARCGIS_PBF and "pbf" in formats.lower().replace(" ", "").split(",")
+
+
+def fetch_object_ids(
+    layer_url: str, token: str, where: str = "1=1"
+) -> tuple[str, list[int]]:
+    """Return (objectIdFieldName, sorted objectIds) of the features matching where."""
+    data = _query(
+        layer_url, token, {"where": where, "returnIdsOnly": "true", "f": "json"}
+    )
+    return data["objectIdFieldName"], sorted(data.get("objectIds") or [])
+
+
+def fetch_count(layer_url: str, token: str) -> int:
+    """Return the layer's total feature count."""
+    data = _query(
+        layer_url, token, {"where": "1=1", "returnCountOnly": "true", "f": "json"}
+    )
+    return int(data.get("count", 0))
+
+
+def _is_transient(exc: BaseException) -> bool:
+    """Return True for network errors and 429/5xx responses."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500  # noqa: PLR2004
+    return isinstance(exc, httpx.TransportError)
+
+
+@retry(
+    retry=retry_if_exception(_is_transient),
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=1, max=30),
+    reraise=True,
+)
+def _fetch_range(query: _RangeQuery, object_ids: list[int]) -> pa.Table | None:
+    """Fetch the features matching query in object_ids' inclusive objectId range.
+
+    The timeout scales with the number of features requested. A PBF page
+    that cannot be decoded or cast to the schema is fetched again as GeoJSON.
+    """
+    lo, hi = object_ids[0], object_ids[-1]
+    timeout = payload_timeout(len(object_ids))
+    oid_field = query.oid_field
+    params = {
+        "where": f"({query.where}) AND {oid_field} >= {lo} AND {oid_field} <= {hi}",
+        "outFields": "*",
+        "returnGeometry": "true",
+        "orderByFields": oid_field,
+    }
+    if query.pbf:
+        try:
+            page = _query_pbf(
+                query.layer_url, query.token, {**params, "outSR": "4326"}, timeout
+            )
+            if page.exceeded_transfer_limit:
+                raise _PageTooLargeError
+            return page.to_table(query.schema)
+        except (PbfDecodeError, pa.ArrowInvalid, pa.ArrowTypeError) as e:
+            logger.warning(
+                "%s: PBF page %d-%d unusable (%s) — refetching as GeoJSON",
+                query.layer_url,
+                lo,
+                hi,
+                e,
+            )
+    data = _query(query.layer_url, query.token, {**params, "f": "geojson"}, timeout)
+    if data.get("exceededTransferLimit") or (data.get("properties") or {}).get(
+        "exceededTransferLimit"
+    ):
+        raise _PageTooLargeError
+    return _page_to_table(data.get("features", []), query.schema)
+
+
+def _fetch_range_split(query: _RangeQuery, object_ids: list[int]) -> pa.Table | None:
+    """Fetch the features for object_ids, halving the range on oversize pages."""
+    try:
+        return _fetch_range(query, object_ids)
+    except _PageTooLargeError:
+        if len(object_ids) == 1:
+            raise
+        mid = len(object_ids) // 2
+        logger.debug("Splitting oversize page %d-%d", object_ids[0], object_ids[-1])
+        halves = [
+            t
+            for t in (
+                _fetch_range_split(query, object_ids[:mid]),
+                _fetch_range_split(query, object_ids[mid:]),
+            )
+            if t is not None
+        ]
+        return pa.concat_tables(halves) if halves else None
+
+
+def _page_to_table(features: list[dict], schema: pa.Schema) -> pa.Table | None:
+    table = _geojson_page_to_table(features)
+    if table is None:
+        return None
+    return _align_table_to_schema(table, schema).cast(schema, safe=True)
+
+
+def _geo_metadata(geometry_type: str) -> bytes:
+    """GeoParquet `geo` metadata matching gpio.extract_arcgis (f=geojson → CRS84)."""
+    return json.dumps(
+        {
+            "version": "1.1.0",
+            "primary_column": "geometry",
+            "columns": {
+                "geometry": {
+                    "encoding": "WKB",
+                    "crs": parse_crs_string_to_projjson("OGC:CRS84"),
+                    "geometry_types": [
+                        ARCGIS_GEOM_TYPES.get(geometry_type, "Geometry")
+                    ],
+                }
+            },
+        }
+    ).encode()
+
+
+def _layer_info(layer_meta: dict, count: int) -> ArcGISLayerInfo:
+    return ArcGISLayerInfo(
+        name=layer_meta.get("name", "Unknown"),
+        geometry_type=layer_meta.get("geometryType", "esriGeometryPolygon"),
+        spatial_reference=layer_meta.get("spatialReference", {"wkid": 4326}),
+        fields=layer_meta.get("fields", []),
+        max_record_count=layer_meta.get("maxRecordCount") or _DEFAULT_PAGE_SIZE,
+        total_count=count,
+    )
+
+
+def _spill_schema(info: ArcGISLayerInfo) -> pa.Schema:
+    schema = _build_schema_from_layer_info(info)
+    return schema.with_metadata({b"geo": _geo_metadata(info.geometry_type)})
+
+
+def _write_pages_in_order(
+    query: _RangeQuery, chunks: list[list[int]], spill_path: Path
+) -> int:
+    """Fetch objectId chunks concurrently and commit them as journalled pages.
+
+    A sliding window keeps at most two pages per worker in flight, and pages
+    are committed in order as soon as every earlier page has been — memory
+    stays flat however many features the layer has, and an interrupted run
+    resumes after the last committed page. If the layer turns out not to
+    answer f=pbf after all, the remaining pages are fetched as GeoJSON.
+    """
+    try:
+        return _stream_pages(query, chunks, spill_path)
+    except _PbfUnsupportedError as e:
+        logger.info("%s: no usable PBF (%s) — using GeoJSON", query.layer_url, e)
+        return _stream_pages(replace(query, pbf=False), chunks, spill_path)
+
+
+def journal_dir(spill_path: Path) -> Path:
+    """Return the page journal directory used while paging into spill_path."""
+    return spill_path.with_suffix(".journal")
+
+
+def _journal_key(query: _RangeQuery, chunks: list[list[int]]) -> dict:
+    return {
+        "layer_url": query.layer_url,
+        "where": query.where,
+        "schema": hashlib.sha256(query.schema.serialize()).hexdigest(),
+        "chunks": hashlib.sha256(json.dumps(chunks).encode()).hexdigest(),
+    }
+
+
+def _open_journal(jdir: Path, key: dict) -> dict[int, int]:
+    """Return {page: rows} already committed under a journal matching key.
+
+    A journal for a different key (the layer changed) is discarded and a new
+    one started.
+    """
+    path = jdir / _JOURNAL_FILE
+    if path.exists():
+        lines = path.read_text().splitlines()
+        if lines and lines[0] == json.dumps(key):
+            committed: dict[int, int] = {}
+            for line in lines[1:]:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # torn final write
+                if entry["file"] is None or (jdir / entry["file"]).exists():
+                    committed[entry["page"]] = entry["rows"]
+            return committed
+        logger.info("Discarding stale extraction journal %s", jdir)
+    rmtree(jdir, ignore_errors=True)
+    jdir.mkdir(parents=True)
+    path.write_text(json.dumps(key) + "\n")
+    return {}
+
+
+def _commit_page(
+    jdir: Path, journal: TextIO, page: int, chunk: list[int], table: pa.Table | None
+) -> int:
+    """Write one page file atomically, then record it in the journal."""
+    name = None
+    if table is not None:
+        name = f"{page:06d}.arrow"
+        tmp = jdir / f".{name}.tmp"
+        with (
+            pa.OSFile(str(tmp), "wb") as sink,
+            pa.ipc.new_file(sink, table.schema) as w,
+        ):
+            w.write_table(table)
+        tmp.replace(jdir / name)
+    rows = table.num_rows if table is not None else 0
+    entry = {"page": page, "lo": chunk[0], "hi": chunk[-1], "rows": rows, "file": name}
+    journal.write(json.dumps(entry) + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+    return rows
+
+
+def _finalise_journal(jdir: Path, spill_path: Path, schema: pa.Schema) -> None:
+    """Rename a complete page journal into place as the spill."""
+    if not any(jdir.glob("[!._]*.arrow")):
+        # An empty layer still needs one file carrying the schema
+        with (
+            pa.OSFile(str(jdir / "empty.arrow"), "wb") as sink,
+            pa.ipc.new_file(sink, schema),
+        ):
+            pass
+    remove_spill(spill_path)
+    jdir.rename(spill_path)
+    (spill_path / _JOURNAL_FILE).unlink()
+
+
+def _stream_pages(query: _RangeQuery, chunks: list[list[int]], spill_path: Path) -> int:
+    jdir = journal_dir(spill_path)
+    committed = _open_journal(jdir, _journal_key(query, chunks))
+    if committed:
+        logger.info(
+            "Resuming %s: %d of %d pages already fetched",
+            query.layer_url,
+            len(committed),
+            len(chunks),
+        )
+    window = 2 * ARCGIS_PAGE_WORKERS
+    rows = sum(committed.values())
+    with (
+        ThreadPoolExecutor(max_workers=ARCGIS_PAGE_WORKERS) as pool,
+        (jdir / _JOURNAL_FILE).open("a") as journal,
+    ):
+        in_flight: deque[tuple[int, list[int], Future[pa.Table | None]]] = deque()
+        pending = ((i, c) for i, c in enumerate(chunks) if i not in committed)
+        for page, chunk in islice(pending, window):
+            in_flight.append(
+                (page, chunk, pool.submit(_fetch_range_split, query, chunk))
+            )
+        while in_flight:
+            page, chunk, future = in_flight.popleft()
+            table = future.result()
+            for nxt, nxt_chunk in islice(pending, 1):
+                in_flight.append(
+                    (nxt, nxt_chunk, pool.submit(_fetch_range_split, query, nxt_chunk))
+                )
+            rows += _commit_page(jdir, journal, page, chunk, table)
+    _finalise_journal(jdir, spill_path, query.schema)
+    return rows
+
+
+def extract_paged(
+    layer_url: str, token: str, layer_meta: dict, spill_path: Path
+) -> None:
+    """Extract one layer to spill_path by concurrent objectId-range pages."""
+    oid_field, object_ids = fetch_object_ids(layer_url, token)
+    info = _layer_info(layer_meta, len(object_ids))
+    query = _RangeQuery(
+        layer_url, token, oid_field, _spill_schema(info), pbf=supports_pbf(layer_meta)
+    )
+    page_size = info.max_record_count
+    chunks = [
+        object_ids[i : i + page_size] for i in range(0, len(object_ids), page_size)
+    ]
+    logger.info(
+        "Paging %s: %d features in %d %s ranges over %d workers",
+        layer_url,
+        len(object_ids),
+        len(chunks),
+        "PBF" if query.pbf else "GeoJSON",
+        ARCGIS_PAGE_WORKERS,
+    )
+    rows = _write_pages_in_order(query, chunks, spill_path)
+    if rows != len(object_ids):
+        msg = f"{layer_url}: fetched {rows} of {len(object_ids)} features"
+        raise RuntimeError(msg)
+
+
+def extract_layer(layer_url: str, token: str, spill_path: Path) -> None:
+    """Extract one ArcGIS layer to an Arrow IPC spill file.
+
+    Layers that answer f=pbf, and large layers, are paged in parallel and
+    streamed to disk batch by batch. Smaller GeoJSON-only ones go through
+    `gpio.extract_arcgis` and are spilled whole. Set ARCGIS_PAGE_WORKERS=1
+    and ARCGIS_PBF=false to always use the sequential gpio path.
+    """
+    layer_meta = fetch_json(layer_url, token)
+    if supports_pbf(layer_meta) or (
+        ARCGIS_PAGE_WORKERS > 1
+        and fetch_count(layer_url, token) >= ARCGIS_PAGED_MIN_FEATURES
+    ):
+        extract_paged(layer_url, token, layer_meta, spill_path)
+        return
+    spill_table(gpio.extract_arcgis(layer_url, token=token), spill_path)
+
+
+def _edit_filter(layer_meta: dict, since_iso: str) -> str | None:
+    """Return a where clause for features edited at or after since_iso.
+
+    None when the layer has no editor tracking. The timestamp is floored to
+    the second and compared with >=, so a boundary edit is fetched twice
+    rather than missed; the upsert makes that harmless.
+    """
+    edit_field = (layer_meta.get("editFieldsInfo") or {}).get("editDateField")
+    if not edit_field:
+        return None
+    since = datetime.fromisoformat(since_iso).astimezone(UTC)
+    return f"{edit_field} >= TIMESTAMP '{since:%Y-%m-%d %H:%M:%S}'"
+
+
+def extract_delta(
+    layer_url: str, token: str, since_iso: str, base_path: Path, spill_path: Path
+) -> bool:
+    """Fetch only the features edited since since_iso, for an upsert into base_path.
+
+    Writes the edited features to spill_path and the layer's current objectId
+    set to `ids_path(spill_path)`; `encode_layer` merges both with the existing
+    parquet. Returns False without writing anything when a delta cannot stand
+    in for a full extraction: no editor tracking, a field list that no longer
+    matches the stored parquet, or more than half the layer edited.
+    """
+    layer_meta = fetch_json(layer_url, token)
+    where = _edit_filter(layer_meta, since_iso)
+    if where is None:
+        logger.info("%s has no editor tracking — full extraction", layer_url)
+        return False
+    fields = {f["name"] for f in layer_meta.get("fields", [])}
+    if fields != set(pq.read_schema(base_path).names) - _NON_ATTRIBUTE_COLUMNS:
+        logger.info("%s field list changed — full extraction", layer_url)
+        return False
+    oid_field, object_ids = fetch_object_ids(layer_url, token)
+    _, edited = fetch_object_ids(layer_url, token, where)
+    if 2 * len(edited) > len(object_ids):
+        logger.info("%s mostly edited — full extraction", layer_url)
+        return False
+    info = _layer_info(layer_meta, len(edited))
+    query = _RangeQuery(
+        layer_url,
+        token,
+        oid_field,
+        _spill_schema(info),
+        where,
+        pbf=supports_pbf(layer_meta),
+    )
+    page_size = info.max_record_count
+    chunks = [edited[i : i + page_size] for i in range(0, len(edited), page_size)]
+    logger.info(
+        "Delta %s: %d of %d features edited since %s",
+        layer_url,
+        len(edited),
+        len(object_ids),
+        since_iso,
+    )
+    rows = _write_pages_in_order(query, chunks, spill_path)
+    if rows != len(edited):
+        msg = f"{layer_url}: fetched {rows} of {len(edited)} edited features"
+        raise RuntimeError(msg)
+    ids = pa.table({oid_field: pa.array(object_ids, pa.int64())})
+    with (
+        pa.OSFile(str(ids_path(spill_path)), "wb") as sink,
+        pa.ipc.new_file(sink, ids.schema) as w,
+    ):
+        w.write_table(ids)
+    return True
+
+
+def ids_path(spill_path: Path) -> Path:
+    """Return where `extract_delta` writes the current objectIds for spill_path."""
+    return spill_path.with_suffix(".ids.arrow")
+
+
+def remove_spill(spill_path: Path) -> None:
+    """Remove a spill, whether a single IPC file or a directory of pages."""
+    if spill_path.is_dir():
+        rmtree(spill_path)
+    else:
+        spill_path.unlink(missing_ok=True)
+
+
+def spill_table(table: gpio.Table, path: Path) -> None:
+    """Write a fetched layer as uncompressed Arrow IPC for the encode stage."""
+    remove_spill(path)
+    arrow = table.to_arrow()
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, arrow.schema) as w:
+        w.write_table(arrow)
+
+
+def precision_grid(iso3: str) -> float | None:
+    """Return the grid size original geometries of a country snap to, if any."""
+    grid = precision_grid_overrides.get(iso3.upper(), PORTOLAN_PRECISION_GRID)
+    return grid or None
+
+
+def _external_hilbert_sort(
+    spill_path: Path,
+    out_path: Path,
+    base_path: Path | None = None,
+    grid: float | None = None,
+) -> None:
+    """Hilbert-sort spill_path into GeoParquet 2.0 at out_path, out of core.
+
+    DuckDB scans the spill as an Arrow dataset batch by batch and sorts with
+    its external merge sort: sorted runs are cut whenever PORTOLAN_SORT_MEMORY
+    fills up, spilled under a hidden temp directory beside the output, then
+    merged while geoparquet_io streams the result to disk. Peak memory is the
+    budget, not the layer size. Empty and NULL geometries sort last, as in
+    `gpio.Table.sort_hilbert`.
+
+    With base_path (a delta), the spill holds only edited features: rows of
+    base_path are kept when their objectId is still in the layer and was not
+    edited, and the edited rows are unioned in by column name.
+
+    A bbox covering column, if any, is derived again from the final
+    geometries: a delta's edited rows arrive without one, and snapping moves
+    coordinates.
+
+    With grid, geometries are snapped to it by ST_ReducePrecision after the
+    Hilbert extent is taken, if `_snap_keeps_coverage` allows it. Snapping is
+    idempotent, so the already-snapped rows a delta keeps from base_path are
+    unaffected.
+    """
+    spill = ds.dataset(str(spill_path), format="arrow")
+    geom_name = (
+        find_geometry_column_from_table(spill.schema.empty_table()) or "geometry"
+    )
+    geom = quote_identifier(geom_name)
+    tmp_dir = out_path.parent / f".{out_path.stem}.sort"
+    con = get_duckdb_connection(load_spatial=True, load_httpfs=False)
+    try:
+        con.execute(f"SET memory_limit = '{PORTOLAN_SORT_MEMORY}'")
+        con.execute(f"SET temp_directory = '{tmp_dir}'")
+        con.execute("SET preserve_insertion_order = false")
+        con.register("spill", spill)
+        columns = dict(
+            con.execute(
+                "SELECT column_name, column_type FROM (DESCRIBE spill)"
+            ).fetchall()
+        )
+        if "BLOB" in columns.get(geom_name, "").upper():
+            con.execute(
+                f"CREATE VIEW src AS SELECT * REPLACE"
+                f" (ST_GeomFromWKB({geom}) AS {geom}) FROM spill"
+            )
+        else:
+            con.execute("CREATE VIEW src AS SELECT * FROM spill")
+        if base_path is not None:
+            _merge_delta(con, spill_path, base_path)
+        bounds = con.execute(f"""
+            SELECT min(ST_XMin({geom})), min(ST_YMin({geom})),
+                   max(ST_XMax({geom})), max(ST_YMax({geom}))
+            FROM src
+            WHERE {geom} IS NOT NULL AND NOT ST_IsEmpty({geom})
+        """).fetchone()
+        order_by = f"ST_IsEmpty({geom}) IS NOT FALSE"
+        if bounds and None not in bounds:
+            x0, y0, x1, y1 = bounds
+            order_by += (
+                f", ST_Hilbert({geom},"
+                f" ST_Extent(ST_MakeEnvelope({x0}, {y0}, {x1}, {y1})))"
+            )
+        if grid and _snap_keeps_coverage(con, geom, grid):
+            con.execute("ALTER VIEW src RENAME TO unsnapped")
+            con.execute(
+                f"CREATE VIEW src AS SELECT * REPLACE"
+                f" (ST_ReducePrecision({geom}, {grid}) AS {geom}) FROM unsnapped"
+            )
+        elif grid:
+            logger.warning(
+                "%s: snapping to %s does not keep the polygon coverage"
+                " — keeping full precision",
+                out_path.parent.name,
+                grid,
+            )
+        bbox_type = dict(
+            con.execute(
+                "SELECT column_name, column_type FROM (DESCRIBE src)"
+            ).fetchall()
+        ).get("bbox")
+        if bbox_type:
+            _recompute_bbox(con, geom, bbox_type)
+        write_parquet_with_metadata(
+            con,
+            f"SELECT * FROM src ORDER BY {order_by}",
+            str(out_path),
+            original_metadata=spill.schema.metadata,
+            compression="ZSTD",
+            compression_level=write_level(),
+            geoparquet_version="2.0",
+            memory_limit=PORTOLAN_SORT_MEMORY,
+        )
+    finally:
+        con.close()
+        rmtree(tmp_dir, ignore_errors=True)
+
+
+def _snap_keeps_coverage(con: DuckDBPyConnection, geom: str, grid: float) -> bool:
+    """Return True if snapping `src` to grid adds no coverage errors.
+
+    ST_ReducePrecision works one geometry at a time: two neighbours sharing
+    an edge snap its vertices alike, but each polygon is re-noded on its own,
+    so the shared edge can come out differently and open a gap or an overlap
+    between them. The polygons' coverage invalid edges (overlaps, misaligned
+    edges, and gaps narrower than the grid) are measured before and after;
+    the snap is kept only if their total length did not grow. Both passes
+    hold every polygon in memory, unlike the sort; a layer that cannot be
+    checked within the budget is left unsnapped.
+    """
+    try:
+        before, after = con.execute(f"""
+            SELECT
+                coalesce(ST_Length(ST_CoverageInvalidEdges_Agg({geom}, {grid})), 0),
+                coalesce(ST_Length(ST_CoverageInvalidEdges_Agg(
+                    ST_ReducePrecision({geom}, {grid}), {grid}
+                )), 0)
+            FROM src
+            WHERE ST_GeometryType({geom}) IN ('POLYGON', 'MULTIPOLYGON')
+        """).fetchone()
+    except duckdb.Error:
+        logger.warning("Could not check the coverage of a snapped layer")
+        return False
+    return after <= before
+
+
+def _recompute_bbox(con: DuckDBPyConnection, geom: str, bbox_type: str) -> None:
+    """Redefine the `src` view with its bbox column derived from geom."""
+    con.execute("ALTER VIEW src RENAME TO unboxed")
+    con.execute(f"""
+        CREATE VIEW src AS
+        SELECT * REPLACE (
+            CAST(
+                struct_pack(
+                    xmin := ST_XMin({geom}), ymin := ST_YMin({geom}),
+                    xmax := ST_XMax({geom}), ymax := ST_YMax({geom})
+                ) AS {bbox_type}
+            ) AS bbox
+        )
+        FROM unboxed
+    """)
+
+
+def _merge_delta(con: DuckDBPyConnection, spill_path: Path, base_path: Path) -> None:
+    """Redefine the `src` view as base_path upserted with the edited rows.
+
+    Columns are matched by name; one the edited rows lack (bbox) comes out
+    NULL for them until `_recompute_bbox` fills it.
+    """
+    ids = ds.dataset(str(ids_path(spill_path)), format="arrow")
+    oid = quote_identifier(ids.schema.names[0])
+    con.register("current_ids", ids)
+    con.execute("ALTER VIEW src RENAME TO edited")
+    con.execute(f"""
+        CREATE VIEW src AS
+        SELECT * FROM read_parquet('{base_path}')
+        WHERE {oid} IN (SELECT {oid} FROM current_ids)
+          AND {oid} NOT IN (SELECT {oid} FROM edited)
+        UNION ALL BY NAME
+        SELECT * FROM edited
+    """)
+
+
+def encode_layer(
+    spill_path: Path,
+    out_path: Path,
+    *,
+    delta: bool = False,
+    grid: float | None = None,
+) -> bool:
+    """Hilbert-sort a spilled layer and atomically write it as GeoParquet 2.0.
+
+    Runs in a worker process. Writes to a hidden temp file first so portolan
+    never sees a partial original.parquet, then renames it into place. The
+    spill files are removed whether or not encoding succeeds. With delta, the
+    spill is an `extract_delta` result merged into the existing out_path; if
+    that fails out_path is removed too, since it no longer matches the layer.
+    grid is the precision grid to snap geometries to, if any.
+    """
+    tmp_path = out_path.with_name(f".{out_path.stem}.tmp.parquet")
+    try:
+        _external_hilbert_sort(spill_path, tmp_path, out_path if delta else None, grid)
+        record_tier(out_path)
+        tmp_path.replace(out_path)
+    except BaseException:
+        if delta:
+            out_path.unlink(missing_ok=True)
+        raise
+    finally:
+        remove_spill(spill_path)
+        ids_path(spill_path).unlink(missing_ok=True)
+        tmp_path.unlink(missing_ok=True)
+    return True
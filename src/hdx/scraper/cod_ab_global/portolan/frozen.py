@@ -0,0 +1,175 @@
+"""Registry of frozen (expired, superseded) historic service versions.
+
+A v{NN} service whose COD_Global_Metadata row has `date_valid_to` set and
+which is not the highest v{NN} for its country never changes upstream again.
+Once every stage has caught up with it, `freeze_expired` records it here and
+the original, extended and matched stages skip it outright — no layer
+probes, no updated-map reads, no asset re-injection. hdx_export still reads
+frozen services from the catalog; it only ever reads them.
+
+Frozen services are keyed "iso3/version" (e.g. "afg/v01"), matching the
+catalog layout. Corrections to a frozen version need an explicit thaw:
+
+    python -m hdx.scraper.cod_ab_global.portolan.frozen thaw afg/v01
+
+A thawed service is force-probed by the next original run, reprocessed by
+every stage as usual, and refrozen at the end of that run.
+
+The registry lives outside the portolan catalog tree — sibling to `.bnda` —
+so push never touches it.
+"""
+
+import argparse
+import json
+import logging
+from datetime import UTC, datetime
+from pathlib import Path
+
+from . import catalog_docs
+from .config import PORTOLAN_WORK_DIR
+from .utils import get_admin_updated_map, partition_by_version
+
+logger = logging.getLogger(__name__)
+
+_REGISTRY_FILE = "registry.json"
+
+
+def service_key(iso3: str, version: str) -> str:
+    """Return the registry key for one service, e.g. "afg/v01"."""
+    return f"{iso3}/{version}"
+
+
+def _registry_path(work_dir: Path) -> Path:
+    state_dir = work_dir.parent / ".frozen"
+    state_dir.mkdir(exist_ok=True)
+    return state_dir / _REGISTRY_FILE
+
+
+def _read_registry(work_dir: Path) -> dict:
+    path = _registry_path(work_dir)
+    if not path.exists():
+        return {"frozen": {}, "thawed": []}
+    try:
+        data = json.loads(path.read_text())
+    except (json.JSONDecodeError, OSError):
+        return {"frozen": {}, "thawed": []}
+    data.setdefault("frozen", {})
+    data.setdefault("thawed", [])
+    return data
+
+
+def _write_registry(work_dir: Path, data: dict) -> None:
+    _registry_path(work_dir).write_text(json.dumps(data, indent=2, sort_keys=True))
+
+
+def frozen_services(work_dir: Path) -> set[str]:
+    """Return the "iso3/version" keys every stage should skip."""
+    return set(_read_registry(work_dir)["frozen"])
+
+
+def thawed_services(work_dir: Path) -> set[str]:
+    """Return the "iso3/version" keys thawed since they were last frozen."""
+    return set(_read_registry(work_dir)["thawed"])
+
+
+def _is_settled(version_dir: Path) -> bool:
+    """Return True if every stage has caught up with this service on disk.
+
+    Requires an original.parquet in every layer and the extended and matched
+    stages' change markers to match the current admin layers, so a version
+    is never frozen halfway through a retry.
+    """
+    catalog = catalog_docs.load(version_dir / "catalog.json")
+    if catalog is None or not catalog.get("cod_ab:date_valid_to"):
+        return False
+    layer_dirs = [
+        d for d in version_dir.iterdir() if d.is_dir() and not d.name.startswith(".")
+    ]
+    if not layer_dirs or not all((d / "original.parquet").exists() for d in layer_dirs):
+        return False
+    admin_map = get_admin_updated_map(version_dir)
+    return not admin_map or all(
+        _stored_map(catalog, marker) == admin_map
+        for marker in ("cod_ab:original_updated", "cod_ab:extended_updated")
+    )
+
+
+def _stored_map(catalog: dict, marker: str) -> dict | None:
+    try:
+        return json.loads(catalog.get(marker) or "{}")
+    except json.JSONDecodeError:
+        return None
+
+
+def freeze_expired(work_dir: Path) -> None:
+    """Freeze every settled, expired historic version; run after all stages.
+
+    Candidates are the non-highest v{NN} directories per country (the same
+    latest/historic split `partition_by_version` gives hdx_export) whose
+    catalog.json carries cod_ab:date_valid_to. Entries for versions removed
+    upstream are dropped.
+    """
+    registry = _read_registry(work_dir)
+    frozen: dict[str, dict] = {
+        key: entry
+        for key, entry in registry["frozen"].items()
+        if (work_dir / key).is_dir()
+    }
+    thawed = set(registry["thawed"])
+    _, historic = partition_by_version(work_dir)
+    now = datetime.now(UTC).isoformat(timespec="seconds")
+    newly = 0
+    for iso3, version_dirs in historic.items():
+        for version_dir in version_dirs:
+            key = service_key(iso3, version_dir.name)
+            if key in frozen or not _is_settled(version_dir):
+                continue
+            catalog = catalog_docs.load(version_dir / "catalog.json") or {}
+            frozen[key] = {
+                "date_valid_to": catalog["cod_ab:date_valid_to"],
+                "frozen_at": now,
+            }
+            thawed.discard(key)
+            newly += 1
+    _write_registry(work_dir, {"frozen": frozen, "thawed": sorted(thawed)})
+    logger.info("Froze %d services (%d frozen in total)", newly, len(frozen))
+
+
+def thaw(work_dir: Path, keys: list[str]) -> None:
+    """Unfreeze services so the next run re-probes and reprocesses them."""
+    registry = _read_registry(work_dir)
+    thawed = set(registry["thawed"])
+    for key in keys:
+        if registry["frozen"].pop(key, None) is None:
+            logger.warning("%s is not frozen — skipping", key)
+            continue
+        thawed.add(key)
+        logger.info("Thawed %s", key)
+    registry["thawed"] = sorted(thawed)
+    _write_registry(work_dir, registry)
+
+
+def main() -> None:
+    """Command line: list frozen services, or thaw some of them."""
+    parser = argparse.ArgumentParser(
+        prog="python -m hdx.scraper.cod_ab_global.portolan.frozen",
+        description=__doc__.splitlines()[0],
+    )
+    parser.add_argument("command", choices=["list", "thaw"])
+    parser.add_argument("services", nargs="*", help="iso3/version, e.g. afg/v01")
+    args = parser.parse_args()
+    if not PORTOLAN_WORK_DIR:
+        parser.error("PORTOLAN_WORK_DIR must be set")
+    work_dir = Path(PORTOLAN_WORK_DIR).resolve()
+    if args.command == "list":
+        for key in sorted(frozen_services(work_dir)):
+            print(key)  # noqa: T201
+        return
+    if not args.services:
+        parser.error("thaw needs at least one iso3/version")
+    thaw(work_dir, args.services)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+    main()
@@ -19,9 +19,11 @@ from subprocess import CalledProcessError
 
 import duckdb
 
+from . import catalog_docs, catalog_index
 from .config import PORTOLAN_WORKERS
 from .extended import _write_gpq2
-from .original import _portolan
+from .original import read_catalog
+from .portolan_api import portolan
 
 logger = logging.getLogger(__name__)
 
@@ -49,20 +51,11 @@ def _latest_versioned_per_iso3(work_dir: Path) -> dict[str, Path]:
     considered for the global composite.
     """
     best: dict[str, tuple[int, Path]] = {}
-    for country_dir in work_dir.iterdir():
-        if not country_dir.is_dir() or country_dir.name.startswith("."):
-            continue
-        if country_dir.name == "wld":
-            continue
-        iso3 = country_dir.name
-        for version_dir in country_dir.iterdir():
-            if not version_dir.is_dir() or version_dir.name.startswith("."):
-                continue
-            v = version_dir.name
-            if v.startswith("v") and v[1:].isdigit():
-                n = int(v[1:])
-                if iso3 not in best or n > best[iso3][0]:
-                    best[iso3] = (n, version_dir)
+    for iso3, v in catalog_index.services(work_dir):
+        if v.startswith("v") and v[1:].isdigit():
+            n = int(v[1:])
+            if iso3 not in best or n > best[iso3][0]:
+                best[iso3] = (n, work_dir / iso3 / v)
     return {iso3: info[1] for iso3, info in best.items()}
 
 
@@ -73,13 +66,9 @@ def _get_service_meta(version_dir: Path) -> dict | None:
     """
     iso3_lower = version_dir.parent.name
     available = [
-        int(d.name[3:])
-        for d in version_dir.iterdir()
-        if d.is_dir()
-        and d.name.startswith("adm")
-        and d.name[3:].isdigit()
-        and d.name != "adm0"
-        and (d / "matched.parquet").exists()
+        int(name[3:])
+        for name in catalog_index.layers_with(version_dir, "matched.parquet")
+        if name.startswith("adm") and name[3:].isdigit() and name != "adm0"
     ]
     if not available:
         logger.warning(
@@ -91,12 +80,10 @@ def _get_service_meta(version_dir: Path) -> dict | None:
     level = max(available)
     parquet_path = version_dir / f"adm{level}" / "matched.parquet"
     extended_updated: dict[str, str] = {}
-    catalog_path = version_dir / "catalog.json"
-    if catalog_path.exists():
-        with contextlib.suppress(json.JSONDecodeError, TypeError, KeyError):
-            raw = json.loads(catalog_path.read_text()).get("cod_ab:extended_updated")
-            if raw:
-                extended_updated = json.loads(raw)
+    with contextlib.suppress(json.JSONDecodeError, TypeError, KeyError):
+        raw = read_catalog(version_dir).get("cod_ab:extended_updated")
+        if raw:
+            extended_updated = json.loads(raw)
     return {
         "service_name": f"{iso3_lower}/{version_dir.name}",
         "service_dir": version_dir,
@@ -269,17 +256,12 @@ def _build_parquets(services_meta: list[dict], wld_dir: Path) -> None:
 
 def _fix_stale_wld_link(work_dir: Path) -> None:
     """Replace wld/catalog.json link with wld/collection.json in root catalog."""
-    root = work_dir / "catalog.json"
-    if not root.exists():
+    data = catalog_docs.load(work_dir / "catalog.json")
+    if data is None:
         return
-    data = json.loads(root.read_text())
-    changed = False
     for link in data.get("links", []):
         if link.get("href") == "./wld/catalog.json":
             link["href"] = "./wld/collection.json"
-            changed = True
-    if changed:
-        root.write_text(json.dumps(data, indent=2))
 
 
 def _build_catalog(_wld_dir: Path, work_dir: Path) -> None:
@@ -287,22 +269,22 @@ def _build_catalog(_wld_dir: Path, work_dir: Path) -> None:
     _fix_stale_wld_link(work_dir)
     workers = str(PORTOLAN_WORKERS)
     try:
-        _portolan(
-            ["add", "wld/", "--workers", workers, "--pmtiles"],
+        portolan(
+            ["add", f"{work_dir / 'wld'}/", "--workers", workers, "--pmtiles"],
             cwd=work_dir,
         )
     except CalledProcessError:
         logger.exception("portolan add failed for wld/")
     try:
-        _portolan(["stac-geoparquet"], cwd=work_dir)
+        portolan(["stac-geoparquet"], cwd=work_dir)
     except CalledProcessError:
         logger.warning("portolan stac-geoparquet: no items — skipping")
     try:
-        _portolan(["check", "--metadata", "--fix"], cwd=work_dir)
+        portolan(["check", "--metadata", "--fix"], cwd=work_dir)
     except CalledProcessError:
         logger.warning("portolan check --metadata --fix returned errors (continuing)")
     try:
-        _portolan(["readme"], cwd=work_dir)
+        portolan(["readme"], cwd=work_dir)
     except CalledProcessError:
         logger.warning("portolan readme failed (continuing)")
 
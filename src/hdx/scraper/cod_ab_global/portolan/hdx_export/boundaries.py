@@ -34,6 +34,7 @@ from tempfile import TemporaryDirectory
 import duckdb
 from hdx.location.country import Country
 
+from .. import catalog_index  # noqa: TID252
 from .services import iter_included_version_dirs
 
 logger = logging.getLogger(__name__)
@@ -105,11 +106,8 @@ def _deepest_level(
     version_dir: Path, stage: str, min_level: int, max_level: int
 ) -> int | None:
     """Return the highest N in [min_level, max_level] with adm{N}/{stage}.parquet."""
-    levels = [
-        n
-        for n in range(min_level, max_level + 1)
-        if (version_dir / f"adm{n}" / f"{stage}.parquet").exists()
-    ]
+    present = set(catalog_index.layers_with(version_dir, f"{stage}.parquet"))
+    levels = [n for n in range(min_level, max_level + 1) if f"adm{n}" in present]
     return max(levels) if levels else None
 
 
@@ -13,9 +13,9 @@ from pathlib import Path
 
 from pandas import DataFrame, to_datetime
 
-from hdx.scraper.cod_ab_global.portolan.original import read_catalog
 from hdx.scraper.cod_ab_global.utils import save_metadata
 
+from .. import catalog_index  # noqa: TID252
 from .services import iter_included_version_dirs
 
 # Reads catalog.json fields written at the "original" stage — see
@@ -81,7 +81,7 @@ _COLUMNS = [
 
 def _read_service_row(version_dir: Path) -> dict | None:
     """Return a metadata row dict from one service's catalog.json, or None."""
-    data = read_catalog(version_dir)
+    data = catalog_index.service_props(version_dir)
     if not data:
         return None
     return {col: data.get(f"cod_ab:{col}") for col in _COLUMNS}
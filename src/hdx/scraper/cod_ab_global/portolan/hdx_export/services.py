@@ -13,52 +13,13 @@ be wired into portolan/utils.py::list_services(), which stays a full,
 unconditional mirror of every ArcGIS service to source.coop.
 """
 
-import re
 from pathlib import Path
 
 from hdx.scraper.cod_ab_global.config import iso3_exclude, iso3_include
 
-_ISO3_LEN = 3
-_VERSION_RE = re.compile(r"^v(\d+)$")
-
-
-def _iter_version_dirs(work_dir: Path) -> list[tuple[str, int, Path]]:
-    """Return [(iso3, version_num, version_dir), ...] for every versioned service."""
-    result = []
-    for country_dir in sorted(work_dir.iterdir()):
-        if not country_dir.is_dir() or country_dir.name.startswith("."):
-            continue
-        if country_dir.name == "wld":
-            continue
-        iso3 = country_dir.name
-        for version_dir in sorted(country_dir.iterdir()):
-            if not version_dir.is_dir() or version_dir.name.startswith("."):
-                continue
-            match = _VERSION_RE.match(version_dir.name)
-            if match:
-                result.append((iso3, int(match.group(1)), version_dir))
-    return result
-
-
-def _partition_by_version(
-    work_dir: Path,
-) -> tuple[dict[str, Path], dict[str, list[Path]]]:
-    """Return (latest, historic) service dirs per iso3, before ISO3 filtering.
+from ..utils import partition_by_version  # noqa: TID252
 
-    latest: {iso3: version_dir} for the highest vNN per country.
-    historic: {iso3: [version_dir, ...]} for all lower vNN, ascending order.
-    """
-    by_iso3: dict[str, list[tuple[int, Path]]] = {}
-    for iso3, num, version_dir in _iter_version_dirs(work_dir):
-        by_iso3.setdefault(iso3, []).append((num, version_dir))
-
-    latest: dict[str, Path] = {}
-    historic: dict[str, list[Path]] = {}
-    for iso3, versions in by_iso3.items():
-        versions.sort(key=lambda v: v[0])
-        historic[iso3] = [v[1] for v in versions[:-1]]
-        latest[iso3] = versions[-1][1]
-    return latest, historic
+_ISO3_LEN = 3
 
 
 def _iso3_version_key(iso3_upper: str, version_dir: Path) -> str:
@@ -118,7 +79,7 @@ def resolve_services(work_dir: Path, run_version: str) -> dict[str, list[Path]]:
     run_version: "latest" (one version_dir per iso3) or "historic" (zero or
     more version_dirs per iso3 — every version below the highest).
     """
-    latest, historic = _partition_by_version(work_dir)
+    latest, historic = partition_by_version(work_dir)
     filtered_latest, filtered_historic = _apply_iso3_filter(latest, historic)
     if run_version == "latest":
         return {iso3: [d] for iso3, d in filtered_latest.items()}
@@ -9,7 +9,7 @@ entirely when nothing in its scope has changed since the last successful
 build.
 
 State is stored outside the portolan catalog tree — sibling to `.bnda` — so
-`portolan push`/`aws s3 sync` never touches it.
+push never touches it.
 
 Callers pass the upstream `cod_ab:*_updated` field their resource actually
 depends on (see portolan/extended.py and portolan/matched.py's own
@@ -23,11 +23,12 @@ from pathlib import Path
 
 from hdx.scraper.cod_ab_global.config import iso3_exclude, iso3_include
 from hdx.scraper.cod_ab_global.portolan.original import (
-    read_catalog,
     read_json_state,
     write_json_state,
 )
 
+from .. import catalog_index  # noqa: TID252
+
 _STATE_FILE = "state.json"
 
 
@@ -54,7 +55,9 @@ def build_fingerprint(
     filter-only change (no underlying data change) still triggers a rebuild.
     """
     services_fp = {
-        f"{iso3}/{version_dir.name}": read_catalog(version_dir).get(fingerprint_key)
+        f"{iso3}/{version_dir.name}": catalog_index.service_props(version_dir).get(
+            fingerprint_key
+        )
         for iso3, version_dir in version_dirs
     }
     return {
@@ -0,0 +1,128 @@
+"""Persistent on-disk cache for ArcGIS JSON descriptions.
+
+Service directory, FeatureServer and layer descriptions rarely change between
+runs. `fetch_json` and the probe store each body here with its ETag and
+Last-Modified validators, and send them back as If-None-Match /
+If-Modified-Since on the next request; a 304 answer is served from disk.
+
+ARCGIS_HTTP_CACHE_MODE selects the behaviour:
+
+  conditional  (default) always revalidate with the server
+  ttl          serve entries younger than ARCGIS_HTTP_CACHE_TTL seconds
+               without any request. Only these descriptions are skipped:
+               metadata, count and feature queries and token generation
+               still go to ArcGIS, so this is not an offline mode
+  off          bypass the cache
+
+Entries live in `.http_cache/` beside the work dir — outside the catalog tree,
+like `.bnda` and `.hdx_export` — keyed by URL (the token is never part of the
+key or the stored entry). Without PORTOLAN_WORK_DIR the cache is disabled.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import httpx
+
+from .config import ARCGIS_HTTP_CACHE_MODE, ARCGIS_HTTP_CACHE_TTL, PORTOLAN_WORK_DIR
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheEntry:
+    """One cached JSON body and the validators it was served with."""
+
+    url: str
+    body: dict
+    fetched_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def _cache_dir() -> Path | None:
+    if ARCGIS_HTTP_CACHE_MODE == "off" or not PORTOLAN_WORK_DIR:
+        return None
+    cache_dir = Path(PORTOLAN_WORK_DIR).parent / ".http_cache"
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return cache_dir
+
+
+def _entry_path(cache_dir: Path, url: str) -> Path:
+    return cache_dir / f"{hashlib.sha256(url.encode()).hexdigest()}.json"
+
+
+def lookup(url: str) -> CacheEntry | None:
+    """Return the cached entry for url, or None."""
+    cache_dir = _cache_dir()
+    if cache_dir is None:
+        return None
+    path = _entry_path(cache_dir, url)
+    if not path.exists():
+        return None
+    try:
+        return CacheEntry(**json.loads(path.read_text()))
+    except (json.JSONDecodeError, OSError, TypeError):
+        return None
+
+
+def is_fresh(entry: CacheEntry | None) -> bool:
+    """Return True if entry may be served without contacting the server."""
+    return (
+        entry is not None
+        and ARCGIS_HTTP_CACHE_MODE == "ttl"
+        and time.time() - entry.fetched_at < ARCGIS_HTTP_CACHE_TTL
+    )
+
+
+def validators(entry: CacheEntry | None) -> dict[str, str]:
+    """Return conditional request headers for entry."""
+    headers = {}
+    if entry is not None and entry.etag:
+        headers["If-None-Match"] = entry.etag
+    if entry is not None and entry.last_modified:
+        headers["If-Modified-Since"] = entry.last_modified
+    return headers
+
+
+def _write(entry: CacheEntry) -> None:
+    cache_dir = _cache_dir()
+    if cache_dir is None:
+        return
+    path = _entry_path(cache_dir, entry.url)
+    tmp = path.with_name(f".{path.name}.tmp")
+    try:
+        tmp.write_text(json.dumps(asdict(entry)))
+        tmp.replace(path)
+    except OSError:
+        logger.warning("Could not write HTTP cache entry for %s", entry.url)
+
+
+def resolve(url: str, entry: CacheEntry | None, response: httpx.Response) -> dict:
+    """Return the body for a (possibly conditional) response, updating the cache.
+
+    A 304 refreshes the cached entry's timestamp and returns its body. Other
+    responses must be successful; their JSON is stored unless it is an
+    ArcGIS error payload.
+    """
+    if response.status_code == httpx.codes.NOT_MODIFIED and entry is not None:
+        entry.fetched_at = time.time()
+        _write(entry)
+        return entry.body
+    response.raise_for_status()
+    body = response.json()
+    if "error" not in body:
+        _write(
+            CacheEntry(
+                url=url,
+                body=body,
+                fetched_at=time.time(),
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+            )
+        )
+    return body
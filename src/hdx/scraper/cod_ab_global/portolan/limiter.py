@@ -0,0 +1,168 @@
+"""Adaptive concurrency, per-service circuit breaking and payload-scaled timeouts.
+
+Every synchronous ArcGIS request goes through the shared transport in
+`client.py`, which asks this module for a slot before sending and reports
+back once the response body has been read:
+
+- AIMD limiter: at most `limit` requests are in flight. Each healthy
+  response raises the limit by 1/limit (about +1 per round of requests);
+  a 429/5xx, a transport error or timeout, or a response that took more
+  than ARCGIS_AIMD_SLOW_FRACTION of its own timeout multiplies it by
+  ARCGIS_AIMD_BACKOFF — at most once per observed latency, so one burst of
+  failures is one decrease. Extraction threads beyond the limit simply wait,
+  so a degraded server sees fewer requests instead of a fixed 16-thread load.
+- Circuit breaker: after ARCGIS_BREAKER_FAILURES consecutive transport
+  errors or 5xx answers for one hosted service, further requests for it
+  fail immediately with `CircuitOpenError` for the rest of the run. Its
+  remaining layers are skipped like any failed layer — no stale parquet is
+  left behind — so they are extracted again on the next run.
+- `payload_timeout(features)` sizes a query's timeout from the number of
+  features it asks for, so small pages fail fast and the largest still get
+  up to ARCGIS_EXTRACT_TIMEOUT. Because timeouts track payload, "slow" above
+  is a payload-normalised latency signal.
+
+The async probe client is bounded by ARCGIS_PROBE_CONCURRENCY instead and
+does not use the limiter.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+
+import httpx
+
+from .config import (
+    ARCGIS_AIMD,
+    ARCGIS_AIMD_BACKOFF,
+    ARCGIS_AIMD_INITIAL,
+    ARCGIS_AIMD_SLOW_FRACTION,
+    ARCGIS_BREAKER_FAILURES,
+    ARCGIS_EXTRACT_TIMEOUT,
+    ARCGIS_MAX_CONNECTIONS,
+    ARCGIS_TIMEOUT,
+    ARCGIS_TIMEOUT_PER_1K_FEATURES,
+)
+
+logger = logging.getLogger(__name__)
+
+_SERVICE_RE = re.compile(r"/Hosted/([^/]+)/", re.IGNORECASE)
+# Timeouts are rounded up to this step so get_client keeps few clients
+_TIMEOUT_STEP = 15.0
+
+
+class CircuitOpenError(httpx.RequestError):
+    """The service's circuit breaker is open; the request was not sent."""
+
+
+def payload_timeout(features: int | None) -> float:
+    """Return a request timeout for a query expected to return `features`."""
+    if not features:
+        return float(ARCGIS_EXTRACT_TIMEOUT)
+    seconds = ARCGIS_TIMEOUT + ARCGIS_TIMEOUT_PER_1K_FEATURES * features / 1000
+    seconds = math.ceil(seconds / _TIMEOUT_STEP) * _TIMEOUT_STEP
+    return float(min(seconds, ARCGIS_EXTRACT_TIMEOUT))
+
+
+def service_of(url: httpx.URL) -> str | None:
+    """Return the lower-cased hosted service name a request URL targets."""
+    match = _SERVICE_RE.search(url.path)
+    return match.group(1).lower() if match else None
+
+
+class _AimdLimiter:
+    """Additive-increase / multiplicative-decrease bound on in-flight requests."""
+
+    def __init__(self, initial: float, maximum: float) -> None:
+        self._limit = max(1.0, min(initial, maximum))
+        self._maximum = maximum
+        self._in_flight = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    def release(self, seconds: float, *, congested: bool) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if not congested:
+                self._limit = min(self._maximum, self._limit + 1 / self._limit)
+            elif now - self._last_decrease > seconds:
+                self._last_decrease = now
+                self._limit = max(1.0, self._limit * ARCGIS_AIMD_BACKOFF)
+                logger.info("ArcGIS congested — in-flight limit now %d", self._limit)
+            self._cond.notify_all()
+
+
+class _Breakers:
+    """Consecutive-failure counters per hosted service; open ones stay open."""
+
+    def __init__(self, threshold: int) -> None:
+        self._threshold = threshold
+        self._failures: dict[str, int] = {}
+        self._open: set[str] = set()
+        self._lock = threading.Lock()
+
+    def is_open(self, service: str | None) -> bool:
+        with self._lock:
+            return service in self._open
+
+    def record(self, service: str | None, *, failed: bool) -> None:
+        if service is None:
+            return
+        with self._lock:
+            if not failed:
+                self._failures.pop(service, None)
+                return
+            self._failures[service] = self._failures.get(service, 0) + 1
+            if self._failures[service] >= self._threshold and service not in self._open:
+                self._open.add(service)
+                logger.warning(
+                    "%s failed %d times in a row — circuit open until next run",
+                    service,
+                    self._failures[service],
+                )
+
+    def open_services(self) -> set[str]:
+        with self._lock:
+            return set(self._open)
+
+
+_limiter = (
+    _AimdLimiter(ARCGIS_AIMD_INITIAL, ARCGIS_MAX_CONNECTIONS) if ARCGIS_AIMD else None
+)
+_breakers = _Breakers(ARCGIS_BREAKER_FAILURES)
+
+
+def open_services() -> set[str]:
+    """Return the lower-cased names of services whose breaker tripped."""
+    return _breakers.open_services()
+
+
+def acquire(request: httpx.Request) -> None:
+    """Wait for an in-flight slot; raise CircuitOpenError if the service is open."""
+    if _breakers.is_open(service_of(request.url)):
+        msg = f"circuit open for {service_of(request.url)}"
+        raise CircuitOpenError(msg, request=request)
+    if _limiter is not None:
+        _limiter.acquire()
+
+
+def release(request: httpx.Request, seconds: float, status: int | None) -> None:
+    """Report a finished request: status None means a transport error."""
+    server_error = status is None or status >= 500  # noqa: PLR2004
+    timeout = (request.extensions.get("timeout") or {}).get("read") or ARCGIS_TIMEOUT
+    congested = (
+        server_error
+        or status == 429  # noqa: PLR2004
+        or seconds > ARCGIS_AIMD_SLOW_FRACTION * timeout
+    )
+    _breakers.record(service_of(request.url), failed=server_error)
+    if _limiter is not None:
+        _limiter.release(seconds, congested=congested)
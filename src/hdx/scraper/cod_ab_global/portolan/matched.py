@@ -5,8 +5,9 @@ BNDA download), clips each admin layer to UN 1:1M international boundaries,
 and injects matched assets into each layer's collection.json.
 
 Admin0 is excluded — clipping a country boundary to its own reference is
-redundant. Change detection uses the extended layers' updated timestamps; a
-service is re-clipped only when its extended catalog has changed.
+redundant. Change detection uses the admin layers' data timestamps (see
+`layer_data_updated` in utils.py); a service is re-clipped only when they
+have moved since its last clip.
 """
 
 import contextlib
@@ -19,23 +20,26 @@ from pathlib import Path
 import duckdb
 import geoparquet_io as gpio
 
+from . import catalog_docs, catalog_index
 from .config import ARCGIS_SERVICES_URL, PORTOLAN_WORKERS
 from .extended import (
-    _ADMIN_POLYGON_RE,
     _enumerate_services,
-    _get_admin_updated_map,
     _write_gpq2,
 )
+from .frozen import frozen_services, service_key
 from .original import (
     _generate_variant_pmtiles,
     inject_variant_assets,
+    link_twin_files,
+    read_aliases,
     read_catalog,
 )
-from .utils import generate_token
+from .utils import ADMIN_POLYGON_RE, generate_token, get_admin_updated_map
 
 logger = logging.getLogger(__name__)
 
 _BNDA_URL = f"{ARCGIS_SERVICES_URL}/Global_AB_1M_fs_gray/FeatureServer/5"
+_MATCHED_FILES = ("matched.parquet", "matched.pmtiles")
 
 
 def _load_stored_extended_updated(version_dir: Path) -> dict[str, str]:
@@ -87,7 +91,7 @@ def _ensure_bnda(work_dir: Path) -> Path:
     """Return path to bnda_cty.parquet, downloading if absent.
 
     Stored at work_dir.parent/.bnda/ — outside the portolan catalog tree — so
-    it can never be swept up by portolan push or aws s3 sync.
+    it can never be swept up by push.
     """
     bnda_dir = work_dir.parent / ".bnda"
     bnda_dir.mkdir(exist_ok=True)
@@ -102,7 +106,7 @@ def _ensure_bnda(work_dir: Path) -> Path:
         clean_path = Path(tmp) / "bnda_clean.parquet"
         table.write(str(raw_path), compression_level=15, geoparquet_version="2.0")
         _clean_bnda(raw_path, clean_path)
-        _write_gpq2(clean_path, bnda_path)
+        _write_gpq2(clean_path, bnda_path, tiered=False)
     logger.info("Saved BNDA to %s", bnda_path)
     return bnda_path
 
@@ -215,14 +219,11 @@ def _process_service(
     Returns True on success. Removes stale matched parquets before writing new
     ones so shrinking admin_level_full doesn't leave orphan files.
     """
-    layers = sorted(
-        d
-        for d in version_dir.iterdir()
-        if d.is_dir()
-        and _ADMIN_POLYGON_RE.match(d.name)
-        and d.name != "adm0"
-        and (d / "extended.parquet").exists()
-    )
+    layers = [
+        version_dir / name
+        for name in catalog_index.layers_with(version_dir, "extended.parquet")
+        if ADMIN_POLYGON_RE.match(name) and name != "adm0"
+    ]
     if not layers:
         logger.warning(
             "No adm1+ extended layers found for %s/%s — skipping", iso3, version
@@ -235,6 +236,7 @@ def _process_service(
         if stale_dir.exists():
             for stale in ("matched.parquet", "matched.pmtiles"):
                 (stale_dir / stale).unlink(missing_ok=True)
+            catalog_index.refresh(stale_dir / "matched.parquet")
 
     try:
         for layer_dir in layers:
@@ -249,13 +251,25 @@ def _process_service(
     return True
 
 
+def _link_from_twin(
+    version_dir: Path, twin_dir: Path, extended_map: dict[str, str]
+) -> bool:
+    """Reuse the versioned twin's matched outputs for a mirrored latest service.
+
+    Only valid when the twin was clipped from the same extended layers;
+    returns False otherwise so the caller clips the layers itself.
+    """
+    if _load_stored_extended_updated(twin_dir) != extended_map:
+        return False
+    link_twin_files(twin_dir, version_dir, _MATCHED_FILES)
+    return True
+
+
 def _enrich_matched_catalog(version_dir: Path, extended_map: dict[str, str]) -> None:
     """Write cod_ab:extended_updated marker into the version catalog.json."""
-    catalog_path = version_dir / "catalog.json"
-    if catalog_path.exists() and extended_map:
-        data = json.loads(catalog_path.read_text())
+    data = catalog_docs.load(version_dir / "catalog.json")
+    if data is not None and extended_map:
         data["cod_ab:extended_updated"] = json.dumps(extended_map)
-        catalog_path.write_text(json.dumps(data, indent=2))
 
 
 def _inject_all_matched_assets(version_dir: Path, workers: str) -> None:
@@ -266,7 +280,7 @@ def _inject_all_matched_assets(version_dir: Path, workers: str) -> None:
     matched assets.
     """
     for layer_dir in sorted(version_dir.iterdir()):
-        if not layer_dir.is_dir() or not _ADMIN_POLYGON_RE.match(layer_dir.name):
+        if not layer_dir.is_dir() or not ADMIN_POLYGON_RE.match(layer_dir.name):
             continue
         if layer_dir.name == "adm0":
             continue
@@ -289,16 +303,27 @@ def run(work_dir: Path) -> None:
     bnda_path = _ensure_bnda(work_dir)
     workers = str(PORTOLAN_WORKERS)
 
+    # Frozen services are settled: their markers and assets are already current
+    frozen = frozen_services(work_dir)
+    # Latest services that mirror a v{NN} twin go last, so the twin is done first
+    aliases = read_aliases(work_dir)
+    services.sort(key=lambda s: service_key(*s) in aliases)
     for iso3, version in services:
+        if service_key(iso3, version) in frozen:
+            continue
         version_dir = work_dir / iso3 / version
-        extended_map = _get_admin_updated_map(version_dir)
+        extended_map = get_admin_updated_map(version_dir)
         if not extended_map:
             continue
 
         stored = _load_stored_extended_updated(version_dir)
         if extended_map != stored:
             logger.info("Processing matched for %s/%s", iso3, version)
-            if _process_service(iso3, version, version_dir, bnda_path):
+            twin = aliases.get(service_key(iso3, version))
+            if (
+                twin
+                and _link_from_twin(version_dir, work_dir / iso3 / twin, extended_map)
+            ) or _process_service(iso3, version, version_dir, bnda_path):
                 _enrich_matched_catalog(version_dir, extended_map)
             else:
                 logger.warning(
@@ -311,3 +336,4 @@ def run(work_dir: Path) -> None:
 
         # portolan add regenerates collection.json — always re-inject matched assets
         _inject_all_matched_assets(version_dir, workers)
+    catalog_docs.flush()
@@ -7,38 +7,84 @@ and S3 push.
 
 import json
 import logging
+import os
 import re
-import sys
-import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import UTC, datetime
+from collections import defaultdict, deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from datetime import UTC, datetime, timedelta
+from functools import partial
+from itertools import chain
+from multiprocessing import get_context
 from pathlib import Path
-from shutil import copy, rmtree
+from shutil import rmtree
 from subprocess import CalledProcessError
-from subprocess import run as _run
 from textwrap import dedent
 
-import geoparquet_io as gpio
+import httpx
 import yaml
 from hdx.location.country import Country
 
 from hdx.scraper.cod_ab_global.config import date_valid_on_overrides
 
+from . import catalog_docs, catalog_index
+from .compaction import link_tier
 from .config import (
+    ARCGIS_BULK_EXPORT,
+    ARCGIS_DELTA_EXTRACT,
+    ARCGIS_FINGERPRINT,
+    ARCGIS_FULL_PROBE_HOURS,
+    ARCGIS_PROBE_PREFILTER,
     ARCGIS_SERVICES_URL,
+    PORTOLAN_ADD_PROCESSES,
+    PORTOLAN_ENCODE_WORKERS,
+    PORTOLAN_EXTRACT_WORKERS,
     PORTOLAN_WORKERS,
 )
-from .utils import fetch_json, fetch_metadata_table, generate_token, list_services
+from .extract import (
+    encode_layer,
+    extract_delta,
+    extract_layer,
+    ids_path,
+    precision_grid,
+    remove_spill,
+)
+from .frozen import frozen_services, service_key, thawed_services
+from .limiter import open_services
+from .portolan_api import collect_worker, generate_pmtiles, portolan, run_in_worker
+from .probe import LayerFingerprint, LayerProbe, fingerprint_layers, probe_services
+from .replica import ReplicaError, export_service
+from .utils import (
+    COD_AB_METADATA_FIELDS,
+    fetch_metadata_table,
+    generate_token,
+    list_services,
+)
 
 logger = logging.getLogger(__name__)
 
 _CATALOG_TITLE = "COD-AB Administrative Boundaries"
 
-_PORTOLAN = str(Path(sys.executable).parent / "portolan")
-
+# COD_Global_Metadata fields that move whenever a service's data is republished.
+# Compared against catalog.json's cod_ab:* copies to decide whether a service's
+# layers need probing at all.
+_PREFILTER_FIELDS = ("date_updated", "date_metadata", "date_valid_to")
 
-def _portolan(args: list[str], cwd: Path) -> None:
-    _run([_PORTOLAN, *args], cwd=cwd, check=True)
+# Layer collection.json properties written from the checksum fingerprint
+_STATS_PROPS = (
+    "cod_ab:stats_fingerprint",
+    "cod_ab:geometry_updated",
+    "cod_ab:attributes_updated",
+)
+# Grid size in degrees the layer's geometries were snapped to (absent: none)
+_GRID_PROP = "cod_ab:precision_grid"
 
 
 def _service_to_path(service_name: str) -> tuple[str, str]:
@@ -86,50 +132,12 @@ def _write_catalog_metadata(catalog_dir: Path) -> None:
     )
 
 
-# All meaningful fields from COD_Global_Metadata (mirrors refactor.py's column list).
-# Written as cod_ab:* custom STAC properties so the table is reconstructable from
-# the catalog.
-_COD_AB_METADATA_FIELDS = [
-    "country_name",
-    "country_iso2",
-    "country_iso3",
-    "version",
-    "admin_level_full",
-    "admin_level_max",
-    "admin_1_name",
-    "admin_2_name",
-    "admin_3_name",
-    "admin_4_name",
-    "admin_5_name",
-    "admin_1_count",
-    "admin_2_count",
-    "admin_3_count",
-    "admin_4_count",
-    "admin_5_count",
-    "admin_notes",
-    "date_source",
-    "date_updated",
-    "date_reviewed",
-    "date_metadata",
-    "date_valid_on",
-    "date_valid_to",
-    "update_frequency",
-    "update_type",
-    "source",
-    "contributor",
-    "methodology_dataset",
-    "methodology_pcodes",
-    "caveats",
-]
-
-
 def _enrich_service_catalog(service_dir: Path, meta: dict) -> None:
     """Write COD_Global_Metadata fields as cod_ab:* properties in catalog.json."""
-    catalog_path = service_dir / "catalog.json"
-    if not catalog_path.exists():
+    data = catalog_docs.load(service_dir / "catalog.json")
+    if data is None:
         return
-    data = json.loads(catalog_path.read_text())
-    for field in _COD_AB_METADATA_FIELDS:
+    for field in COD_AB_METADATA_FIELDS:
         value = meta.get(field)
         if value is not None and str(value).strip():
             data[f"cod_ab:{field}"] = value
@@ -140,7 +148,6 @@ def _enrich_service_catalog(service_dir: Path, meta: dict) -> None:
             data["cod_ab:country_iso2"] = iso2
     if "cod_ab:date_valid_on" not in data and iso3 in date_valid_on_overrides:
         data["cod_ab:date_valid_on"] = date_valid_on_overrides[iso3]
-    catalog_path.write_text(json.dumps(data, indent=2))
 
 
 def _write_service_metadata(
@@ -194,11 +201,12 @@ def _last_edit_to_iso(ms: int) -> str:
     return datetime.fromtimestamp(ms / 1000, tz=UTC).isoformat(timespec="milliseconds")
 
 
+def _read_collection(layer_dir: Path) -> dict:
+    return catalog_docs.load(layer_dir / "collection.json") or {}
+
+
 def _read_stored_updated(layer_dir: Path) -> str | None:
-    collection_path = layer_dir / "collection.json"
-    if not collection_path.exists():
-        return None
-    return json.loads(collection_path.read_text()).get("updated")
+    return _read_collection(layer_dir).get("updated")
 
 
 def read_catalog(version_dir: Path) -> dict:
@@ -208,11 +216,8 @@ def read_catalog(version_dir: Path) -> dict:
     fingerprinting/metadata readers so there's one place that knows how to
     open a service's catalog.json.
     """
-    catalog_path = version_dir / "catalog.json"
-    if not catalog_path.exists():
-        return {}
     try:
-        return json.loads(catalog_path.read_text())
+        return catalog_docs.load(version_dir / "catalog.json") or {}
     except json.JSONDecodeError:
         return {}
 
@@ -237,14 +242,16 @@ def write_json_state(path: Path, data: dict) -> None:
     path.write_text(json.dumps(data, indent=2, sort_keys=True))
 
 
-def _enrich_layer_collection(layer_dir: Path, updated_iso: str) -> None:
-    """Write the STAC updated field into a layer collection.json."""
-    collection_path = layer_dir / "collection.json"
-    if not collection_path.exists():
+def _enrich_layer_collection(
+    layer_dir: Path, updated_iso: str | None, props: dict | None = None
+) -> None:
+    """Write the STAC updated field and cod_ab:* props into a layer collection.json."""
+    data = catalog_docs.load(layer_dir / "collection.json")
+    if data is None:
         return
-    data = json.loads(collection_path.read_text())
-    data["updated"] = updated_iso
-    collection_path.write_text(json.dumps(data, indent=2))
+    if updated_iso is not None:
+        data["updated"] = updated_iso
+    data.update(props or {})
 
 
 def inject_variant_assets(collection_path: Path, suffix: str) -> None:
@@ -253,9 +260,9 @@ def inject_variant_assets(collection_path: Path, suffix: str) -> None:
     Uses portolan's native asset key convention: {suffix} for data,
     {suffix}-tiles for visual tiles.
     """
-    if not collection_path.exists():
+    data = catalog_docs.load(collection_path)
+    if data is None:
         return
-    data = json.loads(collection_path.read_text())
     assets = data.setdefault("assets", {})
     title = suffix.capitalize()
     assets[suffix] = {
@@ -270,31 +277,15 @@ def inject_variant_assets(collection_path: Path, suffix: str) -> None:
         "title": f"{title} (tiles)",
         "roles": ["visual"],
     }
-    collection_path.write_text(json.dumps(data, indent=2))
 
 
 def _generate_variant_pmtiles(
     variant_parquet: Path, layer_dir: Path, workers: str
 ) -> None:
-    """Generate PMTiles for a variant parquet via an isolated temp portolan catalog."""
+    """Generate PMTiles for a variant parquet beside it in layer_dir."""
     stem = variant_parquet.stem  # "extended" or "matched"
-    with tempfile.TemporaryDirectory(prefix="portolan-pmtiles-") as tmp:
-        tmp_path = Path(tmp)
-        tmp_layer = tmp_path / "svc" / stem
-        tmp_layer.mkdir(parents=True)
-        copy(variant_parquet, tmp_layer / variant_parquet.name)
-        _portolan(["init", "--title", "tmp", "--auto"], cwd=tmp_path)
-        try:
-            _portolan(
-                ["add", f"svc/{stem}/", "--workers", workers, "--pmtiles"],
-                cwd=tmp_path,
-            )
-        except CalledProcessError:
-            logger.warning("PMTiles generation failed for %s", variant_parquet.name)
-            return
-        src = tmp_layer / f"{stem}.pmtiles"
-        if src.exists():
-            copy(src, layer_dir / f"{stem}.pmtiles")
+    if not generate_pmtiles(variant_parquet, layer_dir / f"{stem}.pmtiles", workers):
+        logger.warning("PMTiles generation failed for %s", variant_parquet.name)
 
 
 def _hide_variant_files(version_dir: Path) -> list[tuple[Path, Path]]:
@@ -318,109 +309,597 @@ def _restore_hidden_files(hidden: list[tuple[Path, Path]]) -> None:
             h.rename(p)
 
 
-def _extract_service(
-    service_name: str,
-    token: str,
+def _state_path(work_dir: Path, name: str) -> Path:
+    """Original-stage state file, outside the catalog tree like `.bnda`."""
+    state_dir = work_dir.parent / ".original"
+    state_dir.mkdir(exist_ok=True)
+    return state_dir / name
+
+
+def _metadata_unchanged(version_dir: Path, meta: dict | None) -> bool:
+    """Return True if a service's metadata row matches its catalog.json.
+
+    Also requires every layer directory to hold an original.parquet, so a
+    layer whose extraction failed is retried instead of waiting for the next
+    full probe.
+    """
+    catalog = read_catalog(version_dir)
+    if not catalog or not meta:
+        return False
+    for field in _PREFILTER_FIELDS:
+        value = meta.get(field)
+        expected = value if value is not None and str(value).strip() else None
+        if catalog.get(f"cod_ab:{field}") != expected:
+            return False
+    return all(
+        (layer_dir / "original.parquet").exists()
+        for layer_dir in version_dir.iterdir()
+        if layer_dir.is_dir() and not layer_dir.name.startswith(".")
+    )
+
+
+def _services_to_probe(
+    services: list[str], metadata: dict[str, dict], work_dir: Path
+) -> tuple[list[str], bool]:
+    """Return (services whose layers need probing, whether that is all of them).
+
+    With ARCGIS_PROBE_PREFILTER, services whose COD_Global_Metadata dates
+    still match their catalog.json are left out. Every
+    ARCGIS_FULL_PROBE_HOURS a full probe runs regardless, to catch layer
+    edits that were never reflected in the metadata table. Thawed services
+    (see frozen.py) are always probed.
+    """
+    services = sorted(services)
+    if not ARCGIS_PROBE_PREFILTER:
+        return services, True
+    last_full = read_json_state(_state_path(work_dir, "state.json")).get(
+        "last_full_probe"
+    )
+    if last_full is None or datetime.now(UTC) - datetime.fromisoformat(
+        last_full
+    ) >= timedelta(hours=ARCGIS_FULL_PROBE_HOURS):
+        logger.info("Full layer probe due")
+        return services, True
+    thawed = thawed_services(work_dir)
+    selected = []
+    for sn in services:
+        iso3, version = _service_to_path(sn)
+        if service_key(iso3, version) in thawed or not _metadata_unchanged(
+            work_dir / iso3 / version, metadata.get(sn.lower())
+        ):
+            selected.append(sn)
+    logger.info(
+        "Metadata prefilter: probing %d/%d services", len(selected), len(services)
+    )
+    return selected, False
+
+
+def _layer_dirs(version_dir: Path) -> dict[str, Path]:
+    if not version_dir.exists():
+        return {}
+    return {
+        d.name: d
+        for d in sorted(version_dir.iterdir())
+        if d.is_dir() and not d.name.startswith(".")
+    }
+
+
+def _probe_fingerprint(
+    service_name: str, layers: dict[str, LayerProbe]
+) -> dict[str, str] | None:
+    """Return {layer_short: updated_iso}, or None if any layer lacks lastEditDate."""
+    iso3, _ = _service_to_path(service_name)
+    fingerprint = {}
+    for layer_name, probe in layers.items():
+        if layer_name.endswith("_em"):
+            continue
+        if probe.last_edit is None:
+            return None
+        fingerprint[_layer_short_name(layer_name, iso3)] = _last_edit_to_iso(
+            probe.last_edit
+        )
+    return fingerprint or None
+
+
+def _stored_fingerprint(version_dir: Path) -> dict[str, str] | None:
+    """Return the on-disk counterpart of `_probe_fingerprint`."""
+    fingerprint = {
+        name: _read_stored_updated(layer_dir)
+        for name, layer_dir in _layer_dirs(version_dir).items()
+    }
+    if not fingerprint or None in fingerprint.values():
+        return None
+    return fingerprint
+
+
+def _detect_aliases(
+    services: list[str], probes: dict[str, dict[str, LayerProbe]], work_dir: Path
+) -> dict[str, str]:
+    """Return {cod_ab_<iso3>: cod_ab_<iso3>_v<NN>} for mirrored latest services.
+
+    An unversioned service is an alias of its country's highest v{NN} service
+    when both expose the same layers with the same lastEditDate. The twin's
+    fingerprint comes from this run's probe, or from its layer collections on
+    disk when the prefilter skipped it.
+    """
+    highest: dict[str, tuple[int, str]] = {}
+    for sn in services:
+        iso3, version = _service_to_path(sn)
+        if version != "latest":
+            num = int(version[1:])
+            if iso3 not in highest or num > highest[iso3][0]:
+                highest[iso3] = (num, sn)
+    aliases: dict[str, str] = {}
+    for sn, layers in probes.items():
+        iso3, version = _service_to_path(sn)
+        if version != "latest" or iso3 not in highest:
+            continue
+        twin = highest[iso3][1]
+        twin_fingerprint = (
+            _probe_fingerprint(twin, probes[twin])
+            if twin in probes
+            else _stored_fingerprint(work_dir / iso3 / _service_to_path(twin)[1])
+        )
+        fingerprint = _probe_fingerprint(sn, layers)
+        if fingerprint is not None and fingerprint == twin_fingerprint:
+            aliases[sn] = twin
+    return aliases
+
+
+def _record_aliases(
     work_dir: Path,
-    metadata: dict[str, dict],
-) -> tuple[dict[str, str], bool]:
-    """Extract all layers for one COD-AB service to GeoParquet.
+    aliases: dict[str, str],
+    probed: dict[str, dict[str, LayerProbe]],
+    services: list[str],
+) -> None:
+    """Persist {"iso3/latest": twin_version} for extended.py and matched.py.
 
-    Returns (layer_updated, any_extracted) where layer_updated is
-    {layer_short: updated_iso} for layers with lastEditDate, and any_extracted
-    is True if at least one layer was actually downloaded this run.
+    Services probed this run are updated from `aliases`; unprobed ones keep
+    their previous entry; services gone from ArcGIS are dropped.
     """
-    service_url = f"{ARCGIS_SERVICES_URL}/{service_name}/FeatureServer"
-    data = fetch_json(service_url, token)
+    path = _state_path(work_dir, "aliases.json")
+    current = {"/".join(_service_to_path(sn)) for sn in services}
+    stored = {k: v for k, v in read_json_state(path).items() if k in current}
+    for sn in probed:
+        key = "/".join(_service_to_path(sn))
+        if sn in aliases:
+            stored[key] = _service_to_path(aliases[sn])[1]
+        else:
+            stored.pop(key, None)
+    write_json_state(path, stored)
+
+
+def read_aliases(work_dir: Path) -> dict[str, str]:
+    """Return {"iso3/latest": "v<NN>"} for latest services mirroring a twin."""
+    return read_json_state(_state_path(work_dir, "aliases.json"))
 
+
+def link_twin_files(twin_dir: Path, alias_dir: Path, names: tuple[str, ...]) -> bool:
+    """Hardlink `names` from every layer of twin_dir into alias_dir.
+
+    Files the twin lacks are removed from the alias, so the alias mirrors the
+    twin exactly. Links go through a hidden temp name and an atomic rename.
+    Returns True if any file changed.
+    """
+    changed = False
+    for layer_name, twin_layer in _layer_dirs(twin_dir).items():
+        alias_layer = alias_dir / layer_name
+        for name in names:
+            src, dest = twin_layer / name, alias_layer / name
+            if not src.exists():
+                if dest.exists():
+                    dest.unlink()
+                    catalog_index.refresh(dest)
+                    changed = True
+                continue
+            if dest.exists() and dest.samefile(src):
+                continue
+            alias_layer.mkdir(parents=True, exist_ok=True)
+            link_tier(src, dest)
+            tmp = dest.with_name(f".{name}.link")
+            tmp.unlink(missing_ok=True)
+            os.link(src, tmp)
+            tmp.replace(dest)
+            catalog_index.refresh(dest)
+            changed = True
+    return changed
+
+
+def _mirror_twin(twin_dir: Path, alias_dir: Path) -> bool:
+    """Make alias_dir's layers and original.parquet files mirror twin_dir."""
+    twin_layers = _layer_dirs(twin_dir)
+    changed = False
+    for name, layer_dir in _layer_dirs(alias_dir).items():
+        if name not in twin_layers:
+            rmtree(layer_dir)
+            catalog_index.refresh(layer_dir)
+            changed = True
+    return link_twin_files(twin_dir, alias_dir, ("original.parquet",)) or changed
+
+
+def _is_unchanged(out_path: Path, updated_iso: str | None) -> bool:
+    """Return True if out_path exists and its stored lastEditDate is current."""
+    if not out_path.exists():
+        return False
+    stored = _read_stored_updated(out_path.parent)
+    return updated_iso is None or stored is None or updated_iso == stored
+
+
+def _layer_updated_iso(probe: LayerProbe) -> str | None:
+    return _last_edit_to_iso(probe.last_edit) if probe.last_edit is not None else None
+
+
+def _fingerprint_targets(
+    probes: dict[str, dict[str, LayerProbe]], aliases: dict[str, str], work_dir: Path
+) -> dict[str, LayerProbe]:
+    """Return {layer_url: probe} for every stored layer whose lastEditDate moved.
+
+    Layers with no original.parquet yet are extracted in full anyway, so they
+    are not fingerprinted.
+    """
+    targets: dict[str, LayerProbe] = {}
+    for sn, layers in probes.items():
+        if sn in aliases:
+            continue
+        service_url = f"{ARCGIS_SERVICES_URL}/{sn}/FeatureServer"
+        iso3, version = _service_to_path(sn)
+        for layer_name, probe in layers.items():
+            if layer_name.endswith("_em"):
+                continue
+            layer_dir = work_dir / iso3 / version / _layer_short_name(layer_name, iso3)
+            out_path = layer_dir / "original.parquet"
+            if out_path.exists() and not _is_unchanged(
+                out_path, _layer_updated_iso(probe)
+            ):
+                targets[f"{service_url}/{probe.layer_id}"] = probe
+    return targets
+
+
+def _stored_props(collection: dict) -> dict:
+    return {k: collection[k] for k in (*_STATS_PROPS, _GRID_PROP) if k in collection}
+
+
+def _digest_updated(
+    new: str | None, old: str | None, stored_at: str | None, updated: str | None
+) -> str | None:
+    """Keep stored_at while a digest is unchanged; otherwise it moves to updated."""
+    if new is not None and new == old and stored_at is not None:
+        return stored_at
+    return updated
+
+
+def _layer_props(
+    service_name: str,
+    layers: dict[str, LayerProbe],
+    work_dir: Path,
+    fingerprints: dict[str, LayerFingerprint],
+) -> dict[str, dict]:
+    """Return the cod_ab:* props to (re)write per layer collection.
+
+    Every layer records the country's precision grid, if any — `_plan_service`
+    re-extracts layers stored at any other grid. Fresh fingerprints replace
+    stored ones; cod_ab:geometry_updated and cod_ab:attributes_updated keep
+    their stored values while the matching digest is unchanged, so later
+    stages (see `utils.layer_data_updated`) can tell a lastEditDate bump from
+    a data change. Unchanged layers carry their stored props forward, since
+    portolan add regenerates every collection.json of the service; layers
+    about to be re-extracted without a fresh fingerprint drop them.
+    """
+    service_url = f"{ARCGIS_SERVICES_URL}/{service_name}/FeatureServer"
+    iso3, version = _service_to_path(service_name)
+    grid = precision_grid(iso3)
+    props: dict[str, dict] = {}
+    for layer_name, probe in layers.items():
+        if layer_name.endswith("_em"):
+            continue
+        layer_short = _layer_short_name(layer_name, iso3)
+        stored = _read_collection(work_dir / iso3 / version / layer_short)
+        layer_props = _stored_props(stored)
+        layer_props.pop(_GRID_PROP, None)
+        fingerprint = fingerprints.get(f"{service_url}/{probe.layer_id}")
+        updated_iso = _layer_updated_iso(probe)
+        if fingerprint is not None:
+            old = layer_props.get("cod_ab:stats_fingerprint") or {}
+            updated = updated_iso or stored.get("updated")
+            layer_props = {
+                "cod_ab:stats_fingerprint": fingerprint.as_dict(),
+                "cod_ab:geometry_updated": _digest_updated(
+                    fingerprint.geometry,
+                    old.get("geometry"),
+                    layer_props.get("cod_ab:geometry_updated"),
+                    updated,
+                ),
+                "cod_ab:attributes_updated": _digest_updated(
+                    fingerprint.attributes,
+                    old.get("attributes"),
+                    layer_props.get("cod_ab:attributes_updated"),
+                    updated,
+                ),
+            }
+        elif not _is_unchanged(
+            work_dir / iso3 / version / layer_short / "original.parquet", updated_iso
+        ):
+            layer_props = {}
+        if grid is not None:
+            layer_props[_GRID_PROP] = grid
+        if layer_props:
+            props[layer_short] = layer_props
+    return props
+
+
+def _plan_service(
+    service_name: str,
+    layers: dict[str, LayerProbe],
+    work_dir: Path,
+    fingerprints: dict[str, LayerFingerprint],
+) -> tuple[dict[str, str], list[tuple[str, Path, str | None]]]:
+    """Compare probed layers with the work dir and decide what to extract.
+
+    Returns (layer_updated, pending) where layer_updated is
+    {layer_short: updated_iso} for layers with lastEditDate, and pending is
+    [(layer_url, out_path, since)] for layers that are new or whose
+    lastEditDate moved. since is the stored updated timestamp when the layer
+    can be delta-extracted (ARCGIS_DELTA_EXTRACT), else None. A layer whose
+    lastEditDate moved but whose checksum fingerprint matches the stored
+    one is kept as is; only its updated timestamp is rewritten, while the
+    data timestamps later stages key on stay put. A layer
+    snapped to another precision grid than the country's is always
+    re-extracted in full. Outdated parquets without a delta are removed here
+    so a failed re-extraction never leaves a stale file that looks current;
+    `_fetch_layer` does the same for deltas that fail or fall back.
+    """
+    service_url = f"{ARCGIS_SERVICES_URL}/{service_name}/FeatureServer"
     iso3, version = _service_to_path(service_name)
     version_dir = work_dir / iso3 / version
+    grid = precision_grid(iso3)
     layer_updated: dict[str, str] = {}
-    any_extracted = False
+    pending: list[tuple[str, Path, str | None]] = []
 
-    for layer in data.get("layers", []):
-        layer_id = layer["id"]
-        layer_name = layer["name"].lower().replace(" ", "_")
+    for layer_name, probe in layers.items():
+        layer_short = _layer_short_name(layer_name, iso3)
+        layer_dir = version_dir / layer_short
 
         if layer_name.endswith("_em"):
             # ArcGIS pre-matched layers — we generate our own matched variant
-            stale = version_dir / _layer_short_name(layer_name, iso3)
-            if stale.exists():
-                rmtree(stale)
+            if layer_dir.exists():
+                rmtree(layer_dir)
+                catalog_index.refresh(layer_dir)
             continue
 
-        layer_short = _layer_short_name(layer_name, iso3)
-        layer_dir = version_dir / layer_short
         out_path = layer_dir / "original.parquet"
-
         layer_dir.mkdir(parents=True, exist_ok=True)
+        layer_url = f"{service_url}/{probe.layer_id}"
 
-        layer_url = f"{service_url}/{layer_id}"
-        layer_meta = fetch_json(layer_url, token)
-        last_edit = (layer_meta.get("editingInfo") or {}).get("lastEditDate")
-        updated_iso = _last_edit_to_iso(last_edit) if last_edit is not None else None
-
+        updated_iso = _layer_updated_iso(probe)
         if updated_iso is not None:
             layer_updated[layer_short] = updated_iso
 
+        if out_path.exists() and _read_collection(layer_dir).get(_GRID_PROP) != grid:
+            logger.info("Re-extracting %s at precision grid %s", layer_short, grid)
+            out_path.unlink()
+            catalog_index.refresh(out_path)
+
         if out_path.exists():
-            stored = _read_stored_updated(layer_dir)
-            if updated_iso is None or stored is None or updated_iso == stored:
+            if _is_unchanged(out_path, updated_iso):
                 logger.debug("Skipping unchanged %s", out_path)
                 continue
+            fingerprint = fingerprints.get(layer_url)
+            stored = _read_collection(layer_dir)
+            if fingerprint is not None and fingerprint.matches(
+                stored.get("cod_ab:stats_fingerprint")
+            ):
+                logger.info("Keeping %s: lastEditDate moved, data did not", layer_short)
+                _enrich_layer_collection(layer_dir, updated_iso)
+                continue
+            if ARCGIS_DELTA_EXTRACT:
+                pending.append((layer_url, out_path, stored.get("updated")))
+                continue
             logger.info(
                 "Re-extracting updated layer %s (lastEditDate changed)", layer_short
             )
             out_path.unlink()
+            catalog_index.refresh(out_path)
 
-        logger.info("Extracting %s", layer_url)
+        pending.append((layer_url, out_path, None))
+
+    return layer_updated, pending
 
-        try:
-            table = gpio.extract_arcgis(layer_url, token=token)
-        except Exception:
-            logger.exception("Failed to extract %s — skipping layer", layer_url)
-            continue
-        table = table.sort_hilbert()
-        table.write(out_path, compression_level=22, geoparquet_version="2.0")
-        any_extracted = True
 
-    meta = metadata.get(service_name.lower())
-    if version_dir.exists():
-        _write_service_metadata(version_dir, service_name, meta)
-    return layer_updated, any_extracted
+def _fetch_delta(
+    layer_url: str, out_path: Path, token: str, since: str, spill_path: Path
+) -> bool:
+    """Try a delta extraction against out_path; remove out_path if it fails.
+
+    Returns True when the spill holds a delta, False when the caller should
+    fall back to a full extraction.
+    """
+    logger.info("Delta-extracting %s (edited since %s)", layer_url, since)
+    try:
+        if extract_delta(layer_url, token, since, out_path, spill_path):
+            return True
+    except Exception:
+        logger.exception("Delta extraction failed for %s — re-extracting", layer_url)
+        remove_spill(spill_path)
+        ids_path(spill_path).unlink(missing_ok=True)
+    out_path.unlink(missing_ok=True)
+    return False
 
 
-def _push_catalog_files(work_dir: Path, remote: str) -> None:
-    """Upload intermediate catalog.json and README.md files to S3.
+def _spill_path(out_path: Path) -> Path:
+    return out_path.with_name(f".{out_path.stem}.arrow")
 
-    portolan push handles leaf collections only. This syncs catalog.json and
-    README.md at the root, country, and service levels so STAC clients can
-    navigate the full hierarchy.
+
+def _fetch_layer(
+    layer_url: str, out_path: Path, token: str, since: str | None
+) -> tuple[Path, bool] | None:
+    """I/O stage: download one layer, or its edits since `since`, and spill it.
+
+    Returns (spill_path, is_delta) for the encode stage, or None if
+    extraction failed.
     """
-    _run(
-        [
-            "aws",
-            "s3",
-            "sync",
-            str(work_dir),
-            remote.rstrip("/"),
-            "--exclude",
-            "*",
-            "--include",
-            "catalog.json",
-            "--include",
-            "*/catalog.json",
-            "--include",
-            "*/*/catalog.json",
-            "--include",
-            "*/README.md",
-            "--include",
-            "*/*/README.md",
-            "--exclude",
-            "*/*/*/*",
-        ],
-        check=True,
-    )
+    spill_path = _spill_path(out_path)
+    if since is not None and _fetch_delta(
+        layer_url, out_path, token, since, spill_path
+    ):
+        return spill_path, True
+    logger.info("Extracting %s", layer_url)
+    try:
+        extract_layer(layer_url, token, spill_path)
+    except Exception:
+        logger.exception("Failed to extract %s — skipping layer", layer_url)
+        remove_spill(spill_path)
+        return None
+    return spill_path, False
+
+
+def _is_bootstrap(
+    layers: dict[str, LayerProbe], pending: list[tuple[str, Path, str | None]]
+) -> bool:
+    """Return True if every layer of a service is pending a full extraction."""
+    wanted = sum(not name.endswith("_em") for name in layers)
+    return len(pending) == wanted and all(since is None for _, _, since in pending)
+
+
+def _export_service(
+    service_name: str, pending: list[tuple[str, Path, str | None]], token: str
+) -> set[str]:
+    """I/O stage: spill a whole service from one replica export job.
+
+    Returns the layer URLs that were spilled; the rest, or all of them if
+    the export fails, are left to `_fetch_layer`.
+    """
+    service_url = f"{ARCGIS_SERVICES_URL}/{service_name}/FeatureServer"
+    version_dir = pending[0][1].parent.parent
+    logger.info("Exporting %s (%d layers) as one replica", service_name, len(pending))
+    try:
+        return export_service(
+            service_url,
+            token,
+            {layer_url: _spill_path(out_path) for layer_url, out_path, _ in pending},
+            version_dir / ".replica",
+        )
+    except (ReplicaError, httpx.HTTPError):
+        logger.exception(
+            "Export failed for %s — falling back to per-layer extraction",
+            service_name,
+        )
+        return set()
+
+
+def _submit_layers(
+    io_pool: ThreadPoolExecutor,
+    encode_pool: ProcessPoolExecutor,
+    service_pending: dict[str, list[tuple[str, Path, str | None]]],
+    token: str,
+    bootstraps: set[str],
+) -> Iterator[tuple[str, bool]]:
+    """Queue every pending layer of every service on the two-stage pipeline.
+
+    Layers, not services, are the unit of work, so one service with several
+    large layers spreads across all workers instead of setting the tail of
+    the run. Each layer is downloaded on `io_pool`, then Hilbert-sorted and
+    compressed on `encode_pool`, so CPU-heavy encoding never holds the GIL
+    on a download thread. Submission happens immediately; the returned
+    iterator yields (service_name, any_extracted) as soon as the last layer
+    of each service is written, so per-service post-processing can start
+    while other services are still downloading.
+
+    With ARCGIS_BULK_EXPORT, services in bootstraps are first exported whole
+    by one replica job; layers the export does not deliver are then queued
+    one by one like any other.
+    """
+    fetch = partial(io_pool.submit, _fetch_layer, token=token)
+    bulk = bootstraps if ARCGIS_BULK_EXPORT else set()
+    fetches = {
+        fetch(layer_url, out_path, since=since): (sn, out_path)
+        for sn, pending in service_pending.items()
+        if sn not in bulk
+        for layer_url, out_path, since in pending
+    }
+    exports = {
+        io_pool.submit(_export_service, sn, pending, token): (sn, pending)
+        for sn, pending in service_pending.items()
+        if sn in bulk
+    }
+    remaining = {sn: len(pending) for sn, pending in service_pending.items()}
+    return _drain_services(fetches, exports, encode_pool, remaining, fetch)
+
+
+def _layer_result(future: Future, service_name: str) -> tuple[Path, bool] | bool | None:
+    try:
+        return future.result()
+    except Exception:
+        logger.exception("Extraction failed for a layer of %s — skipping", service_name)
+        return None
+
+
+def _exported_layers(future: Future[set[str]], service_name: str) -> set[str]:
+    try:
+        return future.result()
+    except Exception:
+        logger.exception("Export failed for %s — per-layer extraction", service_name)
+        return set()
+
+
+def _service_grid(service_name: str) -> float | None:
+    return precision_grid(_service_to_path(service_name)[0])
+
+
+def _drain_services(
+    fetches: dict[Future[tuple[Path, bool] | None], tuple[str, Path]],
+    exports: dict[Future[set[str]], tuple[str, list[tuple[str, Path, str | None]]]],
+    encode_pool: ProcessPoolExecutor,
+    remaining: dict[str, int],
+    fetch: Callable[..., Future[tuple[Path, bool] | None]],
+) -> Iterator[tuple[str, bool]]:
+    """Hand fetched layers to the encode pool; yield services as they finish.
+
+    A finished export queues an encode for each layer it spilled and a
+    `fetch` for each it did not.
+    """
+    extracted = dict.fromkeys(remaining, False)
+    encodes: dict[Future[bool], tuple[str, Path]] = {}
+    waiting: set[Future] = set(fetches) | set(exports)
+    while waiting:
+        done, waiting = wait(waiting, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in exports:
+                sn, pending = exports.pop(future)
+                exported = _exported_layers(future, sn)
+                for layer_url, out_path, since in pending:
+                    if layer_url in exported:
+                        spill = _spill_path(out_path)
+                        queued = encode_pool.submit(
+                            encode_layer, spill, out_path, grid=_service_grid(sn)
+                        )
+                        encodes[queued] = sn, out_path
+                    else:
+                        queued = fetch(layer_url, out_path, since=since)
+                        fetches[queued] = sn, out_path
+                    waiting.add(queued)
+                continue
+            if future in fetches:
+                sn, out_path = fetches.pop(future)
+                fetched = _layer_result(future, sn)
+                if fetched is not None:
+                    spill_path, delta = fetched
+                    encode = encode_pool.submit(
+                        encode_layer,
+                        spill_path,
+                        out_path,
+                        delta=delta,
+                        grid=_service_grid(sn),
+                    )
+                    encodes[encode] = sn, out_path
+                    waiting.add(encode)
+                    continue
+            else:
+                sn, out_path = encodes.pop(future)
+                extracted[sn] |= bool(_layer_result(future, sn))
+            catalog_index.refresh(out_path)
+            remaining[sn] -= 1
+            if remaining[sn] == 0:
+                yield sn, extracted[sn]
 
 
 def _ensure_root_catalog(work_dir: Path) -> None:
@@ -430,78 +909,266 @@ def _ensure_root_catalog(work_dir: Path) -> None:
     ).exists():
         return
     (work_dir / ".portolan" / "config.yaml").unlink(missing_ok=True)
-    _portolan(["init", "--title", _CATALOG_TITLE, "--auto"], cwd=work_dir)
+    portolan(["init", "--title", _CATALOG_TITLE, "--auto"], cwd=work_dir)
 
 
 def _remove_stale_services(services: list[str], work_dir: Path) -> None:
     """Remove version directories no longer present in ArcGIS.
 
-    Scans {iso3}/{version}/ directories and calls portolan rm for any that no
-    longer correspond to an active ArcGIS service.
+    Calls portolan rm for every indexed {iso3}/{version}/ service that no
+    longer corresponds to an active ArcGIS service.
     """
     current = {_service_to_path(s) for s in services}
-    for country_dir in sorted(work_dir.iterdir()):
-        if not country_dir.is_dir() or country_dir.name.startswith("."):
-            continue
-        if country_dir.name == "wld":
-            continue
-        iso3 = country_dir.name
-        for version_dir in sorted(country_dir.iterdir()):
-            if not version_dir.is_dir() or version_dir.name.startswith("."):
-                continue
-            version = version_dir.name
-            if (iso3, version) not in current:
-                logger.info("Removing stale service %s/%s", iso3, version)
-                try:
-                    _portolan(["rm", "--force", f"{iso3}/{version}/"], cwd=work_dir)
-                except CalledProcessError:
-                    logger.warning("portolan rm failed for %s/%s", iso3, version)
-
-
-def _enrich_original_layers(version_dir: Path, layer_updated: dict[str, str]) -> None:
-    """Write updated timestamps and Original titles into layer collection.json files."""
-    for layer_short, updated_iso in layer_updated.items():
-        _enrich_layer_collection(version_dir / layer_short, updated_iso)
+    for iso3, version in catalog_index.services(work_dir):
+        if (iso3, version) not in current:
+            logger.info("Removing stale service %s/%s", iso3, version)
+            try:
+                portolan(
+                    ["rm", "--force", f"{work_dir / iso3 / version}/"], cwd=work_dir
+                )
+            except CalledProcessError:
+                logger.warning("portolan rm failed for %s/%s", iso3, version)
+            catalog_index.refresh(work_dir / iso3 / version)
+
+
+def _enrich_original_layers(
+    version_dir: Path, layer_updated: dict[str, str], layer_props: dict[str, dict]
+) -> None:
+    """Write updated, cod_ab:* stats props and Original titles into collections."""
+    for layer_short in layer_updated.keys() | layer_props.keys():
+        _enrich_layer_collection(
+            version_dir / layer_short,
+            layer_updated.get(layer_short),
+            layer_props.get(layer_short),
+        )
     # Ensure portolan-generated original asset has a human-readable title
     for layer_dir in version_dir.iterdir():
         if not layer_dir.is_dir() or layer_dir.name.startswith("."):
             continue
-        collection_path = layer_dir / "collection.json"
-        if not collection_path.exists():
-            continue
-        data = json.loads(collection_path.read_text())
-        assets = data.get("assets", {})
+        assets = _read_collection(layer_dir).get("assets", {})
         if "original" in assets and "title" not in assets["original"]:
             assets["original"]["title"] = "Original"
-            collection_path.write_text(json.dumps(data, indent=2))
 
 
-def _add_service_to_catalog(  # noqa: PLR0913
+@dataclass
+class _ServiceAdd:
+    """One service's portolan add and the enrichments that follow it."""
+
+    service_name: str
+    iso3: str
+    version_dir: Path
+    args: list[str]
+    meta: dict | None
+    layer_updated: dict[str, str]
+    layer_props: dict[str, dict]
+    hidden: list[tuple[Path, Path]]
+
+
+def _enrich_added_service(add: _ServiceAdd) -> None:
+    _restore_hidden_files(add.hidden)
+    if add.meta:
+        _enrich_service_catalog(add.version_dir, add.meta)
+    _enrich_original_layers(add.version_dir, add.layer_updated, add.layer_props)
+
+
+def _add_service_to_catalog(add: _ServiceAdd, work_dir: Path) -> None:
+    """Run portolan add for one service and apply post-add enrichments."""
+    add.hidden = _hide_variant_files(add.version_dir)
+    try:
+        portolan(add.args, cwd=work_dir)
+    except CalledProcessError:
+        logger.exception("portolan add failed for %s — skipping", add.service_name)
+        _restore_hidden_files(add.hidden)
+        return
+    _enrich_added_service(add)
+
+
+class _ParallelAdds:
+    """portolan add for several services at once, each in a pool process.
+
+    Adds of one country run one after another, as they share
+    {iso3}/catalog.json. The root catalog.json is shared by all of them, but
+    portolan add only rewrites it (unlocked) to link a new country, so
+    `_seed_country_links` adds those links up front and concurrent adds
+    only read it; the catalog-level versions.json is file-locked by portolan.
+    Hiding variant files and the post-add enrichments stay on the calling
+    thread, which owns `catalog_docs`.
+    """
+
+    def __init__(self, work_dir: Path, processes: int, countries: set[str]) -> None:
+        """Start `processes` spawned workers adding services of `countries`."""
+        _seed_country_links(work_dir, countries)
+        self._work_dir = work_dir
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=get_context("spawn")
+        )
+        self._running: dict[Future, _ServiceAdd] = {}
+        self._queued: dict[str, deque[_ServiceAdd]] = defaultdict(deque)
+
+    def _start(self, add: _ServiceAdd) -> None:
+        add.hidden = _hide_variant_files(add.version_dir)
+        catalog_docs.flush()
+        future = self._pool.submit(run_in_worker, add.args, self._work_dir)
+        self._running[future] = add
+
+    def _reap(self, *, block: bool) -> None:
+        if not self._running:
+            return
+        done, _ = wait(
+            self._running, timeout=None if block else 0, return_when=FIRST_COMPLETED
+        )
+        for future in done:
+            add = self._running.pop(future)
+            try:
+                collect_worker(add.args, future.result())
+            except CalledProcessError:
+                logger.exception(
+                    "portolan add failed for %s — skipping", add.service_name
+                )
+                _restore_hidden_files(add.hidden)
+            else:
+                _enrich_added_service(add)
+            queue = self._queued[add.iso3]
+            if queue:
+                self._start(queue.popleft())
+
+    def submit(self, add: _ServiceAdd) -> None:
+        """Start add now, or after the add of its country in progress."""
+        self._reap(block=False)
+        if any(running.iso3 == add.iso3 for running in self._running.values()):
+            self._queued[add.iso3].append(add)
+        else:
+            self._start(add)
+
+    def drain(self) -> None:
+        """Wait for every add submitted so far and apply its enrichments."""
+        while self._running:
+            self._reap(block=True)
+
+    def close(self) -> None:
+        """Drain, stop the pool and drop seeded links left dangling."""
+        self.drain()
+        self._pool.shutdown()
+        _prune_country_links(self._work_dir)
+
+
+def _country_link(iso3: str) -> dict:
+    # As portolan add writes it (catalog.update_catalog_links_for_nested)
+    return {
+        "rel": "child",
+        "href": f"./{iso3}/catalog.json",
+        "type": "application/json",
+    }
+
+
+def _seed_country_links(work_dir: Path, countries: set[str]) -> None:
+    """Link every country from the root catalog before parallel adds start."""
+    data = catalog_docs.load(work_dir / "catalog.json")
+    if data is None:
+        return
+    links = data.setdefault("links", [])
+    present = {link.get("href") for link in links if link.get("rel") == "child"}
+    links.extend(
+        _country_link(iso3)
+        for iso3 in sorted(countries)
+        if _country_link(iso3)["href"] not in present
+    )
+
+
+def _prune_country_links(work_dir: Path) -> None:
+    """Drop seeded root links to countries whose catalog was never created."""
+    data = catalog_docs.load(work_dir / "catalog.json")
+    if data is None:
+        return
+    data["links"] = [
+        link
+        for link in data.get("links", [])
+        if link.get("rel") != "child"
+        or not link.get("href", "").endswith("/catalog.json")
+        or (work_dir / link["href"]).exists()
+    ]
+
+
+def _finalise_service(  # noqa: PLR0913
     service_name: str,
-    version_dir: Path,
-    iso3: str,
-    version: str,
+    work_dir: Path,
+    *,
     meta: dict | None,
     layer_updated: dict[str, str],
+    layer_props: dict[str, dict],
+    extracted: bool,
     workers: str,
-    work_dir: Path,
+    adds: _ParallelAdds | None = None,
 ) -> None:
-    """Run portolan add for one service and apply post-add enrichments."""
+    """Write service metadata and, if needed, run portolan add for one service.
+
+    With `adds`, the add is handed to the pool and enriched once it is done.
+    """
+    iso3, version = _service_to_path(service_name)
+    version_dir = work_dir / iso3 / version
+    if not version_dir.exists():
+        return
+    _write_service_metadata(version_dir, service_name, meta)
+    # Skip portolan add when catalog already exists and nothing was re-extracted —
+    # avoids ~268 redundant catalog operations on no-change runs.
+    if (version_dir / "catalog.json").exists() and not extracted:
+        # Still refresh cod_ab:* so the metadata prefilter sees this row as seen.
+        if meta:
+            _enrich_service_catalog(version_dir, meta)
+        return
     date_valid_on = (meta.get("date_valid_on") or "").strip() if meta else ""
-    hidden = _hide_variant_files(version_dir)
-    args = ["add", f"{iso3}/{version}/", "--workers", workers, "--pmtiles"]
+    args = ["add", f"{version_dir}/", "--workers", workers, "--pmtiles"]
     if date_valid_on:
         args += ["--datetime", date_valid_on]
-    try:
-        _portolan(args, cwd=work_dir)
-    except CalledProcessError:
-        logger.exception("portolan add failed for %s — skipping", service_name)
-        _restore_hidden_files(hidden)
-        return
-    _restore_hidden_files(hidden)
-    if meta:
-        _enrich_service_catalog(version_dir, meta)
-    _enrich_original_layers(version_dir, layer_updated)
+    add = _ServiceAdd(
+        service_name, iso3, version_dir, args, meta, layer_updated, layer_props, []
+    )
+    if adds is not None:
+        adds.submit(add)
+    else:
+        _add_service_to_catalog(add, work_dir)
+
+
+def _finalise_aliases(  # noqa: PLR0913
+    aliases: dict[str, str],
+    work_dir: Path,
+    *,
+    metadata: dict[str, dict],
+    service_layer_updated: dict[str, dict[str, str]],
+    workers: str,
+    adds: _ParallelAdds | None,
+) -> None:
+    """Hardlink each latest service's layers from its twin and finalise it."""
+    for sn, twin in sorted(aliases.items()):
+        iso3, version = _service_to_path(sn)
+        twin_dir = work_dir / iso3 / _service_to_path(twin)[1]
+        linked = _mirror_twin(twin_dir, work_dir / iso3 / version)
+        if linked:
+            logger.info("Linked %s layers from %s", sn, twin)
+        _finalise_service(
+            sn,
+            work_dir,
+            meta=metadata.get(sn.lower()),
+            layer_updated=service_layer_updated[sn],
+            layer_props={
+                name: _stored_props(_read_collection(layer_dir))
+                for name, layer_dir in _layer_dirs(twin_dir).items()
+            },
+            extracted=linked,
+            workers=workers,
+            adds=adds,
+        )
+
+
+def _log_deferred() -> None:
+    """Report services whose circuit breaker tripped during this run."""
+    deferred = open_services()
+    if deferred:
+        logger.warning(
+            "Circuit open for %d services, deferred to the next run: %s",
+            len(deferred),
+            ", ".join(sorted(deferred)),
+        )
 
 
 def run(work_dir: Path) -> None:
@@ -516,51 +1183,115 @@ def run(work_dir: Path) -> None:
     metadata = fetch_metadata_table(token)
     logger.info("Fetched metadata for %d services", len(metadata))
 
+    frozen = frozen_services(work_dir)
+    active = [sn for sn in services if service_key(*_service_to_path(sn)) not in frozen]
+    logger.info("Skipping %d frozen services", len(services) - len(active))
+
+    started = datetime.now(UTC)
+    to_probe, full_probe = _services_to_probe(active, metadata, work_dir)
+    probes = probe_services(to_probe, token)
+
+    aliases = _detect_aliases(active, probes, work_dir)
+    _record_aliases(work_dir, aliases, probes, services)
+    logger.info("%d latest services mirror their versioned twin", len(aliases))
+
+    fingerprints = (
+        fingerprint_layers(_fingerprint_targets(probes, aliases, work_dir))
+        if ARCGIS_FINGERPRINT
+        else {}
+    )
+
     service_layer_updated: dict[str, dict[str, str]] = {}
-    service_extracted: dict[str, bool] = {}
+    service_layer_props: dict[str, dict[str, dict]] = {}
+    service_pending: dict[str, list[tuple[str, Path, str | None]]] = {}
 
-    with ThreadPoolExecutor(max_workers=16) as pool:
-        futures = {
-            pool.submit(_extract_service, sn, token, work_dir, metadata): sn
-            for sn in sorted(services)
-        }
-        for future in as_completed(futures):
-            sn = futures[future]
-            try:
-                layer_updated, extracted = future.result()
-                service_layer_updated[sn] = layer_updated
-                service_extracted[sn] = extracted
-            except Exception:
-                logger.exception("Extraction failed for %s — skipping", sn)
-                service_layer_updated[sn] = {}
-                service_extracted[sn] = False
+    for sn, layers in probes.items():
+        if sn in aliases:
+            service_layer_updated[sn] = _probe_fingerprint(sn, layers) or {}
+            continue
+        # Before planning: a skipped layer's stored props must be read first
+        service_layer_props[sn] = _layer_props(sn, layers, work_dir, fingerprints)
+        layer_updated, pending = _plan_service(sn, layers, work_dir, fingerprints)
+        service_layer_updated[sn] = layer_updated
+        if pending:
+            service_pending[sn] = pending
+    logger.info(
+        "%d services have new or changed layers (%d layers)",
+        len(service_pending),
+        sum(len(p) for p in service_pending.values()),
+    )
 
     _write_catalog_metadata(work_dir)
     _remove_stale_services(services, work_dir)
 
     workers = str(PORTOLAN_WORKERS)
-    for service_name in sorted(services):
-        iso3, version = _service_to_path(service_name)
-        version_dir = work_dir / iso3 / version
-        if not version_dir.exists():
-            continue
-        # Skip portolan add when catalog already exists and nothing was re-extracted —
-        # avoids ~268 redundant catalog operations on no-change runs.
-        catalog_exists = (version_dir / "catalog.json").exists()
-        if catalog_exists and not service_extracted.get(service_name, False):
-            continue
-        _add_service_to_catalog(
-            service_name,
-            version_dir,
-            iso3,
-            version,
-            metadata.get(service_name.lower()),
-            service_layer_updated.get(service_name, {}),
-            workers,
+    # portolan add runs on this thread, so catalog writes stay serial while the
+    # pool keeps downloading other services' layers — unless
+    # PORTOLAN_ADD_PROCESSES hands the adds to a pool of their own.
+    adds = (
+        _ParallelAdds(
             work_dir,
+            PORTOLAN_ADD_PROCESSES,
+            {_service_to_path(sn)[0] for sn in active},
+        )
+        if PORTOLAN_ADD_PROCESSES > 1
+        else None
+    )
+    with (
+        ThreadPoolExecutor(max_workers=PORTOLAN_EXTRACT_WORKERS) as io_pool,
+        ProcessPoolExecutor(
+            max_workers=PORTOLAN_ENCODE_WORKERS, mp_context=get_context("spawn")
+        ) as encode_pool,
+    ):
+        bootstraps = {
+            sn
+            for sn, pending in service_pending.items()
+            if _is_bootstrap(probes[sn], pending)
+        }
+        completed = _submit_layers(
+            io_pool, encode_pool, service_pending, token, bootstraps
+        )
+        unchanged = (
+            (sn, False)
+            for sn in sorted(active)
+            if sn not in service_pending and sn not in aliases
+        )
+        for sn, extracted in chain(unchanged, completed):
+            _finalise_service(
+                sn,
+                work_dir,
+                meta=metadata.get(sn.lower()),
+                layer_updated=service_layer_updated.get(sn, {}),
+                layer_props=service_layer_props.get(sn, {}),
+                extracted=extracted,
+                workers=workers,
+                adds=adds,
+            )
+
+    # Aliases last, once their twins' layers are final: hardlinks, no downloads.
+    if adds is not None:
+        adds.drain()
+    _finalise_aliases(
+        aliases,
+        work_dir,
+        metadata=metadata,
+        service_layer_updated=service_layer_updated,
+        workers=workers,
+        adds=adds,
+    )
+    if adds is not None:
+        adds.close()
+
+    _log_deferred()
+
+    # Only a full probe that reached every service resets the interval.
+    if full_probe and len(probes) == len(to_probe):
+        write_json_state(
+            _state_path(work_dir, "state.json"),
+            {"last_full_probe": started.isoformat(timespec="seconds")},
         )
 
     try:
-        _portolan(["stac-geoparquet"], cwd=work_dir)
+        portolan(["stac-geoparquet"], cwd=work_dir)
     except CalledProcessError:
         logger.warning("portolan stac-geoparquet: no items in catalog — skipping")
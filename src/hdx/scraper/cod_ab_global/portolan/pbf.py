@@ -0,0 +1,374 @@
+"""Decoder for ArcGIS `f=pbf` query responses (FeatureCollectionPBuffer).
+
+ArcGIS FeatureServers answer `query?f=pbf` with Esri's FeatureCollection
+protocol buffer: attribute values as typed protobuf fields and geometries as
+delta-encoded, quantized integer coordinates. Compared with `f=geojson` this
+is several times smaller on the wire, and the coordinates decode with a few
+vectorised numpy operations instead of a JSON parse.
+
+No protobuf runtime is needed — the handful of messages used are read
+straight off the wire format. Geometries come out as WKB shaped like the
+GeoJSON path's: x/y only, polygon exteriors counter-clockwise and holes
+clockwise (RFC 7946), single-part features as Polygon/LineString and
+multi-part ones as MultiPolygon/MultiLineString. Request them with
+`outSR=4326` so coordinates match the CRS84 metadata written for the spill.
+"""
+
+import struct
+from collections.abc import Iterator
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+import pyarrow as pa
+
+
+class PbfDecodeError(ValueError):
+    """The response body is not a FeatureCollectionPBuffer this module reads."""
+
+
+# Wire types
+_VARINT, _FIXED64, _LEN, _FIXED32 = 0, 1, 2, 5
+
+# esriGeometryType enum values
+_POINT, _MULTIPOINT, _POLYLINE, _POLYGON = 0, 1, 2, 3
+
+# WKB geometry type codes
+_WKB_POINT, _WKB_LINESTRING, _WKB_POLYGON = 1, 2, 3
+_WKB_MULTIPOINT, _WKB_MULTILINESTRING, _WKB_MULTIPOLYGON = 4, 5, 6
+
+_UPPER_LEFT = 0
+
+
+@dataclass
+class _Transform:
+    x_scale: float = 1.0
+    y_scale: float = 1.0
+    x_translate: float = 0.0
+    y_translate: float = 0.0
+    upper_left: bool = True
+
+
+@dataclass
+class FeaturePage:
+    """One decoded query page: attribute columns and WKB geometries."""
+
+    columns: dict[str, list] = field(default_factory=dict)
+    geometries: list[bytes | None] = field(default_factory=list)
+    exceeded_transfer_limit: bool = False
+
+    def to_table(self, schema: pa.Schema) -> pa.Table | None:
+        """Return the page as a table of schema, or None if it has no features."""
+        if not self.geometries:
+            return None
+        n = len(self.geometries)
+        arrays = []
+        for f in schema:
+            if f.name == "geometry":
+                arrays.append(pa.array(self.geometries, f.type))
+            elif f.name in self.columns:
+                arrays.append(pa.array(self.columns[f.name], f.type))
+            else:
+                arrays.append(pa.nulls(n, f.type))
+        return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _read_varint(buf: memoryview, pos: int) -> tuple[int, int]:
+    result = shift = 0
+    while True:
+        if pos >= len(buf):
+            msg = "truncated varint"
+            raise PbfDecodeError(msg)
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if b < 0x80:  # noqa: PLR2004
+            return result, pos
+        shift += 7
+
+
+def _fields(buf: memoryview) -> Iterator[tuple[int, int, Any]]:
+    """Yield (field number, wire type, value) for each field of a message.
+
+    Varints are yielded as ints, length-delimited fields as memoryviews and
+    fixed-width fields as raw bytes.
+    """
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        key, pos = _read_varint(buf, pos)
+        number, wire = key >> 3, key & 7
+        if wire == _VARINT:
+            value, pos = _read_varint(buf, pos)
+        elif wire == _LEN:
+            size, pos = _read_varint(buf, pos)
+            value = buf[pos : pos + size]
+            pos += size
+        elif wire == _FIXED64:
+            value = bytes(buf[pos : pos + 8])
+            pos += 8
+        elif wire == _FIXED32:
+            value = bytes(buf[pos : pos + 4])
+            pos += 4
+        else:
+            msg = f"unsupported wire type {wire}"
+            raise PbfDecodeError(msg)
+        if pos > end:
+            msg = "truncated message"
+            raise PbfDecodeError(msg)
+        yield number, wire, value
+
+
+def _packed_varints(buf: memoryview) -> np.ndarray:
+    """Decode a packed repeated varint field in one vectorised pass."""
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if b.size == 0:
+        return np.empty(0, dtype=np.uint64)
+    if b[-1] & 0x80:
+        msg = "truncated packed varints"
+        raise PbfDecodeError(msg)
+    ends = np.flatnonzero(b < 0x80)  # noqa: PLR2004
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = np.arange(b.size) - np.repeat(starts, ends - starts + 1)
+    parts = (b & 0x7F).astype(np.uint64) << (7 * shift).astype(np.uint64)
+    # The 7-bit groups never overlap, so summing them is the same as or-ing
+    return np.add.reduceat(parts, starts)
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(
+        np.int64
+    )
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= 1 << (bits - 1) else value
+
+
+def _decode_value(buf: memoryview) -> object:  # noqa: PLR0911
+    for number, _, value in _fields(buf):
+        match number:
+            case 1:
+                return bytes(value).decode()
+            case 2:
+                return struct.unpack("<f", value)[0]
+            case 3:
+                return struct.unpack("<d", value)[0]
+            case 4 | 8:
+                return (value >> 1) ^ -(value & 1)
+            case 5 | 7:
+                return value
+            case 6:
+                return _signed(value, 64)
+            case 9:
+                return bool(value)
+    return None
+
+
+def _decode_transform(buf: memoryview) -> _Transform:
+    transform = _Transform()
+    for number, _, value in _fields(buf):
+        if number == 1:
+            transform.upper_left = value == _UPPER_LEFT
+        elif number in {2, 3}:
+            xy = {n: struct.unpack("<d", v)[0] for n, _, v in _fields(value)}
+            if number == 2:  # noqa: PLR2004
+                transform.x_scale = xy.get(1, 0.0)
+                transform.y_scale = xy.get(2, 0.0)
+            else:
+                transform.x_translate = xy.get(1, 0.0)
+                transform.y_translate = xy.get(2, 0.0)
+    return transform
+
+
+def _ring_area(ring: np.ndarray) -> float:
+    x, y = ring[:, 0], ring[:, 1]
+    return 0.5 * float(np.sum(x[:-1] * y[1:] - x[1:] * y[:-1]))
+
+
+def _ring_contains(ring: np.ndarray, point: np.ndarray) -> bool:
+    x, y = ring[:, 0], ring[:, 1]
+    x2, y2 = np.roll(x, -1), np.roll(y, -1)
+    crosses = (y > point[1]) != (y2 > point[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xi = x + (point[1] - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(crosses & (point[0] < xi)) % 2)
+
+
+def _group_rings(rings: list[np.ndarray]) -> list[list[np.ndarray]]:
+    """Group Esri rings (clockwise exteriors) into RFC 7946 polygons.
+
+    Each hole goes to the last exterior that contains its first vertex, or to
+    the preceding exterior when none does.
+    """
+    polygons: list[list[np.ndarray]] = []
+    holes: list[tuple[int, np.ndarray]] = []
+    for ring in rings:
+        if _ring_area(ring) <= 0:
+            polygons.append([ring[::-1]])
+        else:
+            holes.append((len(polygons) - 1, ring[::-1]))
+    for preceding, hole in holes:
+        owners = [p for p in polygons if _ring_contains(p[0], hole[0])]
+        if owners:
+            owners[-1].append(hole)
+        elif preceding >= 0:
+            polygons[preceding].append(hole)
+        else:
+            polygons.append([hole[::-1]])
+    return polygons
+
+
+def _wkb_points(coords: np.ndarray) -> bytes:
+    return struct.pack("<I", len(coords)) + coords.astype("<f8").tobytes()
+
+
+def _wkb_polygon(rings: list[np.ndarray]) -> bytes:
+    return struct.pack("<BII", 1, _WKB_POLYGON, len(rings)) + b"".join(
+        _wkb_points(r) for r in rings
+    )
+
+
+def _wkb_linestring(path: np.ndarray) -> bytes:
+    return struct.pack("<BI", 1, _WKB_LINESTRING) + _wkb_points(path)
+
+
+def _wkb_multi(kind: int, parts: list[bytes]) -> bytes:
+    return struct.pack("<BII", 1, kind, len(parts)) + b"".join(parts)
+
+
+def _wkb_point_geometry(xy: np.ndarray, _: list[np.ndarray]) -> bytes:
+    return struct.pack("<BIdd", 1, _WKB_POINT, *xy[0])
+
+
+def _wkb_multipoint_geometry(xy: np.ndarray, _: list[np.ndarray]) -> bytes:
+    points = [struct.pack("<BIdd", 1, _WKB_POINT, *p) for p in xy]
+    return _wkb_multi(_WKB_MULTIPOINT, points)
+
+
+def _wkb_polyline_geometry(_: np.ndarray, parts: list[np.ndarray]) -> bytes:
+    if len(parts) == 1:
+        return _wkb_linestring(parts[0])
+    return _wkb_multi(_WKB_MULTILINESTRING, [_wkb_linestring(p) for p in parts])
+
+
+def _wkb_polygon_geometry(_: np.ndarray, parts: list[np.ndarray]) -> bytes:
+    polygons = _group_rings(parts)
+    if len(polygons) == 1:
+        return _wkb_polygon(polygons[0])
+    return _wkb_multi(_WKB_MULTIPOLYGON, [_wkb_polygon(p) for p in polygons])
+
+
+_WKB_BUILDERS = {
+    _POINT: _wkb_point_geometry,
+    _MULTIPOINT: _wkb_multipoint_geometry,
+    _POLYLINE: _wkb_polyline_geometry,
+    _POLYGON: _wkb_polygon_geometry,
+}
+
+
+@dataclass
+class _Layout:
+    """Per-response header needed to decode each feature."""
+
+    names: list[str] = field(default_factory=list)
+    geometry_type: int = _POLYGON
+    has_z: bool = False
+    has_m: bool = False
+    transform: _Transform = field(default_factory=_Transform)
+
+
+def _decode_geometry(buf: memoryview, layout: _Layout) -> bytes | None:
+    lengths = np.empty(0, dtype=np.uint64)
+    raw = np.empty(0, dtype=np.uint64)
+    for number, _, value in _fields(buf):
+        if number == 2:  # noqa: PLR2004
+            lengths = _packed_varints(value)
+        elif number == 3:  # noqa: PLR2004
+            raw = _packed_varints(value)
+    if raw.size == 0:
+        return None
+    builder = _WKB_BUILDERS.get(layout.geometry_type)
+    if builder is None:
+        msg = f"unsupported geometry type {layout.geometry_type}"
+        raise PbfDecodeError(msg)
+    # Coordinates are deltas from the previous vertex, across all parts
+    stride = 2 + layout.has_z + layout.has_m
+    ints = np.cumsum(_zigzag(raw).reshape(-1, stride)[:, :2], axis=0)
+    t = layout.transform
+    xy = np.empty(ints.shape, dtype=np.float64)
+    xy[:, 0] = ints[:, 0] * t.x_scale + t.x_translate
+    xy[:, 1] = ints[:, 1] * (-t.y_scale if t.upper_left else t.y_scale)
+    xy[:, 1] += t.y_translate
+    parts = (
+        np.split(xy, np.cumsum(lengths.astype(np.int64))[:-1]) if lengths.size else [xy]
+    )
+    return builder(xy, parts)
+
+
+def _decode_feature(buf: memoryview, layout: _Layout, page: FeaturePage) -> None:
+    """Append one feature's attributes and geometry to page."""
+    values: list[object] = []
+    geometry = None
+    for number, _, value in _fields(buf):
+        if number == 1:
+            values.append(_decode_value(value))
+        elif number == 2:  # noqa: PLR2004
+            geometry = _decode_geometry(value, layout)
+    values += [None] * (len(layout.names) - len(values))
+    for name, v in zip(layout.names, values, strict=False):
+        page.columns[name].append(v)
+    page.geometries.append(geometry)
+
+
+def _decode_feature_result(buf: memoryview) -> FeaturePage:
+    page = FeaturePage()
+    layout = _Layout()
+    features: list[memoryview] = []
+    for number, _, value in _fields(buf):
+        match number:
+            case 7:
+                layout.geometry_type = value
+            case 9:
+                page.exceeded_transfer_limit = bool(value)
+            case 10:
+                layout.has_z = bool(value)
+            case 11:
+                layout.has_m = bool(value)
+            case 12:
+                layout.transform = _decode_transform(value)
+            case 13:
+                layout.names.append(
+                    next(bytes(v).decode() for n, _, v in _fields(value) if n == 1)
+                )
+            case 15:
+                features.append(value)
+    page.columns = {name: [] for name in layout.names}
+    for feature in features:
+        _decode_feature(feature, layout, page)
+    return page
+
+
+def _find_feature_result(data: bytes) -> FeaturePage:
+    for number, _, value in _fields(memoryview(data)):
+        if number != 2:  # noqa: PLR2004
+            continue
+        for result_number, _, result in _fields(value):
+            if result_number == 1:
+                return _decode_feature_result(result)
+    msg = "response holds no feature result"
+    raise PbfDecodeError(msg)
+
+
+def decode_feature_page(data: bytes) -> FeaturePage:
+    """Decode the body of a `query?f=pbf` feature response.
+
+    Raises PbfDecodeError for any body that does not decode, however it
+    fails.
+    """
+    try:
+        return _find_feature_result(data)
+    except PbfDecodeError:
+        raise
+    except (IndexError, StopIteration, ValueError, struct.error) as e:
+        raise PbfDecodeError(str(e) or type(e).__name__) from e
@@ -0,0 +1,277 @@
+"""In-process portolan commands, with the CLI as fallback, and their timings.
+
+Every stage used to launch a fresh `portolan` interpreter per `init`, `add`,
+`rm`, `check`, `stac-geoparquet` and `readme`, and variant PMTiles were
+built by an `init` + `add` in a throwaway catalog per layer — hundreds of
+start-ups and import chains per run. `portolan()` instead invokes the
+`portolan_cli` click group in this process, so its modules, DuckDB and
+GDAL stay loaded across calls, and `generate_pmtiles()` calls portolan's
+PMTiles builder directly.
+
+The working directory is never changed in-process: it is process-wide,
+and extraction threads and the compactor resolve paths meanwhile. Only
+commands that take their catalog root as an argument (`init`, `check`,
+`add`, `rm`, `stac-geoparquet`) run in-process, with cwd passed as that
+argument; the others (`readme`, which only finds its catalog from the
+working directory) always run as a subprocess in cwd. Callers pass
+absolute paths, so a command line means the same thing either way.
+In-process commands are serialised by a lock. A nonzero exit is raised as
+CalledProcessError either way, so callers are unchanged.
+
+Version skew falls back to the `portolan` executable: if the library entry
+points cannot be imported (or PORTOLAN_IN_PROCESS=false), every command
+runs as a subprocess; if the installed click group rejects a command line
+as a usage error, that subcommand is sent to the CLI from then on.
+
+Wall-clock time per subcommand is counted for `log_portolan_stats`;
+commands run in pool processes (`run_in_worker`) report theirs back
+through `collect_worker`.
+"""
+
+import logging
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from shutil import copy
+from subprocess import CalledProcessError
+from subprocess import run as _run
+
+from . import catalog_docs
+from .config import PORTOLAN_IN_PROCESS
+
+try:
+    import click
+    from portolan_cli import cli as _cli
+    from portolan_cli.pmtiles import PMTilesError
+    from portolan_cli.pmtiles import generate_pmtiles as _generate_pmtiles
+except ImportError:
+    _cli = None
+
+logger = logging.getLogger(__name__)
+
+_PORTOLAN = str(Path(sys.executable).parent / "portolan")
+
+
+@dataclass
+class CommandStats:
+    """Cumulative counters for one portolan subcommand."""
+
+    calls: int = 0
+    failures: int = 0
+    subprocesses: int = 0
+    seconds: float = 0.0
+
+
+_stats: dict[str, CommandStats] = {}
+_stats_lock = threading.Lock()
+# Serialises in-process commands, which share portolan's module state
+_run_lock = threading.RLock()
+# How each in-process subcommand is told its catalog root
+_ROOT_AS_PATH = frozenset({"init", "check"})
+_ROOT_OPTIONS = {
+    "add": "--portolan-dir",
+    "rm": "--portolan-dir",
+    "stac-geoparquet": "--catalog",
+}
+# Subcommands whose command line the in-process click group rejected
+_cli_only: set[str] = set()
+
+
+def _in_process(command: str) -> bool:
+    return (
+        PORTOLAN_IN_PROCESS
+        and _cli is not None
+        and (command in _ROOT_AS_PATH or command in _ROOT_OPTIONS)
+        and command not in _cli_only
+    )
+
+
+def _rooted(args: list[str], cwd: Path) -> list[str]:
+    """Return args with cwd passed as the catalog root the command accepts."""
+    command = args[0]
+    if command in _ROOT_AS_PATH:
+        return [*args, str(cwd)]
+    return [*args, _ROOT_OPTIONS[command], str(cwd)]
+
+
+def _record(command: str, *, seconds: float, failed: bool, subprocess: bool) -> None:
+    with _stats_lock:
+        stats = _stats.setdefault(command, CommandStats())
+        stats.calls += 1
+        stats.failures += int(failed)
+        stats.subprocesses += int(subprocess)
+        stats.seconds += seconds
+
+
+def _system_exit_code(code: object) -> int:
+    """Exit status the interpreter would report for SystemExit(code)."""
+    if code is None or isinstance(code, int):
+        return code or 0
+    click.echo(code, err=True)
+    return 1
+
+
+def _exit_code(args: list[str], cwd: Path) -> int | None:
+    """Run a command line through the click group; None on a usage error."""
+    with _run_lock:
+        try:
+            rv = _cli.main(
+                args=_rooted(args, cwd), prog_name="portolan", standalone_mode=False
+            )
+        except click.UsageError as e:
+            logger.warning("portolan %s rejected in-process (%s)", args[0], e)
+            return None
+        except click.ClickException as e:
+            e.show()
+            return e.exit_code
+        except click.Abort:
+            return 1
+        except SystemExit as e:
+            return _system_exit_code(e.code)
+        except Exception:
+            logger.exception("portolan %s raised", args[0])
+            return 1
+    return rv if isinstance(rv, int) else 0
+
+
+def portolan(args: list[str], cwd: Path) -> None:
+    """Run `portolan *args` on the catalog at cwd; raise CalledProcessError on failure.
+
+    cwd must be absolute, and so must any paths in args.
+    """
+    catalog_docs.flush()
+    command = args[0]
+    started = time.monotonic()
+    code = _exit_code(args, cwd) if _in_process(command) else None
+    subprocess = code is None
+    if subprocess:
+        if _in_process(command):
+            _cli_only.add(command)
+        code = _run([_PORTOLAN, *args], cwd=cwd, check=False).returncode
+    _record(
+        command,
+        seconds=time.monotonic() - started,
+        failed=code != 0,
+        subprocess=subprocess,
+    )
+    if code != 0:
+        raise CalledProcessError(code, ["portolan", *args])
+
+
+def run_in_worker(args: list[str], cwd: Path) -> tuple[int, dict[str, CommandStats]]:
+    """Pool-worker entry: run `portolan *args` in this worker process.
+
+    Returns the exit code and the timings recorded for it; hand both to
+    `collect_worker` in the parent. The caller must flush `catalog_docs`
+    before submitting.
+    """
+    with _stats_lock:
+        _stats.clear()
+    try:
+        portolan(args, cwd)
+    except CalledProcessError as e:
+        return e.returncode, portolan_stats()
+    return 0, portolan_stats()
+
+
+def collect_worker(
+    args: list[str], result: tuple[int, dict[str, CommandStats]]
+) -> None:
+    """Count a `run_in_worker` result here; raise CalledProcessError on failure."""
+    code, stats = result
+    with _stats_lock:
+        for command, s in stats.items():
+            total = _stats.setdefault(command, CommandStats())
+            total.calls += s.calls
+            total.failures += s.failures
+            total.subprocesses += s.subprocesses
+            total.seconds += s.seconds
+    if code != 0:
+        raise CalledProcessError(code, ["portolan", *args])
+
+
+def _pmtiles_via_catalog(parquet: Path, pmtiles: Path, workers: str) -> bool:
+    """Build PMTiles through `add --pmtiles` in a throwaway catalog."""
+    stem = parquet.stem
+    with tempfile.TemporaryDirectory(prefix="portolan-pmtiles-") as tmp:
+        tmp_path = Path(tmp)
+        tmp_layer = tmp_path / "svc" / stem
+        tmp_layer.mkdir(parents=True)
+        copy(parquet, tmp_layer / parquet.name)
+        portolan(["init", "--title", "tmp", "--auto"], cwd=tmp_path)
+        try:
+            portolan(
+                ["add", f"{tmp_layer}/", "--workers", workers, "--pmtiles"],
+                cwd=tmp_path,
+            )
+        except CalledProcessError:
+            return False
+        src = tmp_layer / f"{stem}.pmtiles"
+        if not src.exists():
+            return False
+        copy(src, pmtiles)
+    return True
+
+
+def _pmtiles_in_process(parquet: Path, pmtiles: Path) -> bool:
+    # tippecanoe picks its output format from the extension
+    tmp = pmtiles.with_name(f".{pmtiles.stem}.tmp.pmtiles")
+    tmp.unlink(missing_ok=True)
+    try:
+        _generate_pmtiles(parquet, tmp, layer=parquet.stem)
+        tmp.replace(pmtiles)
+    except PMTilesError:
+        logger.exception("PMTiles generation failed for %s", parquet)
+        return False
+    finally:
+        tmp.unlink(missing_ok=True)
+    return True
+
+
+def generate_pmtiles(parquet: Path, pmtiles: Path, workers: str) -> bool:
+    """Build pmtiles from a GeoParquet with portolan's defaults; True if written.
+
+    Same output as `portolan add --pmtiles` for a catalog holding only
+    parquet: the tile layer is named after the file stem.
+    """
+    started = time.monotonic()
+    subprocess = not _in_process("add")
+    if subprocess:
+        ok = _pmtiles_via_catalog(parquet, pmtiles, workers)
+    else:
+        ok = _pmtiles_in_process(parquet, pmtiles)
+    _record(
+        "pmtiles",
+        seconds=time.monotonic() - started,
+        failed=not ok,
+        subprocess=subprocess,
+    )
+    return ok
+
+
+def portolan_stats() -> dict[str, CommandStats]:
+    """Return a snapshot of the per-subcommand counters."""
+    with _stats_lock:
+        return {
+            command: CommandStats(s.calls, s.failures, s.subprocesses, s.seconds)
+            for command, s in _stats.items()
+        }
+
+
+def log_portolan_stats() -> None:
+    """Log one line per portolan subcommand, slowest first."""
+    stats = portolan_stats()
+    for command, s in sorted(stats.items(), key=lambda kv: -kv[1].seconds):
+        logger.info(
+            "portolan %s: %d calls (%d as subprocess), %d failed, "
+            "%.1f s total, %.1f s avg",
+            command,
+            s.calls,
+            s.subprocesses,
+            s.failures,
+            s.seconds,
+            s.seconds / s.calls if s.calls else 0.0,
+        )
@@ -0,0 +1,286 @@
+"""Concurrent metadata probe for every COD-AB service and layer.
+
+Fetches each FeatureServer description and every layer description it lists
+on one asyncio event loop, bounded by ARCGIS_PROBE_CONCURRENCY in-flight
+requests. The result is the full `{service: {layer_name: LayerProbe}}` map the
+original stage needs to decide which layers changed — so a no-change run costs
+one round of small concurrent JSON requests and no extraction threads at all.
+
+Descriptions go through the on-disk conditional cache in http_cache.py, so
+unchanged services cost a 304 rather than a full body.
+
+Pre-matched `_em` layers are listed (the original stage removes their stale
+directories) but their layer descriptions are never fetched.
+
+`fingerprint_layers` is the second, narrower round, for each stored layer
+whose lastEditDate moved: one outStatistics query per layer (no geometry, no
+paging), hashed into two digests. The geometry digest covers the feature
+count, the max and sum of objectIds, and the sums of shape area and length;
+the attribute digest the field names and types, the same count and
+objectId statistics, and the latest editor-tracking edit date, so any
+feature edit moves it while a schema-free service tweak does not. Layers
+without shape area or length fields, or without editor tracking, get no
+digest for the part they cannot see and are always treated as changed. The
+original stage re-extracts a layer only when a digest changed, and records
+them in the layer's collection.json.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from dataclasses import dataclass
+
+import httpx
+
+from . import http_cache
+from .client import new_async_client
+from .config import ARCGIS_PROBE_CONCURRENCY, ARCGIS_SERVICES_URL
+
+logger = logging.getLogger(__name__)
+
+
+# Measures are rounded so float formatting noise never reads as a change
+_SIGNIFICANT_DIGITS = 12
+
+
+@dataclass(frozen=True)
+class ChecksumQuery:
+    """The fields a layer's outStatistics fingerprint query summarises."""
+
+    oid_field: str
+    measure_fields: tuple[str, ...]
+    edit_field: str | None
+
+    def statistics(self) -> list[tuple[str, str]]:
+        """Return the (statisticType, field) pairs of the query, in order."""
+        stats = [("count", self.oid_field), ("max", self.oid_field)]
+        stats.append(("sum", self.oid_field))
+        stats.extend(("sum", f) for f in self.measure_fields)
+        if self.edit_field:
+            stats.append(("max", self.edit_field))
+        return stats
+
+
+@dataclass(frozen=True)
+class LayerProbe:
+    """One layer's id and editingInfo.lastEditDate (epoch ms, None if absent).
+
+    checksum is the layer's fingerprint query and fields its (name, type)
+    pairs; None and empty for `_em` layers and layers without an objectId.
+    """
+
+    layer_id: int
+    last_edit: int | None
+    checksum: ChecksumQuery | None = None
+    fields: tuple[tuple[str, str], ...] = ()
+
+
+@dataclass(frozen=True)
+class LayerFingerprint:
+    """Digests of a layer's geometry and attribute statistics.
+
+    geometry is None for layers without shape area or length fields, and
+    attributes for layers without editor tracking: the fingerprint cannot
+    see those changes.
+    """
+
+    geometry: str | None
+    attributes: str | None
+
+    def as_dict(self) -> dict[str, str | None]:
+        """Return the form stored as cod_ab:stats_fingerprint in collection.json."""
+        return {"geometry": self.geometry, "attributes": self.attributes}
+
+    def matches(self, stored: dict | None) -> bool:
+        """Return True if stored is this fingerprint and both digests are set."""
+        return (
+            self.geometry is not None
+            and self.attributes is not None
+            and stored == self.as_dict()
+        )
+
+
+def _checksum_query(meta: dict) -> ChecksumQuery | None:
+    fields = meta.get("fields") or []
+    oid = meta.get("objectIdField") or next(
+        (f["name"] for f in fields if f.get("type") == "esriFieldTypeOID"), None
+    )
+    if oid is None:
+        return None
+    shape = meta.get("geometryProperties") or {}
+    measures = tuple(
+        f
+        for f in (shape.get("shapeAreaFieldName"), shape.get("shapeLengthFieldName"))
+        if f
+    )
+    edit_field = (meta.get("editFieldsInfo") or {}).get("editDateField")
+    return ChecksumQuery(oid, measures, edit_field)
+
+
+async def _fetch_json(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str, token: str
+) -> dict:
+    entry = http_cache.lookup(url)
+    if http_cache.is_fresh(entry):
+        return entry.body
+    async with sem:
+        r = await client.get(
+            url,
+            params={"f": "json", "token": token},
+            headers=http_cache.validators(entry),
+        )
+    return http_cache.resolve(url, entry, r)
+
+
+async def _probe_service(
+    client: httpx.AsyncClient, sem: asyncio.Semaphore, service_name: str, token: str
+) -> dict[str, LayerProbe]:
+    service_url = f"{ARCGIS_SERVICES_URL}/{service_name}/FeatureServer"
+    data = await _fetch_json(client, sem, service_url, token)
+    layers = {
+        layer["name"].lower().replace(" ", "_"): layer["id"]
+        for layer in data.get("layers", [])
+    }
+    probed = [name for name in layers if not name.endswith("_em")]
+    metas = await asyncio.gather(
+        *(
+            _fetch_json(client, sem, f"{service_url}/{layers[name]}", token)
+            for name in probed
+        )
+    )
+    result = {name: LayerProbe(layer_id, None) for name, layer_id in layers.items()}
+    for name, meta in zip(probed, metas, strict=True):
+        last_edit = (meta.get("editingInfo") or {}).get("lastEditDate")
+        result[name] = LayerProbe(
+            layers[name],
+            last_edit,
+            _checksum_query(meta),
+            tuple((f["name"], f.get("type", "")) for f in meta.get("fields") or []),
+        )
+    return result
+
+
+async def _probe_all(
+    services: list[str], token: str
+) -> dict[str, dict[str, LayerProbe]]:
+    sem = asyncio.Semaphore(ARCGIS_PROBE_CONCURRENCY)
+    async with new_async_client() as client:
+        results = await asyncio.gather(
+            *(_probe_service(client, sem, sn, token) for sn in services),
+            return_exceptions=True,
+        )
+    probes: dict[str, dict[str, LayerProbe]] = {}
+    for service_name, result in zip(services, results, strict=True):
+        if isinstance(result, BaseException):
+            logger.error("Probe failed for %s — skipping: %s", service_name, result)
+            continue
+        probes[service_name] = result
+    return probes
+
+
+def probe_services(services: list[str], token: str) -> dict[str, dict[str, LayerProbe]]:
+    """Return {service_name: {layer_name: LayerProbe}} for every probed service.
+
+    Services whose service or layer description could not be fetched are
+    logged and left out of the result, so callers treat them like a failed
+    extraction and retry on the next run.
+    """
+    probes = asyncio.run(_probe_all(services, token))
+    logger.info("Probed %d/%d services", len(probes), len(services))
+    return probes
+
+
+def _line(values: list) -> bytes:
+    normalised = [
+        float(f"{v:.{_SIGNIFICANT_DIGITS}g}") if isinstance(v, float) else v
+        for v in values
+    ]
+    return json.dumps(normalised).encode() + b"\n"
+
+
+async def _fingerprint_layer(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    layer_url: str,
+    probe: LayerProbe,
+) -> LayerFingerprint:
+    """Summarise a layer with one outStatistics query; the client adds the token."""
+    query = probe.checksum
+    stats = query.statistics()
+    out_statistics = [
+        {
+            "statisticType": kind,
+            "onStatisticField": field,
+            "outStatisticFieldName": f"s{i}",
+        }
+        for i, (kind, field) in enumerate(stats)
+    ]
+    async with sem:
+        r = await client.post(
+            f"{layer_url}/query",
+            data={
+                "where": "1=1",
+                "outStatistics": json.dumps(out_statistics),
+                "returnGeometry": "false",
+                "f": "json",
+            },
+        )
+    r.raise_for_status()
+    data = r.json()
+    if "error" in data:
+        msg = f"{layer_url}: {data['error'].get('message', data['error'])}"
+        raise RuntimeError(msg)
+    row = {
+        k.lower(): v
+        for k, v in (data.get("features") or [{}])[0].get("attributes", {}).items()
+    }
+    values = [row.get(f"s{i}") for i in range(len(stats))]
+    oid_stats = values[:3]
+    measures = values[3 : 3 + len(query.measure_fields)]
+    geometry = _line([*oid_stats, *measures])
+    edited = values[-1] if query.edit_field else None
+    attributes = _line([[list(f) for f in probe.fields], *oid_stats, edited])
+    return LayerFingerprint(
+        geometry=(
+            hashlib.sha256(geometry).hexdigest()[:16] if query.measure_fields else None
+        ),
+        attributes=(
+            hashlib.sha256(attributes).hexdigest()[:16] if query.edit_field else None
+        ),
+    )
+
+
+async def _fingerprint_all(
+    targets: dict[str, LayerProbe],
+) -> dict[str, LayerFingerprint]:
+    sem = asyncio.Semaphore(ARCGIS_PROBE_CONCURRENCY)
+    async with new_async_client() as client:
+        results = await asyncio.gather(
+            *(
+                _fingerprint_layer(client, sem, url, probe)
+                for url, probe in targets.items()
+            ),
+            return_exceptions=True,
+        )
+    fingerprints: dict[str, LayerFingerprint] = {}
+    for layer_url, result in zip(targets, results, strict=True):
+        if isinstance(result, BaseException):
+            logger.warning("Fingerprint failed for %s: %s", layer_url, result)
+            continue
+        fingerprints[layer_url] = result
+    return fingerprints
+
+
+def fingerprint_layers(targets: dict[str, LayerProbe]) -> dict[str, LayerFingerprint]:
+    """Return {layer_url: LayerFingerprint} for every target with a checksum query.
+
+    Layers whose query fails are left out, so callers fall back to
+    lastEditDate alone for them.
+    """
+    targets = {url: probe for url, probe in targets.items() if probe.checksum}
+    if not targets:
+        return {}
+    fingerprints = asyncio.run(_fingerprint_all(targets))
+    logger.info("Fingerprinted %d/%d layers", len(fingerprints), len(targets))
+    return fingerprints
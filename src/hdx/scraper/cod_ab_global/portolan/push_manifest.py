@@ -0,0 +1,344 @@
+"""Incremental push driven by a local manifest of what the remote holds.
+
+Push used to be `portolan push` over every collection — a remote
+versions.json fetch per collection, and nothing at all for a collection
+whose versions.json had not moved, even if its variant parquets, PMTiles or
+collection.json had — plus an `aws s3 sync` of the intermediate catalog.json
+and README.md files, which lists the remote and compares every local file.
+
+Published files are what portolan push would send, found from the STAC
+documents rather than the directory listing: every catalog.json and
+README.md, the root versions.json, and per collection (a directory with a
+versions.json) its collection.json, versions.json, README.md, item
+documents, and the files its versions.json assets and collection.json
+assets and links point to. Anything else in the tree — scratch files, a
+stray directory — is never uploaded.
+
+The manifest records, per published file (its path relative to the work
+dir), its stat signature, sha256 and the ETag the remote returned for it.
+Stages do not report their writes — many published files (PMTiles, items,
+versions.json) are written by portolan itself — instead a stat-only walk at
+push time finds every file whose signature moved, and only those are
+hashed. A file rewritten with the same bytes is not dirty.
+
+Without a manifest for the remote (first push, a new remote, a lost
+`.push/`), it is seeded from one listing of the remote instead of
+uploading everything: a local file is taken as already there when an
+object of the same size has the S3 ETag its bytes would get (the MD5, or
+for multipart uploads the MD5 of the part MD5s at `_PART_SIZE` parts — the
+size every upload here uses). Other ETags, as from stores that do not
+derive them from content, never match, so those files are uploaded.
+
+The dirty set is uploaded with concurrent, multipart puts in manifest-last
+phases, so a reader never sees metadata pointing at data not there yet:
+collection assets, then collection STAC files, then collection
+versions.json, then the files outside collections deepest first, with the
+root catalog.json last. A phase with failures stops the push; entries are
+recorded only once their upload succeeded, so the rest is retried next run.
+Removed files only leave the manifest: push never deleted remote objects.
+
+The manifest lives in `.push/` beside the work dir and is tied to its
+remote: pushing elsewhere reseeds it, and PORTOLAN_PUSH_MANIFEST=false
+uploads everything. The store is the one portolan's public `setup_store`
+builds (credentials, region, path-style for dotted bucket names);
+AWS_ENDPOINT_URL (with AWS_ALLOW_HTTP=true for plain http) points push at
+a local S3-compatible stand-in such as MinIO instead.
+"""
+
+import hashlib
+import logging
+import os
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import obstore as obs
+from obstore.store import ObjectStore, S3Store
+from portolan_cli.upload import parse_object_store_url, setup_store
+
+from . import catalog_docs
+from .config import (
+    AWS_ALLOW_HTTP,
+    AWS_ENDPOINT_URL,
+    PORTOLAN_PUSH_CHUNK_CONCURRENCY,
+    PORTOLAN_PUSH_MANIFEST,
+    PORTOLAN_WORKERS,
+)
+from .original import read_json_state, write_json_state
+
+logger = logging.getLogger(__name__)
+
+_COLLECTION_MARKER = "versions.json"
+_STAC_NAMES = ("catalog.json", "collection.json", "README.md")
+# Published outside collections: the root and intermediate catalogs
+_CATALOG_NAMES = ("catalog.json", "README.md")
+# Multipart part size of every upload, so seeding can recompute their ETags
+_PART_SIZE = 5 * 1024 * 1024
+
+
+class PushError(RuntimeError):
+    """Some changed files could not be uploaded; they are retried next run."""
+
+
+def _manifest_path(work_dir: Path) -> Path:
+    """Push manifest, outside the catalog tree like `.bnda`."""
+    manifest_dir = work_dir.parent / ".push"
+    manifest_dir.mkdir(exist_ok=True)
+    return manifest_dir / "manifest.json"
+
+
+def _sha256(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _collection_files(work_dir: Path, collection_dir: Path) -> set[Path]:
+    """Return the files portolan push would publish for one collection."""
+    found = {
+        collection_dir / name
+        for name in ("collection.json", "README.md", _COLLECTION_MARKER)
+    }
+    for version in read_json_state(collection_dir / _COLLECTION_MARKER).get(
+        "versions", []
+    ):
+        for key, asset in (version.get("assets") or {}).items():
+            found.add(collection_dir / key)
+            if isinstance(asset, dict) and asset.get("href"):
+                found.add(work_dir / asset["href"])
+    collection = read_json_state(collection_dir / "collection.json")
+    for entry in [
+        *(collection.get("assets") or {}).values(),
+        *collection.get("links", []),
+    ]:
+        href = entry.get("href", "") if isinstance(entry, dict) else ""
+        if href and "://" not in href:
+            found.add(Path(os.path.normpath(collection_dir / href)))
+    with os.scandir(collection_dir) as entries:
+        found.update(
+            Path(e.path) / f"{e.name}.json"
+            for e in entries
+            if e.is_dir() and not e.name.startswith(".")
+        )
+    return {
+        path
+        for path in found
+        if path.is_relative_to(collection_dir)
+        and path.is_file()
+        and not path.is_symlink()
+        and not path.name.startswith(".")
+    }
+
+
+def _walk(work_dir: Path) -> tuple[dict[str, str], set[str]]:
+    """Return ({path: stat signature} of published files, collection dirs)."""
+    published: set[Path] = set()
+    collections: set[str] = set()
+    for root, dirs, names in os.walk(work_dir):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        root_path = Path(root)
+        rel_root = root_path.relative_to(work_dir)
+        if _COLLECTION_MARKER in names and rel_root != Path():
+            collections.add(rel_root.as_posix())
+            published |= _collection_files(work_dir, root_path)
+            dirs[:] = []
+            continue
+        wanted = (
+            (*_CATALOG_NAMES, _COLLECTION_MARKER)
+            if rel_root == Path()
+            else _CATALOG_NAMES
+        )
+        published.update(root_path / name for name in wanted if name in names)
+    files: dict[str, str] = {}
+    for path in published:
+        st = path.stat()
+        files[path.relative_to(work_dir).as_posix()] = f"{st.st_mtime_ns}:{st.st_size}"
+    return files, collections
+
+
+def _s3_etag(path: Path, size: int) -> str:
+    """Return the ETag S3 gives path uploaded in `_PART_SIZE` parts."""
+    if size <= _PART_SIZE:
+        with path.open("rb") as f:
+            return hashlib.file_digest(f, "md5").hexdigest()
+    parts = []
+    with path.open("rb") as f:
+        while chunk := f.read(_PART_SIZE):
+            parts.append(hashlib.md5(chunk, usedforsecurity=False).digest())
+    digest = hashlib.md5(b"".join(parts), usedforsecurity=False).hexdigest()
+    return f"{digest}-{len(parts)}"
+
+
+def _remote_objects(store: ObjectStore, prefix: str) -> dict[str, tuple[int, str]]:
+    """Return {path relative to prefix: (size, ETag)} of every remote object."""
+    objects = {}
+    base = f"{prefix}/" if prefix else ""
+    for batch in obs.list(store, prefix=prefix or None):
+        for meta in batch:
+            if meta["path"].startswith(base) and meta.get("e_tag"):
+                objects[meta["path"][len(base) :]] = (
+                    meta["size"],
+                    meta["e_tag"].strip('"'),
+                )
+    return objects
+
+
+def _seed(
+    work_dir: Path, files: dict[str, str], store: ObjectStore, prefix: str
+) -> dict[str, dict]:
+    """Return manifest entries for local files the remote already holds."""
+    remote = _remote_objects(store, prefix)
+    candidates = [
+        rel
+        for rel, sig in files.items()
+        if rel in remote and remote[rel][0] == int(sig.split(":")[1])
+    ]
+
+    def check(rel: str) -> dict | None:
+        path = work_dir / rel
+        size, etag = remote[rel]
+        if _s3_etag(path, size) != etag:
+            return None
+        return {"sig": files[rel], "sha256": _sha256(path), "etag": etag}
+
+    with ThreadPoolExecutor(max_workers=PORTOLAN_WORKERS) as pool:
+        entries = dict(zip(candidates, pool.map(check, candidates), strict=True))
+    seeded = {rel: entry for rel, entry in entries.items() if entry is not None}
+    logger.info(
+        "Push manifest seeded from the remote: %d of %d files already there",
+        len(seeded),
+        len(files),
+    )
+    return seeded
+
+
+def _dirty(
+    work_dir: Path, files: dict[str, str], recorded: dict[str, dict]
+) -> dict[str, tuple[str, str]]:
+    """Return {path: (signature, sha256)} of files the remote does not hold.
+
+    Only files whose signature moved are hashed; one rewritten with the same
+    bytes just has its new signature recorded.
+    """
+    moved = [
+        rel for rel, sig in files.items() if recorded.get(rel, {}).get("sig") != sig
+    ]
+    with ThreadPoolExecutor(max_workers=PORTOLAN_WORKERS) as pool:
+        digests = dict(
+            zip(moved, pool.map(lambda r: _sha256(work_dir / r), moved), strict=True)
+        )
+    dirty = {}
+    for rel, digest in digests.items():
+        entry = recorded.get(rel)
+        if entry is not None and entry.get("sha256") == digest:
+            entry["sig"] = files[rel]
+        else:
+            dirty[rel] = files[rel], digest
+    return dirty
+
+
+def _in_collection(rel: str, collections: set[str]) -> bool:
+    return any(parent.as_posix() in collections for parent in Path(rel).parents)
+
+
+def _phase(rel: str, collections: set[str]) -> tuple[int, int]:
+    """Sort key putting each file after everything it may reference."""
+    name = rel.rsplit("/", 1)[-1]
+    if _in_collection(rel, collections):
+        if name == _COLLECTION_MARKER:
+            return 2, 0
+        return (1 if name in _STAC_NAMES or name.endswith(".json") else 0), 0
+    if rel == "catalog.json":
+        return 4, 0
+    return 3, -rel.count("/")
+
+
+def _phases(rels: list[str], collections: set[str]) -> Iterator[list[str]]:
+    groups: dict[tuple[int, int], list[str]] = {}
+    for rel in rels:
+        groups.setdefault(_phase(rel, collections), []).append(rel)
+    for key in sorted(groups):
+        yield sorted(groups[key])
+
+
+def _store(remote: str) -> tuple[ObjectStore, str]:
+    """Return (store, key prefix) for remote."""
+    if not (AWS_ENDPOINT_URL and remote.startswith("s3://")):
+        return setup_store(remote)
+    bucket_url, prefix = parse_object_store_url(remote)
+    endpoint = AWS_ENDPOINT_URL
+    if "://" not in endpoint:
+        endpoint = f"{'http' if AWS_ALLOW_HTTP else 'https'}://{endpoint}"
+    store = S3Store(
+        bucket_url.removeprefix("s3://"),
+        endpoint=endpoint,
+        virtual_hosted_style_request=False,
+        client_options={"allow_http": AWS_ALLOW_HTTP},
+    )
+    return store, prefix
+
+
+def _upload(
+    work_dir: Path, batches: list[list[str]], store: ObjectStore, prefix: str
+) -> Iterator[tuple[str, str | None]]:
+    """Upload files phase by phase; yield (path, etag) for each one uploaded.
+
+    Raises PushError after the first phase with failures.
+    """
+
+    def put(rel: str) -> str | None:
+        key = f"{prefix}/{rel}" if prefix else rel
+        return obs.put(
+            store,
+            key,
+            work_dir / rel,
+            chunk_size=_PART_SIZE,
+            max_concurrency=PORTOLAN_PUSH_CHUNK_CONCURRENCY,
+        ).get("e_tag")
+
+    with ThreadPoolExecutor(max_workers=PORTOLAN_WORKERS) as pool:
+        for batch in batches:
+            futures = {rel: pool.submit(put, rel) for rel in batch}
+            failed = 0
+            for rel, future in futures.items():
+                try:
+                    yield rel, future.result()
+                except Exception:
+                    logger.exception("Could not upload %s", rel)
+                    failed += 1
+            if failed:
+                msg = f"{failed} of {len(batch)} files not uploaded"
+                raise PushError(msg)
+
+
+def push(work_dir: Path, remote: str) -> None:
+    """Upload every published file that changed since the last push to remote.
+
+    Raises PushError if some could not be uploaded; those that were are
+    recorded regardless.
+    """
+    catalog_docs.flush()
+    path = _manifest_path(work_dir)
+    manifest = read_json_state(path)
+    store, prefix = _store(remote)
+    files, collections = _walk(work_dir)
+    recorded: dict[str, dict] = {}
+    if PORTOLAN_PUSH_MANIFEST and manifest.get("remote") == remote:
+        recorded = manifest.get("files", {})
+    elif PORTOLAN_PUSH_MANIFEST:
+        recorded = _seed(work_dir, files, store, prefix)
+    dirty = _dirty(work_dir, files, recorded)
+    recorded = {rel: entry for rel, entry in recorded.items() if rel in files}
+    logger.info(
+        "Push: %d of %d files changed (%.1f MB)",
+        len(dirty),
+        len(files),
+        sum(int(sig.split(":")[1]) for sig, _ in dirty.values()) / 1e6,
+    )
+    try:
+        for rel, etag in _upload(
+            work_dir, list(_phases(list(dirty), collections)), store, prefix
+        ):
+            sig, digest = dirty[rel]
+            recorded[rel] = {"sig": sig, "sha256": digest, "etag": etag}
+    finally:
+        write_json_state(path, {"remote": remote, "files": recorded})
@@ -0,0 +1,215 @@
+"""Whole-service export through ArcGIS createReplica jobs.
+
+Bootstrapping a service layer by layer costs one objectId query and
+hundreds of paged queries per layer. A hosted FeatureServer with the Sync
+or Extract capability can instead package every layer server-side: one
+asynchronous createReplica job per service (syncModel=none, a zipped file
+geodatabase in EPSG:4326) is submitted, polled until it completes, and its
+archive downloaded in one streamed request, straight to disk: it is sent
+without the shared `TokenAuth` hook, so nothing buffers it in memory. Each
+feature class is then read back with DuckDB's GDAL reader and spilled as
+Arrow IPC against the same schema and GeoParquet metadata as the paged
+path, so the encode stage cannot tell the two apart.
+
+Only used with ARCGIS_BULK_EXPORT=true, and only for services none of whose
+layers are in the work dir yet (see original.py). Layers the archive lacks,
+or whose feature count does not match the layer's, are left to the
+per-layer path.
+"""
+
+import logging
+import re
+import time
+import zipfile
+from pathlib import Path
+from shutil import rmtree
+
+import pyarrow as pa
+from geoparquet_io.core.arcgis import _align_table_to_schema
+from geoparquet_io.core.duckdb_utils import get_duckdb_connection
+
+from .auth import get_token
+from .client import get_client
+from .config import (
+    ARCGIS_EXPORT_POLL_SECONDS,
+    ARCGIS_EXPORT_TIMEOUT,
+    ARCGIS_EXTRACT_TIMEOUT,
+)
+from .extract import _layer_info, _spill_schema, fetch_count, remove_spill
+from .utils import fetch_json
+
+logger = logging.getLogger(__name__)
+
+_REPLICA_CAPABILITIES = frozenset({"sync", "extract"})
+_DONE = "completed"
+_FAILED = frozenset({"failed", "completedwitherrors"})
+
+
+class ReplicaError(RuntimeError):
+    """The export job could not be created, failed, or timed out."""
+
+
+def supports_replica(service_meta: dict) -> bool:
+    """Return True if a FeatureServer description allows createReplica."""
+    capabilities = {
+        c.strip().lower() for c in (service_meta.get("capabilities") or "").split(",")
+    }
+    return bool(capabilities & _REPLICA_CAPABILITIES)
+
+
+def _submit_job(service_url: str, token: str, layer_ids: list[str]) -> str:
+    """Start an async createReplica job; return its status URL."""
+    r = get_client().post(
+        f"{service_url}/createReplica",
+        data={
+            "replicaName": f"portolan_{int(time.time())}",
+            "layers": ",".join(layer_ids),
+            "returnAttachments": "false",
+            "syncModel": "none",
+            "dataFormat": "filegdb",
+            "replicaSR": '{"wkid": 4326}',
+            "transportType": "esriTransportTypeUrl",
+            "async": "true",
+            "f": "json",
+            "token": token,
+        },
+    )
+    r.raise_for_status()
+    data = r.json()
+    if "statusUrl" not in data:
+        msg = f"{service_url}: createReplica refused: {data.get('error', data)}"
+        raise ReplicaError(msg)
+    return data["statusUrl"]
+
+
+def _wait_for_job(status_url: str, token: str) -> str:
+    """Poll a replica job until it completes; return the result archive URL."""
+    deadline = time.monotonic() + ARCGIS_EXPORT_TIMEOUT
+    while time.monotonic() < deadline:
+        r = get_client().get(status_url, params={"f": "json", "token": token})
+        r.raise_for_status()
+        data = r.json()
+        status = (data.get("status") or "").lower()
+        if status == _DONE and data.get("resultUrl"):
+            return data["resultUrl"]
+        if status in _FAILED or "error" in data:
+            msg = f"replica job failed: {data.get('error', data)}"
+            raise ReplicaError(msg)
+        time.sleep(ARCGIS_EXPORT_POLL_SECONDS)
+    msg = f"replica job not done after {ARCGIS_EXPORT_TIMEOUT}s: {status_url}"
+    raise ReplicaError(msg)
+
+
+def _download(url: str, dest: Path) -> None:
+    """Stream url to dest, passing the current token itself rather than by hook."""
+    with (
+        get_client(ARCGIS_EXTRACT_TIMEOUT).stream(
+            "GET", url, params={"token": get_token()}, auth=None
+        ) as r,
+        dest.open("wb") as f,
+    ):
+        r.raise_for_status()
+        for chunk in r.iter_bytes():
+            f.write(chunk)
+
+
+def _find_gdb(root: Path) -> Path:
+    gdb = next(root.rglob("*.gdb"), None)
+    if gdb is None:
+        msg = "replica archive holds no file geodatabase"
+        raise ReplicaError(msg)
+    return gdb
+
+
+def _feature_class_name(layer_name: str) -> str:
+    """File geodatabase name ArcGIS gives a layer: non-word characters → "_"."""
+    return re.sub(r"\W", "_", layer_name)
+
+
+def _spill_feature_class(
+    gdb: Path, feature_class: str, layer_meta: dict, spill_path: Path
+) -> int:
+    """Stream one feature class into an Arrow IPC spill; return rows written."""
+    schema = _spill_schema(_layer_info(layer_meta, 0))
+    remove_spill(spill_path)
+    con = get_duckdb_connection(load_spatial=True, load_httpfs=False)
+    rows = 0
+    try:
+        reader = con.execute(f"""
+            SELECT ST_AsWKB(geom) AS geometry, * EXCLUDE (geom)
+            FROM ST_Read('{gdb}', layer := '{feature_class}')
+        """).fetch_record_batch()
+        with (
+            pa.OSFile(str(spill_path), "wb") as sink,
+            pa.ipc.new_file(sink, schema) as writer,
+        ):
+            for batch in reader:
+                table = pa.Table.from_batches([batch])
+                writer.write_table(
+                    _align_table_to_schema(table, schema).cast(schema, safe=True)
+                )
+                rows += batch.num_rows
+    finally:
+        con.close()
+    return rows
+
+
+def _split_archive(gdb: Path, token: str, layer_spills: dict[str, Path]) -> set[str]:
+    """Spill every requested layer found in gdb; return the layer URLs done."""
+    done: set[str] = set()
+    for layer_url, spill_path in layer_spills.items():
+        layer_meta = fetch_json(layer_url, token)
+        feature_class = _feature_class_name(layer_meta.get("name", ""))
+        try:
+            rows = _spill_feature_class(gdb, feature_class, layer_meta, spill_path)
+            expected = fetch_count(layer_url, token)
+        except Exception:
+            logger.exception("%s not readable from the replica", layer_url)
+            remove_spill(spill_path)
+            continue
+        if rows != expected:
+            logger.warning(
+                "%s: replica has %d of %d features — skipping",
+                layer_url,
+                rows,
+                expected,
+            )
+            remove_spill(spill_path)
+            continue
+        done.add(layer_url)
+    return done
+
+
+def export_service(
+    service_url: str, token: str, layer_spills: dict[str, Path], scratch_dir: Path
+) -> set[str]:
+    """Export a service's layers with one replica job and spill each of them.
+
+    layer_spills maps each wanted layer URL (`{service_url}/{id}`) to its
+    spill path. Returns the layer URLs whose spill was written; raises
+    ReplicaError if the service cannot be exported at all. The archive is
+    unpacked under scratch_dir, which is removed afterwards.
+    """
+    if not supports_replica(fetch_json(service_url, token)):
+        msg = f"{service_url} has neither Sync nor Extract enabled"
+        raise ReplicaError(msg)
+    layer_ids = [url.rsplit("/", 1)[1] for url in layer_spills]
+    started = time.monotonic()
+    result_url = _wait_for_job(_submit_job(service_url, token, layer_ids), token)
+    scratch_dir.mkdir(parents=True, exist_ok=True)
+    try:
+        archive = scratch_dir / "replica.zip"
+        _download(result_url, archive)
+        with zipfile.ZipFile(archive) as zf:
+            zf.extractall(scratch_dir / "unpacked")
+        done = _split_archive(_find_gdb(scratch_dir / "unpacked"), token, layer_spills)
+    finally:
+        rmtree(scratch_dir, ignore_errors=True)
+    logger.info(
+        "Exported %d of %d layers of %s in %.0fs",
+        len(done),
+        len(layer_spills),
+        service_url,
+        time.monotonic() - started,
+    )
+    return done
@@ -1,53 +1,101 @@
-"""ArcGIS HTTP helpers for token generation, JSON fetching, and service discovery."""
+"""ArcGIS HTTP helpers for token generation, JSON fetching, and service discovery.
 
-import re
+Also the catalog layout helpers several stages share: admin layer change
+maps and the latest/historic split of versioned service directories.
+"""
 
-import httpx
+import logging
+import re
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 from hdx.scraper.cod_ab_global.config import admin_level_full_overrides
 
+from . import catalog_docs, catalog_index, http_cache
+from .auth import get_token
+from .client import get_client
 from .config import (
-    ARCGIS_EXPIRATION,
-    ARCGIS_PASSWORD,
+    ARCGIS_PAGE_WORKERS,
     ARCGIS_SERVER,
     ARCGIS_SERVICES_URL,
-    ARCGIS_TIMEOUT,
-    ARCGIS_TOKEN_URL,
-    ARCGIS_USERNAME,
 )
 
+logger = logging.getLogger(__name__)
+
 _METADATA_TABLE_URL = (
     f"{ARCGIS_SERVER}/server/rest/services/Hosted/COD_Global_Metadata/FeatureServer/0"
 )
+_METADATA_PAGE_SIZE = 1000
 
+# All meaningful fields from COD_Global_Metadata (mirrors refactor.py's column list).
+# Written as cod_ab:* custom STAC properties so the table is reconstructable from
+# the catalog.
+COD_AB_METADATA_FIELDS = [
+    "country_name",
+    "country_iso2",
+    "country_iso3",
+    "version",
+    "admin_level_full",
+    "admin_level_max",
+    "admin_1_name",
+    "admin_2_name",
+    "admin_3_name",
+    "admin_4_name",
+    "admin_5_name",
+    "admin_1_count",
+    "admin_2_count",
+    "admin_3_count",
+    "admin_4_count",
+    "admin_5_count",
+    "admin_notes",
+    "date_source",
+    "date_updated",
+    "date_reviewed",
+    "date_metadata",
+    "date_valid_on",
+    "date_valid_to",
+    "update_frequency",
+    "update_type",
+    "source",
+    "contributor",
+    "methodology_dataset",
+    "methodology_pcodes",
+    "caveats",
+]
+
+# Also needed to key rows by service; not written to the catalog.
+_METADATA_OUT_FIELDS = ",".join([*COD_AB_METADATA_FIELDS, "feature_server_url"])
+
+# Matches adm0, adm1, ..., adm9. Excludes lines, points, capitals, regions.
+ADMIN_POLYGON_RE = re.compile(r"^adm\d$")
+_VERSION_RE = re.compile(r"^v(\d+)$")
 # Matches cod_ab_<ISO3> and cod_ab_<ISO3>_v<N> — excludes non-country entries
 # like COD_AB_Style_Template.
 _SERVICE_RE = re.compile(r"^cod_ab_[a-z]{3}(_v\d+)?$", re.IGNORECASE)
 
 
 def generate_token() -> str:
-    """Generate an ArcGIS Enterprise token via username/password authentication."""
-    with httpx.Client(http2=True) as client:
-        r = client.post(
-            ARCGIS_TOKEN_URL,
-            data={
-                "username": ARCGIS_USERNAME,
-                "password": ARCGIS_PASSWORD,
-                "referer": f"{ARCGIS_SERVER}/portal",
-                "expiration": str(ARCGIS_EXPIRATION),
-                "f": "json",
-            },
-        )
-        r.raise_for_status()
-        return r.json()["token"]
+    """Return the shared ArcGIS Enterprise token (see auth.py).
+
+    Reuses a cached token while it is valid; the pooled clients keep it fresh
+    and retry once on an invalid-token error, so callers may hold on to it.
+    """
+    return get_token()
 
 
 def fetch_json(url: str, token: str) -> dict:
-    """Fetch a JSON response from an ArcGIS REST endpoint with token auth."""
-    with httpx.Client(http2=True, timeout=ARCGIS_TIMEOUT) as client:
-        r = client.get(url, params={"f": "json", "token": token})
-        r.raise_for_status()
-        return r.json()
+    """Fetch a JSON response from an ArcGIS REST endpoint with token auth.
+
+    Goes through the on-disk conditional cache (see http_cache.py).
+    """
+    entry = http_cache.lookup(url)
+    if http_cache.is_fresh(entry):
+        return entry.body
+    r = get_client().get(
+        url, params={"f": "json", "token": token}, headers=http_cache.validators(entry)
+    )
+    return http_cache.resolve(url, entry, r)
 
 
 def _is_newer(row: dict, current: dict | None) -> bool:
@@ -61,32 +109,81 @@ def _is_newer(row: dict, current: dict | None) -> bool:
     return (row.get("date_valid_on") or "") > (current.get("date_valid_on") or "")
 
 
+def _query_metadata(token: str, params: dict) -> dict:
+    r = get_client().get(
+        f"{_METADATA_TABLE_URL}/query",
+        params={**params, "f": "json", "token": token},
+    )
+    r.raise_for_status()
+    data = r.json()
+    if "error" in data:
+        msg = f"COD_Global_Metadata: {data['error'].get('message', data['error'])}"
+        raise RuntimeError(msg)
+    return data
+
+
+def _metadata_page(
+    token: str, oid_field: str, offset: int, page_size: int
+) -> list[dict]:
+    data = _query_metadata(
+        token,
+        {
+            "where": "1=1",
+            "outFields": _METADATA_OUT_FIELDS,
+            "orderByFields": oid_field,
+            "resultOffset": str(offset),
+            "resultRecordCount": str(page_size),
+            "returnGeometry": "false",
+        },
+    )
+    return [f["attributes"] for f in data.get("features", [])]
+
+
+def _iter_metadata_rows(token: str) -> Iterator[dict]:
+    """Yield every COD_Global_Metadata row, in objectId order.
+
+    The total comes from returnCountOnly; all pages are then requested at
+    once over ARCGIS_PAGE_WORKERS threads and yielded in order as they
+    arrive. A row count that disagrees with the total is logged rather than
+    silently ignored.
+    """
+    with ThreadPoolExecutor(max_workers=ARCGIS_PAGE_WORKERS) as pool:
+        layer_future = pool.submit(fetch_json, _METADATA_TABLE_URL, token)
+        count_future = pool.submit(
+            _query_metadata, token, {"where": "1=1", "returnCountOnly": "true"}
+        )
+        layer = layer_future.result()
+        total = int(count_future.result().get("count", 0))
+        oid_field = layer.get("objectIdField") or "objectid"
+        page_size = min(
+            _METADATA_PAGE_SIZE, layer.get("maxRecordCount") or _METADATA_PAGE_SIZE
+        )
+        pages = [
+            pool.submit(_metadata_page, token, oid_field, offset, page_size)
+            for offset in range(0, total, page_size)
+        ]
+        rows = 0
+        for page in pages:
+            for row in page.result():
+                rows += 1
+                yield row
+    if rows != total:
+        logger.warning("COD_Global_Metadata: fetched %d of %d rows", rows, total)
+
+
 def fetch_metadata_table(token: str) -> dict[str, dict]:
     """Return {service_name_lower: attrs} for all COD-AB metadata rows.
 
     Includes versioned entries (cod_ab_afg_v01) keyed via feature_server_url,
     versioned fallback entries via (iso3, version) when the URL is malformed,
     and unversioned entries (cod_ab_afg) mapped to the latest row per ISO3.
+    Only COD_AB_METADATA_FIELDS (plus feature_server_url) are fetched.
     """
-    with httpx.Client(http2=True, timeout=ARCGIS_TIMEOUT) as client:
-        r = client.get(
-            f"{_METADATA_TABLE_URL}/query",
-            params={
-                "where": "1=1",
-                "outFields": "*",
-                "resultRecordCount": "2000",
-                "f": "json",
-                "token": token,
-            },
-        )
-        r.raise_for_status()
-        rows = [f["attributes"] for f in r.json().get("features", [])]
-
     result: dict[str, dict] = {}
     by_iso3_version: dict[tuple[str, str], dict] = {}
     by_iso3_latest: dict[str, dict] = {}
 
-    for row in rows:
+    for row in _iter_metadata_rows(token):
         url = row.get("feature_server_url") or ""
         if "/Hosted/" in url and "/FeatureServer" in url:
             svc = url.split("/Hosted/")[-1].split("/")[0].lower()
@@ -127,3 +224,72 @@ def list_services(token: str) -> list[str]:
         if _SERVICE_RE.match(name):
             results.append(name)
     return results
+
+
+def layer_data_updated(collection: dict) -> str | None:
+    """Return when a layer collection's data last changed.
+
+    That is the later of cod_ab:geometry_updated and cod_ab:attributes_updated,
+    which only move when a fingerprint digest does, so a lastEditDate bump
+    with unchanged data leaves it alone. Falls back to the STAC updated field
+    for layers that have no fingerprint.
+    """
+    geometry = collection.get("cod_ab:geometry_updated")
+    attributes = collection.get("cod_ab:attributes_updated")
+    if geometry and attributes:
+        return max(geometry, attributes)
+    return collection.get("updated")
+
+
+def get_admin_updated_map(version_dir: Path) -> dict[str, str]:
+    """Return {layer_short: data_updated_iso} for the adm* layers of a version.
+
+    Keyed on `layer_data_updated` rather than the STAC updated field, so a
+    lastEditDate bump the fingerprint shows left the data alone does not
+    rebuild extended, matched, or global.
+    """
+    result = {}
+    if not version_dir.exists():
+        return result
+    for layer_dir in sorted(version_dir.iterdir()):
+        if not layer_dir.is_dir() or layer_dir.name.startswith("."):
+            continue
+        if not ADMIN_POLYGON_RE.match(layer_dir.name):
+            continue
+        updated = layer_data_updated(
+            catalog_docs.load(layer_dir / "collection.json") or {}
+        )
+        if updated:
+            result[layer_dir.name] = updated
+    return result
+
+
+def _iter_version_dirs(work_dir: Path) -> list[tuple[str, int, Path]]:
+    """Return [(iso3, version_num, version_dir), ...] for every versioned service."""
+    result = []
+    for iso3, version in catalog_index.services(work_dir):
+        match = _VERSION_RE.match(version)
+        if match:
+            result.append((iso3, int(match.group(1)), work_dir / iso3 / version))
+    return result
+
+
+def partition_by_version(
+    work_dir: Path,
+) -> tuple[dict[str, Path], dict[str, list[Path]]]:
+    """Return (latest, historic) service dirs per iso3, before ISO3 filtering.
+
+    latest: {iso3: version_dir} for the highest vNN per country.
+    historic: {iso3: [version_dir, ...]} for all lower vNN, ascending order.
+    """
+    by_iso3: dict[str, list[tuple[int, Path]]] = {}
+    for iso3, num, version_dir in _iter_version_dirs(work_dir):
+        by_iso3.setdefault(iso3, []).append((num, version_dir))
+
+    latest: dict[str, Path] = {}
+    historic: dict[str, list[Path]] = {}
+    for iso3, versions in by_iso3.items():
+        versions.sort(key=lambda v: v[0])
+        historic[iso3] = [v[1] for v in versions[:-1]]
+        latest[iso3] = versions[-1][1]
+    return latest, historic
@@ -0,0 +1,68 @@
+"""Tests for token renewal in portolan.auth."""
+
+from collections.abc import Iterator
+
+import httpx
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import auth
+from hdx.scraper.cod_ab_global.portolan.auth import TokenAuth
+from hdx.scraper.cod_ab_global.portolan.config import ARCGIS_SERVER
+
+
+class _ClosingStream(httpx.SyncByteStream):
+    """Body that records when it is closed."""
+
+    def __init__(self) -> None:
+        self.closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield b"\0" * 4096
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_large_rejection_is_closed_before_renewing(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    rejected = _ClosingStream()
+    tokens = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        tokens.append(request.url.params.get("token"))
+        if len(tokens) == 1:
+            # Not a body the hook would sniff for an error
+            return httpx.Response(
+                498, headers={"content-type": "application/pbf"}, stream=rejected
+            )
+        return httpx.Response(200, json={})
+
+    def renew(stale: str) -> str:
+        assert rejected.closed
+        return f"renewed-{stale}"
+
+    monkeypatch.setattr(auth._manager, "get", lambda: "stale")  # noqa: SLF001
+    monkeypatch.setattr(auth._manager, "renew", renew)  # noqa: SLF001
+    client = httpx.Client(transport=httpx.MockTransport(handler), auth=TokenAuth())
+    r = client.get(f"{ARCGIS_SERVER}/server/rest/services/x/FeatureServer/0/query")
+    assert r.status_code == 200
+    assert tokens == ["stale", "renewed-stale"]
+
+
+def test_background_refresh_generates_outside_the_lock(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    manager = auth._TokenManager(None)  # noqa: SLF001
+    token = auth._Token("new", 4_102_444_800.0, "user", ARCGIS_SERVER)  # noqa: SLF001
+    held = []
+
+    def generate() -> auth._Token:
+        held.append(manager._lock.locked())  # noqa: SLF001
+        return token
+
+    monkeypatch.setattr(manager, "_generate", generate)
+    monkeypatch.setattr(manager, "_schedule", lambda _delay=None: None)
+    manager._refresh()  # noqa: SLF001
+    assert held == [False]
+    assert manager._token == token  # noqa: SLF001
@@ -0,0 +1,45 @@
+"""Tests for reading service props from portolan.catalog_index."""
+
+import json
+import os
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import catalog_index
+
+
+@pytest.fixture
+def work_dir(tmp_path: Path) -> Iterator[Path]:
+    work_dir = tmp_path / "catalog"
+    (work_dir / "afg" / "v01" / "adm1").mkdir(parents=True)
+    yield work_dir
+    if catalog_index._con is not None:  # noqa: SLF001
+        catalog_index._con.close()  # noqa: SLF001
+    catalog_index._work_dir = catalog_index._con = None  # noqa: SLF001
+
+
+def _write_catalog(version_dir: Path, props: dict, mtime_ns: int) -> None:
+    catalog = version_dir / "catalog.json"
+    catalog.write_text(json.dumps({"type": "Catalog", **props}))
+    os.utime(catalog, ns=(mtime_ns, mtime_ns))
+
+
+def test_service_props_follow_rewrites_outside_catalog_docs(work_dir: Path) -> None:
+    version_dir = work_dir / "afg" / "v01"
+    _write_catalog(version_dir, {"cod_ab:date_valid_to": None}, 1_000_000_000)
+    catalog_index.attach(work_dir)
+    assert catalog_index.service_props(version_dir) == {"cod_ab:date_valid_to": None}
+
+    # As portolan's add or check --fix would, without telling the index
+    _write_catalog(version_dir, {"cod_ab:date_valid_to": "2026-01-01"}, 2_000_000_000)
+    assert catalog_index.service_props(version_dir) == {
+        "cod_ab:date_valid_to": "2026-01-01"
+    }
+
+
+def test_service_props_of_unknown_service(work_dir: Path) -> None:
+    catalog_index.attach(work_dir)
+    assert catalog_index.service_props(work_dir / "zzz" / "v01") == {}
+    assert catalog_index.services(work_dir) == [("afg", "v01")]
@@ -0,0 +1,57 @@
+"""Tests for relinking recompressed parquets in portolan.compaction."""
+
+from pathlib import Path
+
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import compaction
+
+
+def _fast_pair(tmp_path: Path) -> tuple[Path, Path]:
+    """Return an original.parquet and its hardlinked twin, both fast-tier."""
+    src = tmp_path / "a" / "original.parquet"
+    twin = tmp_path / "b" / "original.parquet"
+    src.parent.mkdir()
+    twin.parent.mkdir()
+    src.write_bytes(b"fast")
+    twin.hardlink_to(src)
+    for path in (src, twin):
+        compaction._marker(path).touch()  # noqa: SLF001
+    return src, twin
+
+
+def test_compact_group_relinks_every_path(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src, twin = _fast_pair(tmp_path)
+    monkeypatch.setattr(
+        compaction, "_recompress", lambda _src, dest: dest.write_bytes(b"archived")
+    )
+    assert compaction._compact_group([src, twin]) == 2  # noqa: SLF001
+    assert src.read_bytes() == twin.read_bytes() == b"archived"
+    assert src.stat().st_ino == twin.stat().st_ino
+    assert not compaction.is_fast(src)
+    assert not compaction.is_fast(twin)
+    assert not list(tmp_path.rglob(".*.link"))
+    assert not list(tmp_path.rglob(".*.compact"))
+
+
+def test_compact_group_skips_path_rewritten_during_recompress(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    src, twin = _fast_pair(tmp_path)
+
+    def recompress(_src: Path, dest: Path) -> None:
+        dest.write_bytes(b"archived")
+        # A stage replaces the twin after the first path's check was taken
+        fresh = twin.with_name(".fresh")
+        fresh.write_bytes(b"new fast data")
+        fresh.replace(twin)
+
+    monkeypatch.setattr(compaction, "_recompress", recompress)
+    assert compaction._compact_group([src, twin]) == 1  # noqa: SLF001
+    assert src.read_bytes() == b"archived"
+    assert not compaction.is_fast(src)
+    assert twin.read_bytes() == b"new fast data"
+    assert compaction.is_fast(twin)
+    assert not list(tmp_path.rglob(".*.link"))
@@ -0,0 +1,154 @@
+"""Tests for encoding spilled layers in portolan.extract."""
+
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from shapely import Polygon, box, from_wkb, to_wkb
+
+from hdx.scraper.cod_ab_global.portolan import extract
+from hdx.scraper.cod_ab_global.portolan.extract import (
+    _fetch_range,
+    _geo_metadata,
+    _layer_info,
+    _RangeQuery,
+    _spill_schema,
+    encode_layer,
+    ids_path,
+)
+from hdx.scraper.cod_ab_global.portolan.pbf import PbfDecodeError
+
+_BBOX_FIELDS = ("xmin", "ymin", "xmax", "ymax")
+_BBOX = pa.struct([(name, pa.float64()) for name in _BBOX_FIELDS])
+
+
+def _write_ipc(table: pa.Table, path: Path) -> None:
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as w:
+        w.write_table(table)
+
+
+def _spill(path: Path, rows: list[tuple], *, with_bbox: bool) -> None:
+    """Write (objectid, name, bounds) rows as a spill of box polygons."""
+    columns = {
+        "OBJECTID": pa.array([oid for oid, _, _ in rows], pa.int64()),
+        "name": pa.array([name for _, name, _ in rows]),
+        "geometry": pa.array([to_wkb(box(*b)) for _, _, b in rows], pa.binary()),
+    }
+    if with_bbox:
+        columns["bbox"] = pa.array(
+            [dict(zip(_BBOX_FIELDS, b, strict=True)) for _, _, b in rows], _BBOX
+        )
+    table = pa.table(columns).replace_schema_metadata(
+        {b"geo": _geo_metadata("esriGeometryPolygon")}
+    )
+    _write_ipc(table, path)
+
+
+def test_delta_recomputes_bbox_of_edited_geometry(tmp_path: Path) -> None:
+    out = tmp_path / "original.parquet"
+    full = tmp_path / "full.arrow"
+    _spill(
+        full,
+        [(1, "A", (0, 0, 1, 1)), (2, "B", (1, 0, 2, 1)), (3, "C", (2, 0, 3, 1))],
+        with_bbox=True,
+    )
+    encode_layer(full, out)
+
+    delta = tmp_path / "delta.arrow"
+    _spill(delta, [(2, "B2", (1, 0, 2.5, 1.5))], with_bbox=False)
+    _write_ipc(pa.table({"OBJECTID": pa.array([1, 2], pa.int64())}), ids_path(delta))
+    encode_layer(delta, out, delta=True)
+
+    rows = {row["OBJECTID"]: row for row in pq.read_table(out).to_pylist()}
+    assert set(rows) == {1, 2}
+    assert rows[2]["name"] == "B2"
+    assert rows[2]["bbox"] == {"xmin": 1.0, "ymin": 0.0, "xmax": 2.5, "ymax": 1.5}
+    assert rows[1]["bbox"] == {"xmin": 0.0, "ymin": 0.0, "xmax": 1.0, "ymax": 1.0}
+
+
+def _spill_polygons(path: Path, polygons: list[Polygon]) -> None:
+    table = pa.table(
+        {
+            "OBJECTID": pa.array(range(1, len(polygons) + 1), pa.int64()),
+            "geometry": pa.array([to_wkb(p) for p in polygons], pa.binary()),
+        }
+    ).replace_schema_metadata({b"geo": _geo_metadata("esriGeometryPolygon")})
+    _write_ipc(table, path)
+
+
+def _geometries(path: Path) -> dict[int, Polygon]:
+    table = pq.read_table(path)
+    return dict(
+        zip(
+            table.column("OBJECTID").to_pylist(),
+            (from_wkb(g) for g in table.column("geometry").to_pylist()),
+            strict=True,
+        )
+    )
+
+
+def test_grid_snap_keeps_shared_edges(tmp_path: Path) -> None:
+    out = tmp_path / "original.parquet"
+    spill = tmp_path / "layer.arrow"
+    _spill_polygons(spill, [box(0, 0, 1.04, 1), box(1.04, 0, 2, 1)])
+    encode_layer(spill, out, grid=0.1)
+    geometries = _geometries(out)
+    assert geometries[1].equals(box(0, 0, 1, 1))
+    assert geometries[2].equals(box(1, 0, 2, 1))
+
+
+def test_grid_snap_skipped_when_it_breaks_coverage(tmp_path: Path) -> None:
+    out = tmp_path / "original.parquet"
+    spill = tmp_path / "layer.arrow"
+    # A notch in the second polygon 0.02 from the shared edge: snapped alone,
+    # it moves onto that edge and overlaps the first polygon
+    notched = Polygon([(2, 0), (3, 0), (3, 1), (2.3, 1), (2.02, 0.5), (2, 1)])
+    polygons = [box(1, 0, 2, 1), notched]
+    _spill_polygons(spill, polygons)
+    encode_layer(spill, out, grid=0.1)
+    geometries = _geometries(out)
+    assert geometries[1].equals(polygons[0])
+    assert geometries[2].equals(notched)
+
+
+@pytest.mark.parametrize(
+    "error", [PbfDecodeError("truncated message"), pa.ArrowInvalid("bad cast")]
+)
+def test_unusable_pbf_page_is_refetched_as_geojson(
+    monkeypatch: pytest.MonkeyPatch, error: Exception
+) -> None:
+    layer_meta = {
+        "geometryType": "esriGeometryPolygon",
+        "fields": [
+            {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+            {"name": "name", "type": "esriFieldTypeString"},
+        ],
+    }
+    schema = _spill_schema(_layer_info(layer_meta, 1))
+    query = _RangeQuery("https://example.org/0", "t", "OBJECTID", schema, pbf=True)
+
+    def fail_pbf(*_args: object) -> None:
+        raise error
+
+    def geojson(_url: str, _token: str, params: dict, _timeout: float) -> dict:
+        assert params["f"] == "geojson"
+        return {
+            "features": [
+                {
+                    "type": "Feature",
+                    "properties": {"OBJECTID": 5, "name": "A"},
+                    "geometry": {
+                        "type": "Polygon",
+                        "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 0]]],
+                    },
+                }
+            ]
+        }
+
+    monkeypatch.setattr(extract, "_query_pbf", fail_pbf)
+    monkeypatch.setattr(extract, "_query", geojson)
+    table = _fetch_range(query, [5])
+    assert table.schema.names == schema.names
+    assert table.column("name").to_pylist() == ["A"]
+    assert from_wkb(table.column("geometry")[0].as_py()).area == pytest.approx(0.5)
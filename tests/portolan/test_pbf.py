@@ -0,0 +1,212 @@
+"""Round-trip tests for the FeatureCollectionPBuffer decoder in portolan.pbf.
+
+The fixtures are encoded here field by field after Esri's
+FeatureCollection.proto, the same layout a FeatureServer sends for
+`query?f=pbf`.
+"""
+
+import struct
+
+import pyarrow as pa
+import pytest
+from shapely import from_wkb
+
+from hdx.scraper.cod_ab_global.portolan.pbf import PbfDecodeError, decode_feature_page
+
+_POINT, _POLYGON = 0, 3
+_UPPER_LEFT, _LOWER_LEFT = 0, 1
+
+
+def _varint(n: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte, n = n & 0x7F, n >> 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _varint_field(number: int, value: int) -> bytes:
+    return _varint(number << 3) + _varint(value)
+
+
+def _double_field(number: int, value: float) -> bytes:
+    return _varint(number << 3 | 1) + struct.pack("<d", value)
+
+
+def _len_field(number: int, payload: bytes) -> bytes:
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _value(v: object) -> bytes:
+    if v is None:
+        return b""
+    if isinstance(v, str):
+        return _len_field(1, v.encode())
+    if isinstance(v, float):
+        return _double_field(3, v)
+    return _varint_field(8, _zigzag(v))
+
+
+class _Quantizer:
+    """Esri Transform: integer grid coordinates from map coordinates."""
+
+    def __init__(
+        self, scale: float, translate: tuple[float, float], origin: int
+    ) -> None:
+        self.scale = scale
+        self.translate = translate
+        self.origin = origin
+
+    def message(self) -> bytes:
+        return (
+            _varint_field(1, self.origin)
+            + _len_field(2, _double_field(1, self.scale) + _double_field(2, self.scale))
+            + _len_field(
+                3,
+                _double_field(1, self.translate[0])
+                + _double_field(2, self.translate[1]),
+            )
+        )
+
+    def grid(self, x: float, y: float) -> tuple[int, int]:
+        tx, ty = self.translate
+        gy = (ty - y) if self.origin == _UPPER_LEFT else (y - ty)
+        return round((x - tx) / self.scale), round(gy / self.scale)
+
+
+def _geometry(parts: list[list[tuple[float, float]]], q: _Quantizer) -> bytes:
+    """Encode parts as one Geometry message of delta-encoded grid coordinates."""
+    coords = []
+    prev = (0, 0)
+    for part in parts:
+        for x, y in part:
+            cur = q.grid(x, y)
+            coords += [cur[0] - prev[0], cur[1] - prev[1]]
+            prev = cur
+    lengths = b"".join(_varint(len(p)) for p in parts)
+    packed = b"".join(_varint(_zigzag(c)) for c in coords)
+    return _len_field(2, lengths) + _len_field(3, packed)
+
+
+def _collection(
+    geometry_type: int,
+    names: list[str],
+    features: list[tuple[list[object], list[list[tuple[float, float]]] | None]],
+    q: _Quantizer,
+    *,
+    exceeded: bool = False,
+) -> bytes:
+    result = _varint_field(7, geometry_type)
+    if exceeded:
+        result += _varint_field(9, 1)
+    result += _len_field(12, q.message())
+    for name in names:
+        result += _len_field(13, _len_field(1, name.encode()))
+    for attributes, parts in features:
+        feature = b"".join(_len_field(1, _value(v)) for v in attributes)
+        if parts is not None:
+            feature += _len_field(2, _geometry(parts, q))
+        result += _len_field(15, feature)
+    return _len_field(2, _len_field(1, result))
+
+
+def test_points_with_quantized_transform() -> None:
+    q = _Quantizer(0.25, (10.0, 20.0), _UPPER_LEFT)
+    body = _collection(
+        _POINT,
+        ["OBJECTID", "name"],
+        [([1, "a"], [[(11.5, 19.25)]]), ([2, "b"], [[(9.0, 21.0)]])],
+        q,
+    )
+    page = decode_feature_page(body)
+    assert page.columns == {"OBJECTID": [1, 2], "name": ["a", "b"]}
+    points = [from_wkb(g) for g in page.geometries]
+    assert [(p.x, p.y) for p in points] == [(11.5, 19.25), (9.0, 21.0)]
+    assert not page.exceeded_transfer_limit
+
+
+def test_polygon_with_hole_is_rfc7946_oriented() -> None:
+    q = _Quantizer(0.5, (0.0, 0.0), _LOWER_LEFT)
+    # Esri rings: clockwise exterior, counter-clockwise hole
+    exterior = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+    hole = [(2, 2), (4, 2), (4, 4), (2, 4), (2, 2)]
+    body = _collection(_POLYGON, ["OBJECTID"], [([7], [exterior, hole])], q)
+    polygon = from_wkb(decode_feature_page(body).geometries[0])
+    assert polygon.geom_type == "Polygon"
+    assert polygon.is_valid
+    assert polygon.area == pytest.approx(96.0)
+    assert polygon.exterior.is_ccw
+    assert len(polygon.interiors) == 1
+    assert not polygon.interiors[0].is_ccw
+
+
+def test_separate_exteriors_make_a_multipolygon() -> None:
+    q = _Quantizer(1.0, (0.0, 0.0), _LOWER_LEFT)
+    first = [(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)]
+    second = [(5, 5), (5, 6), (6, 6), (6, 5), (5, 5)]
+    body = _collection(_POLYGON, ["OBJECTID"], [([1], [first, second])], q)
+    geometry = from_wkb(decode_feature_page(body).geometries[0])
+    assert geometry.geom_type == "MultiPolygon"
+    assert len(geometry.geoms) == 2
+
+
+def test_null_and_missing_attributes_and_geometry() -> None:
+    q = _Quantizer(1.0, (0.0, 0.0), _LOWER_LEFT)
+    body = _collection(
+        _POINT,
+        ["OBJECTID", "name", "area"],
+        [([1, None, 2.5], [[(1, 1)]]), ([2], None)],
+        q,
+    )
+    page = decode_feature_page(body)
+    assert page.columns == {
+        "OBJECTID": [1, 2],
+        "name": [None, None],
+        "area": [2.5, None],
+    }
+    assert page.geometries[1] is None
+
+    schema = pa.schema(
+        [
+            ("OBJECTID", pa.int64()),
+            ("name", pa.string()),
+            ("area", pa.float64()),
+            ("extra", pa.string()),
+            ("geometry", pa.binary()),
+        ]
+    )
+    table = page.to_table(schema)
+    assert table.schema == schema
+    assert table.column("name").null_count == 2
+    assert table.column("extra").null_count == 2
+    assert table.column("geometry").null_count == 1
+
+
+def test_exceeded_transfer_limit() -> None:
+    q = _Quantizer(1.0, (0.0, 0.0), _LOWER_LEFT)
+    body = _collection(_POINT, ["OBJECTID"], [([1], [[(0, 0)]])], q, exceeded=True)
+    assert decode_feature_page(body).exceeded_transfer_limit
+
+
+def test_attribute_not_castable_to_schema() -> None:
+    q = _Quantizer(1.0, (0.0, 0.0), _LOWER_LEFT)
+    body = _collection(_POINT, ["OBJECTID"], [(["x"], [[(0, 0)]])], q)
+    schema = pa.schema([("OBJECTID", pa.int64()), ("geometry", pa.binary())])
+    with pytest.raises((pa.ArrowInvalid, pa.ArrowTypeError)):
+        decode_feature_page(body).to_table(schema)
+
+
+@pytest.mark.parametrize("cut", [1, 7, -3])
+def test_truncated_body_raises_decode_error(cut: int) -> None:
+    q = _Quantizer(0.5, (0.0, 0.0), _LOWER_LEFT)
+    ring = [(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)]
+    body = _collection(_POLYGON, ["OBJECTID", "name"], [([1, "a"], [ring])], q)
+    with pytest.raises(PbfDecodeError):
+        decode_feature_page(body[:cut])
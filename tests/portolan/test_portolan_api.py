@@ -0,0 +1,58 @@
+"""Tests for running portolan commands in-process in portolan.portolan_api."""
+
+from pathlib import Path
+
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import portolan_api
+from hdx.scraper.cod_ab_global.portolan.portolan_api import portolan
+
+
+@pytest.fixture
+def calls(monkeypatch: pytest.MonkeyPatch) -> list[tuple]:
+    """Record (args, working dir) of every in-process and subprocess command."""
+    recorded = []
+
+    def main(*, args: list[str], **_: object) -> int:
+        recorded.append(("in-process", args, str(Path.cwd())))
+        return 0
+
+    def run(args: list[str], *, cwd: Path, **_: object) -> object:
+        recorded.append(("subprocess", args[1:], str(cwd)))
+        return type("Completed", (), {"returncode": 0})()
+
+    monkeypatch.setattr(portolan_api, "PORTOLAN_IN_PROCESS", True)
+    monkeypatch.setattr(portolan_api._cli, "main", main)  # noqa: SLF001
+    monkeypatch.setattr(portolan_api, "_run", run)
+    return recorded
+
+
+def test_in_process_commands_get_the_catalog_root_not_a_chdir(
+    tmp_path: Path, calls: list[tuple]
+) -> None:
+    launch = str(Path.cwd())
+    layer = tmp_path / "afg" / "v01"
+    portolan(["init", "--auto"], cwd=tmp_path)
+    portolan(["add", f"{layer}/", "--pmtiles"], cwd=tmp_path)
+    portolan(["rm", "--force", f"{layer}/"], cwd=tmp_path)
+    portolan(["stac-geoparquet"], cwd=tmp_path)
+    portolan(["check", "--metadata", "--fix"], cwd=tmp_path)
+    root = str(tmp_path)
+    assert calls == [
+        ("in-process", ["init", "--auto", root], launch),
+        (
+            "in-process",
+            ["add", f"{layer}/", "--pmtiles", "--portolan-dir", root],
+            launch,
+        ),
+        ("in-process", ["rm", "--force", f"{layer}/", "--portolan-dir", root], launch),
+        ("in-process", ["stac-geoparquet", "--catalog", root], launch),
+        ("in-process", ["check", "--metadata", "--fix", root], launch),
+    ]
+
+
+def test_commands_without_a_root_argument_run_as_subprocess(
+    tmp_path: Path, calls: list[tuple]
+) -> None:
+    portolan(["readme"], cwd=tmp_path)
+    assert calls == [("subprocess", ["readme"], str(tmp_path))]
@@ -0,0 +1,138 @@
+"""Tests for the outStatistics fingerprint in portolan.probe."""
+
+import json
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import probe
+from hdx.scraper.cod_ab_global.portolan.probe import LayerProbe, fingerprint_layers
+
+_LAYER_URL = "https://services.example.org/arcgis/rest/services/x/FeatureServer/0"
+_META = {
+    "objectIdField": "OBJECTID",
+    "geometryProperties": {
+        "shapeAreaFieldName": "Shape__Area",
+        "shapeLengthFieldName": "Shape__Length",
+    },
+    "editFieldsInfo": {"editDateField": "EditDate"},
+    "fields": [
+        {"name": "OBJECTID", "type": "esriFieldTypeOID"},
+        {"name": "adm1_name", "type": "esriFieldTypeString"},
+        {"name": "adm1_pcode", "type": "esriFieldTypeString"},
+        {"name": "area_sqkm", "type": "esriFieldTypeDouble"},
+        {"name": "EditDate", "type": "esriFieldTypeDate"},
+        {"name": "Shape__Area", "type": "esriFieldTypeDouble"},
+        {"name": "Shape__Length", "type": "esriFieldTypeDouble"},
+    ],
+}
+
+
+def _stats(**overrides: float) -> dict[tuple[str, str], float]:
+    """Return the layer's statistics, keyed by (statisticType, field)."""
+    stats = {"area": 7.5, "length": 45.0, "edited": 1_700_000_000_000} | overrides
+    return {
+        ("count", "OBJECTID"): 5,
+        ("max", "OBJECTID"): 5,
+        ("sum", "OBJECTID"): 15,
+        ("sum", "Shape__Area"): stats["area"],
+        ("sum", "Shape__Length"): stats["length"],
+        ("max", "EditDate"): stats["edited"],
+    }
+
+
+def _fingerprint(
+    stats: dict, monkeypatch: pytest.MonkeyPatch, meta: dict = _META
+) -> probe.LayerFingerprint:
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        form = {k: v[0] for k, v in parse_qs(request.content.decode()).items()}
+        requests.append(form)
+        assert form["returnGeometry"] == "false"
+        assert "token" not in form
+        # ArcGIS may echo the statistic aliases in upper case
+        row = {
+            s["outStatisticFieldName"].upper(): stats[
+                s["statisticType"], s["onStatisticField"]
+            ]
+            for s in json.loads(form["outStatistics"])
+        }
+        return httpx.Response(200, json={"features": [{"attributes": row}]})
+
+    monkeypatch.setattr(
+        probe,
+        "new_async_client",
+        lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+    )
+    layer = LayerProbe(
+        0,
+        1,
+        probe._checksum_query(meta),  # noqa: SLF001
+        tuple((f["name"], f["type"]) for f in meta["fields"]),
+    )
+    result = fingerprint_layers({_LAYER_URL: layer})[_LAYER_URL]
+    assert len(requests) == 1
+    return result
+
+
+def test_checksum_query_statistics() -> None:
+    query = probe._checksum_query(_META)  # noqa: SLF001
+    assert query.oid_field == "OBJECTID"
+    assert query.measure_fields == ("Shape__Area", "Shape__Length")
+    assert query.edit_field == "EditDate"
+    assert query.statistics() == [
+        ("count", "OBJECTID"),
+        ("max", "OBJECTID"),
+        ("sum", "OBJECTID"),
+        ("sum", "Shape__Area"),
+        ("sum", "Shape__Length"),
+        ("max", "EditDate"),
+    ]
+
+
+def test_feature_edit_changes_only_attributes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    base = _fingerprint(_stats(), monkeypatch)
+    assert base.matches(json.loads(json.dumps(base.as_dict())))
+    assert _fingerprint(_stats(), monkeypatch) == base
+
+    edited = _fingerprint(_stats(edited=1_700_000_360_000), monkeypatch)
+    assert edited.geometry == base.geometry
+    assert edited.attributes != base.attributes
+
+
+def test_shape_edit_and_float_noise(monkeypatch: pytest.MonkeyPatch) -> None:
+    base = _fingerprint(_stats(), monkeypatch)
+    assert _fingerprint(_stats(area=7.5 + 1e-14), monkeypatch) == base
+
+    reshaped = _fingerprint(_stats(area=7.75), monkeypatch)
+    assert reshaped.geometry != base.geometry
+    assert reshaped.attributes == base.attributes
+
+
+def test_schema_change_changes_attributes(monkeypatch: pytest.MonkeyPatch) -> None:
+    base = _fingerprint(_stats(), monkeypatch)
+    meta = _META | {
+        "fields": [
+            *_META["fields"],
+            {"name": "adm0_name", "type": "esriFieldTypeString"},
+        ]
+    }
+    changed = _fingerprint(_stats(), monkeypatch, meta)
+    assert changed.geometry == base.geometry
+    assert changed.attributes != base.attributes
+
+
+def test_layer_without_shape_or_edit_fields_never_matches(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    no_shape = _fingerprint(_stats(), monkeypatch, _META | {"geometryProperties": {}})
+    assert no_shape.geometry is None
+    assert not no_shape.matches(no_shape.as_dict())
+
+    no_edit = _fingerprint(_stats(), monkeypatch, _META | {"editFieldsInfo": {}})
+    assert no_edit.attributes is None
+    assert not no_edit.matches(no_edit.as_dict())
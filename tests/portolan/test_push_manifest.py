@@ -0,0 +1,146 @@
+"""Tests for choosing and seeding what portolan.push_manifest uploads."""
+
+import hashlib
+import json
+from pathlib import Path
+
+import obstore as obs
+import pytest
+from obstore.store import MemoryStore
+
+from hdx.scraper.cod_ab_global.portolan import push_manifest
+from hdx.scraper.cod_ab_global.portolan.push_manifest import push
+
+_REMOTE = "s3://bucket/cod-ab"
+_PUBLISHED = {
+    "catalog.json",
+    "README.md",
+    "versions.json",
+    "afg/catalog.json",
+    "afg/v01/catalog.json",
+    "afg/v01/adm1/collection.json",
+    "afg/v01/adm1/versions.json",
+    "afg/v01/adm1/original.parquet",
+    "afg/v01/adm1/original.pmtiles",
+    "afg/v01/adm1/extended.parquet",
+    "afg/v01/adm1/items.parquet",
+}
+
+
+def _write(path: Path, content: str | bytes | dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if isinstance(content, dict):
+        content = json.dumps(content)
+    if isinstance(content, str):
+        content = content.encode()
+    path.write_bytes(content)
+
+
+@pytest.fixture
+def work_dir(tmp_path: Path) -> Path:
+    work_dir = tmp_path / "catalog"
+    for rel in ("catalog.json", "afg/catalog.json", "afg/v01/catalog.json"):
+        _write(work_dir / rel, {"type": "Catalog"})
+    _write(work_dir / "README.md", "# COD-AB")
+    _write(work_dir / "versions.json", {"collections": {}})
+    layer = work_dir / "afg" / "v01" / "adm1"
+    _write(
+        layer / "versions.json",
+        {
+            "versions": [
+                {
+                    "assets": {
+                        "original.parquet": {"href": "afg/v01/adm1/original.parquet"},
+                        "original.pmtiles": {"href": "afg/v01/adm1/original.pmtiles"},
+                    }
+                }
+            ]
+        },
+    )
+    _write(
+        layer / "collection.json",
+        {
+            "type": "Collection",
+            "assets": {"extended": {"href": "./extended.parquet"}},
+            "links": [
+                {"rel": "root", "href": "../../../catalog.json"},
+                {"rel": "items", "href": "./items.parquet"},
+                {"rel": "license", "href": "https://example.org/license"},
+            ],
+        },
+    )
+    for name in ("original.parquet", "original.pmtiles", "extended.parquet"):
+        _write(layer / name, name * 100)
+    _write(layer / "items.parquet", "items")
+    # Not referenced by any STAC document
+    _write(layer / ".original.parquet.fast", "")
+    _write(layer / "scratch.parquet", "scratch")
+    _write(work_dir / "tmp" / "afg" / "v01" / "adm1" / "original.parquet", "junk")
+    _write(work_dir / "notes.txt", "junk")
+    return work_dir
+
+
+def _keys(store: MemoryStore) -> set[str]:
+    return {
+        meta["path"].removeprefix("cod-ab/")
+        for batch in obs.list(store)
+        for meta in batch
+    }
+
+
+def test_walk_finds_only_what_the_stac_documents_publish(work_dir: Path) -> None:
+    files, collections = push_manifest._walk(work_dir)  # noqa: SLF001
+    assert set(files) == _PUBLISHED
+    assert collections == {"afg/v01/adm1"}
+
+
+def test_push_uploads_published_files_once(
+    work_dir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    store = MemoryStore()
+    monkeypatch.setattr(push_manifest, "_store", lambda _remote: (store, "cod-ab"))
+    monkeypatch.setattr(push_manifest, "_remote_objects", lambda *_: {})
+    push(work_dir, _REMOTE)
+    assert _keys(store) == _PUBLISHED
+
+    store.delete([f"cod-ab/{rel}" for rel in _PUBLISHED])
+    push(work_dir, _REMOTE)
+    assert _keys(store) == set()
+
+
+def test_missing_manifest_is_seeded_from_matching_etags(
+    work_dir: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    layer = work_dir / "afg" / "v01" / "adm1"
+    original = (layer / "original.parquet").read_bytes()
+    extended = (layer / "extended.parquet").read_bytes()
+    remote = {
+        "afg/v01/adm1/original.parquet": (
+            len(original),
+            hashlib.md5(original, usedforsecurity=False).hexdigest(),
+        ),
+        # Same size, other bytes
+        "afg/v01/adm1/extended.parquet": (
+            len(extended),
+            hashlib.md5(b"x" * len(extended), usedforsecurity=False).hexdigest(),
+        ),
+    }
+    store = MemoryStore()
+    monkeypatch.setattr(push_manifest, "_store", lambda _remote: (store, "cod-ab"))
+    monkeypatch.setattr(push_manifest, "_remote_objects", lambda *_: remote)
+    push(work_dir, _REMOTE)
+    assert _keys(store) == _PUBLISHED - {"afg/v01/adm1/original.parquet"}
+
+
+def test_multipart_etag(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(push_manifest, "_PART_SIZE", 4)
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"abcdefghij")
+    parts = b"".join(
+        hashlib.md5(p, usedforsecurity=False).digest()
+        for p in (b"abcd", b"efgh", b"ij")
+    )
+    expected = f"{hashlib.md5(parts, usedforsecurity=False).hexdigest()}-3"
+    assert push_manifest._s3_etag(path, 10) == expected  # noqa: SLF001
+    whole = hashlib.md5(b"abcdefghij", usedforsecurity=False).hexdigest()
+    assert push_manifest._s3_etag(path, 4) == whole  # noqa: SLF001
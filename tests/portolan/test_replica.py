@@ -0,0 +1,55 @@
+"""Tests for downloading replica archives in portolan.replica."""
+
+from collections.abc import Iterator
+from pathlib import Path
+
+import httpx
+import pytest
+
+from hdx.scraper.cod_ab_global.portolan import auth, replica
+from hdx.scraper.cod_ab_global.portolan.auth import TokenAuth
+from hdx.scraper.cod_ab_global.portolan.config import ARCGIS_SERVER
+
+_CHUNK = 1 << 20
+
+
+class _WatchedStream(httpx.SyncByteStream):
+    """Body that records how much of dest is on disk before each chunk goes out."""
+
+    def __init__(self, dest: Path, chunks: int) -> None:
+        self._dest = dest
+        self._chunks = chunks
+        self.written_before: list[int] = []
+
+    def __iter__(self) -> Iterator[bytes]:
+        for i in range(self._chunks):
+            self.written_before.append(
+                self._dest.stat().st_size if self._dest.exists() else 0
+            )
+            yield bytes([i]) * _CHUNK
+
+
+def test_download_streams_archive_to_disk(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    dest = tmp_path / "replica.zip"
+    body = _WatchedStream(dest, 3)
+    tokens = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        tokens.append(request.url.params.get("token"))
+        # No length and a JSON type: what the auth hook would read for errors
+        return httpx.Response(
+            200, headers={"content-type": "application/json"}, stream=body
+        )
+
+    client = httpx.Client(transport=httpx.MockTransport(handler), auth=TokenAuth())
+    monkeypatch.setattr(replica, "get_client", lambda _timeout: client)
+    monkeypatch.setattr(replica, "get_token", lambda: "fresh")
+    monkeypatch.setattr(auth._manager, "get", lambda: "hooked")  # noqa: SLF001
+
+    replica._download(f"{ARCGIS_SERVER}/server/rest/directories/x.zip", dest)  # noqa: SLF001
+
+    assert body.written_before == [0, _CHUNK, 2 * _CHUNK]
+    assert dest.stat().st_size == 3 * _CHUNK
+    assert tokens == ["fresh"]